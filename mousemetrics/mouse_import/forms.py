@@ -2,7 +2,7 @@ from typing import Iterable
 
 from django import forms
 
-from .models import MouseImport
+from .models import MouseImport, MouseImportBatch
 from .services.validators import normalise_cell_range
 from .targets import get_mouse_import_targets
 
@@ -14,6 +14,42 @@ class MouseImportForm(forms.ModelForm):
         fields = ["project", "file"]
 
 
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """A file field that accepts several files, cleaned to a list."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("widget", MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(d, initial) for d in data]
+        return [single_file_clean(data, initial)]
+
+
+class MouseImportBatchForm(forms.ModelForm):
+    """Upload several files to import with one range and mapping."""
+
+    uploads = MultipleFileField()
+
+    class Meta:
+        model = MouseImportBatch
+        fields = ["project"]
+
+    def clean_uploads(self):
+        files = self.cleaned_data["uploads"]
+        if len(files) < 2:
+            raise forms.ValidationError(
+                "Choose at least two files, or use the single-file upload."
+            )
+        return files
+
+
 class MouseImportSheetRangeForm(forms.ModelForm):
     """Second-step form to capture sheet + cell_range."""
 
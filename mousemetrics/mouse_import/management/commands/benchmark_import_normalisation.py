@@ -0,0 +1,123 @@
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from mouse_import.services.io import FORWARD_FILL_SKIP_COLUMNS, _process_dataframe
+
+MAPPING = {
+    "box": "Box",
+    "tube_number": "Tube ID",
+    "date_of_birth": "DOB",
+    "notes": "Notes",
+    "death_date": "Cull Date",
+}
+
+
+def make_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """A raw spreadsheet range as openpyxl or the CSV reader would hand it over."""
+    rng = np.random.default_rng(seed)
+    born = datetime(2020, 1, 1)
+
+    def pick(values: list, weights: list[float]) -> list:
+        chosen = rng.choice(len(values), size=rows, p=weights)
+        return [values[i] for i in chosen]
+
+    tubes = [int(t) for t in rng.integers(1, 10_000, size=rows)]
+    frame = {
+        "Box": pick(
+            ["1-1", " 1-2 ", "", "  ", None, 7], [0.4, 0.2, 0.2, 0.1, 0.05, 0.05]
+        ),
+        "Tube ID": [t if i % 5 else f" {t} " for i, t in enumerate(tubes)],
+        "DOB": [
+            born + timedelta(days=int(d)) if d % 7 else None
+            for d in rng.integers(0, 2000, size=rows)
+        ],
+        "Notes": pick(
+            ["", "ok", " spaced out ", 2.5, True, date(2021, 5, 6), None],
+            [0.4, 0.2, 0.1, 0.1, 0.05, 0.05, 0.1],
+        ),
+        "Cull Date": pick(["", "01/02/2024", None], [0.8, 0.1, 0.1]),
+        "Weight": [float(w) if w % 3 else None for w in rng.integers(10, 40, rows)],
+    }
+    return pd.DataFrame(frame, dtype=object)
+
+
+def legacy_process_dataframe(
+    df: pd.DataFrame, limit: int | None, mapping: dict[str, str] | None
+) -> pd.DataFrame:
+    """The cell-by-cell normalisation `_process_dataframe` replaced."""
+    idxs = iter(range(len(df.columns)))
+    df.columns = [col or f"unnamed-{next(idxs) + 1}" for col in df.columns]
+    if df.empty:
+        return df
+
+    if limit:
+        df = df.head(limit)
+
+    with pd.option_context("future.no_silent_downcasting", True):
+        df = df.replace(r"^\s*$", pd.NA, regex=True).infer_objects()
+
+    ffill_skip_columns = {(mapping or {}).get(c) for c in FORWARD_FILL_SKIP_COLUMNS}
+    for col in df.columns:
+        if mapping and col not in ffill_skip_columns:
+            with pd.option_context("future.no_silent_downcasting", True):
+                df[col] = df[col].ffill().infer_objects()
+
+        if df[col].dtype == object:
+            df[col] = df[col].apply(lambda v: v.strip() if isinstance(v, str) else v)
+
+    df = df.astype("object").mask(pd.isna(df), None)
+
+    def _to_string(v):
+        if v is None:
+            return None
+        if isinstance(v, pd.Timestamp):
+            return v.date().isoformat()
+        if isinstance(v, datetime):
+            return v.date().isoformat()
+        if isinstance(v, date):
+            return v.isoformat()
+        return str(v).strip()
+
+    for col in df.columns:
+        df[col] = df[col].apply(_to_string)
+
+    return df
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the cell-by-cell and the vectorised normalisation of imported "
+        "ranges on a generated spreadsheet, and check they agree."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        frame = make_frame(options["rows"])
+        timings = {}
+        outputs = {}
+        for name, process in (
+            ("cell by cell", legacy_process_dataframe),
+            ("vectorised", _process_dataframe),
+        ):
+            best = float("inf")
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                outputs[name] = process(frame.copy(), None, MAPPING)
+                best = min(best, time.perf_counter() - start)
+            timings[name] = best
+            self.stdout.write(f"{name:>12}: {best:.3f}s for {len(frame)} rows")
+
+        if not outputs["cell by cell"].equals(outputs["vectorised"]):
+            self.stderr.write("Outputs differ.")
+            return
+        speedup = timings["cell by cell"] / timings["vectorised"]
+        self.stdout.write(
+            self.style.SUCCESS(f"Identical output, {speedup:.1f}x faster")
+        )
@@ -0,0 +1,149 @@
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+from mouseapp.models import Project
+from mouse_import.models import MouseImport, MouseImportMappingExample
+from mouse_import.services.mapping_ai import (
+    _build_column_text,
+    _load_model_bundle,
+    record_mapping_examples,
+)
+from mouse_import.services.mapping_train import maybe_train_mapping_model
+
+# Header spellings the labs' templates use for each field.
+HEADERS = {
+    "tube_number": ["Tube ID", "Tube #", "Tag", "ID"],
+    "date_of_birth": ["DOB", "Date of birth", "Born"],
+    "sex": ["Sex", "Gender", "M/F"],
+    "box": ["Box", "Cage", "Location"],
+    "notes": ["Notes", "Comments", "Remarks"],
+    "earmark": ["Earmark", "Ear tag", "Ear"],
+}
+
+
+def make_column(field: str, header: str, rng: np.random.Generator) -> pd.Series:
+    n = 20
+    if field == "tube_number":
+        values = [str(v) for v in rng.integers(1, 5000, n)]
+    elif field == "date_of_birth":
+        days = rng.integers(0, 2000, n)
+        values = [str(pd.Timestamp("2020-01-01") + pd.Timedelta(days=d)) for d in days]
+    elif field == "sex":
+        values = list(rng.choice(["M", "F"], n))
+    elif field == "box":
+        values = [f"{r}-{c}" for r, c in rng.integers(1, 9, (n, 2))]
+    elif field == "notes":
+        values = list(rng.choice(["", "ok", "sick", "cull", "breeder"], n))
+    else:
+        values = list(rng.choice(["L", "R", "LR", "0"], n))
+    return pd.Series(values, name=header, dtype=object)
+
+
+def make_templates(count: int, rng: np.random.Generator) -> list[pd.DataFrame]:
+    """Sheets labs import again and again, each with its own headers."""
+    templates = []
+    for _ in range(count):
+        columns = {}
+        for field, headers in HEADERS.items():
+            header = headers[rng.integers(len(headers))]
+            columns[header] = make_column(field, header, rng)
+        templates.append(pd.DataFrame(columns))
+    return templates
+
+
+def legacy_fit(texts: list[str], labels: list[str]):
+    """The full TF-IDF + logistic regression refit incremental training replaced."""
+    vectorizer = TfidfVectorizer(
+        analyzer="char_wb", ngram_range=(3, 5), min_df=1, max_features=40000
+    )
+    clf = LogisticRegression(max_iter=2000, solver="lbfgs", class_weight="balanced")
+    clf.fit(vectorizer.fit_transform(texts), labels)
+    return vectorizer, clf
+
+
+class Command(BaseCommand):
+    help = (
+        "Time mapping model training as imports of the same templates "
+        "accumulate, against refitting on every example. Nothing is saved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--imports", type=int, default=300)
+        parser.add_argument("--every", type=int, default=50)
+        parser.add_argument("--templates", type=int, default=8)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options["imports"], options["every"], options["templates"])
+            transaction.set_rollback(True)
+
+    def run(self, imports: int, every: int, n_templates: int) -> None:
+        rng = np.random.default_rng(0)
+        templates = make_templates(n_templates, rng)
+        held_out = [
+            (field, _build_column_text(header, make_column(field, header, rng)))
+            for _ in range(20)
+            for field, headers in HEADERS.items()
+            for header in headers
+        ]
+        project = Project.objects.create(
+            name="Training benchmark", start_date="2000-01-01"
+        )
+
+        self.stdout.write(
+            f"{'imports':>8} {'examples':>9} {'refit s':>8} {'refit acc':>9}"
+            f" {'trained s':>9} {'fitted':>7} {'acc':>6}"
+        )
+        for n in range(1, imports + 1):
+            template = templates[rng.integers(len(templates))]
+            # Most imports repeat a template as it is; some with new values.
+            if rng.random() < 0.2:
+                template = template.apply(
+                    lambda column: column.sample(frac=1, random_state=int(n))
+                )
+            import_obj = MouseImport.objects.create(
+                project=project,
+                file=f"mouse_imports/benchmark-{n}.csv",
+                original_filename=f"benchmark-{n}.csv",
+                cell_range="A1:F21",
+            )
+            mapping = {
+                field: next(h for h in headers if h in template.columns)
+                for field, headers in HEADERS.items()
+            }
+            record_mapping_examples(import_obj, template, user=None, mapping=mapping)
+            if n % every:
+                continue
+
+            rows = list(
+                MouseImportMappingExample.objects.values_list(
+                    "column_text", "target_field"
+                )
+            )
+            start = time.perf_counter()
+            vectorizer, clf = legacy_fit(*map(list, zip(*rows)))
+            refit_time = time.perf_counter() - start
+            refit_accuracy = self.accuracy(vectorizer, clf, held_out)
+
+            start = time.perf_counter()
+            outcome = maybe_train_mapping_model(min_new_examples=1)
+            train_time = time.perf_counter() - start
+            bundle = _load_model_bundle()
+            accuracy = self.accuracy(bundle["vectorizer"], bundle["clf"], held_out)
+
+            self.stdout.write(
+                f"{n:>8} {len(rows):>9} {refit_time:>8.3f} {refit_accuracy:>9.1%}"
+                f" {train_time:>9.3f} {outcome.n_fitted:>7} {accuracy:>6.1%}"
+            )
+
+    @staticmethod
+    def accuracy(vectorizer, clf, held_out: list[tuple[str, str]]) -> float:
+        labels, texts = zip(*held_out)
+        predicted = clf.predict(vectorizer.transform(texts))
+        return float(np.mean(predicted == np.array(labels)))
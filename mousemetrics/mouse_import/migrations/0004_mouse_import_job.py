@@ -0,0 +1,64 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "mouse_import",
+            "0002_rename_mi_mapex_hdrfld_idx_mouse_impor_source__e1110b_idx_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MouseImportJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Q", "Queued"),
+                            ("R", "Running"),
+                            ("D", "Done"),
+                            ("F", "Failed"),
+                        ],
+                        db_index=True,
+                        default="Q",
+                        max_length=1,
+                    ),
+                ),
+                ("fixed_fields", models.JSONField(default=dict)),
+                ("mapping", models.JSONField(default=dict)),
+                ("rows_processed", models.IntegerField(default=0)),
+                ("created_count", models.IntegerField(default=0)),
+                ("updated_count", models.IntegerField(default=0)),
+                ("errors", models.JSONField(default=list)),
+                ("pending_links", models.JSONField(default=list)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("heartbeat", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("failure", models.TextField(blank=True)),
+                (
+                    "mouse_import",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="job",
+                        to="mouse_import.mouseimport",
+                    ),
+                ),
+            ],
+        ),
+    ]
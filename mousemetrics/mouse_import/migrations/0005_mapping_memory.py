@@ -0,0 +1,88 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_mapping_memory(apps, schema_editor):
+    MouseImportMappingExample = apps.get_model(
+        "mouse_import", "MouseImportMappingExample"
+    )
+    MouseImportMappingMemory = apps.get_model(
+        "mouse_import", "MouseImportMappingMemory"
+    )
+    examples = MouseImportMappingExample.objects.order_by().exclude(
+        source_header_norm=""
+    )
+    rows = [
+        MouseImportMappingMemory(**counts)
+        for counts in examples.values(
+            "project_id", "source_header_norm", "target_field"
+        ).annotate(count=Count("id"))
+    ]
+    rows += [
+        MouseImportMappingMemory(project_id=None, **counts)
+        for counts in examples.values("source_header_norm", "target_field").annotate(
+            count=Count("id")
+        )
+    ]
+    MouseImportMappingMemory.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mouse_import", "0004_mouse_import_job"),
+        ("mouseapp", "0029_pedigree_layout_snapshot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MouseImportMappingMemory",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source_header_norm", models.CharField(max_length=256)),
+                ("target_field", models.CharField(max_length=128)),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "project",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="mouse_import_mapping_memory",
+                        to="mouseapp.project",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["source_header_norm", "project"],
+                        name="mouse_impor_source__7a38f4_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("project", "source_header_norm", "target_field"),
+                        name="unique_mapping_memory",
+                    ),
+                    models.UniqueConstraint(
+                        condition=models.Q(("project__isnull", True)),
+                        fields=("source_header_norm", "target_field"),
+                        name="unique_global_mapping_memory",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(fill_mapping_memory, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:31
+
+import hashlib
+from itertools import batched
+
+from django.db import migrations, models
+
+
+def fill_column_text_hashes(apps, schema_editor):
+    MouseImportMappingExample = apps.get_model(
+        "mouse_import", "MouseImportMappingExample"
+    )
+    examples = MouseImportMappingExample.objects.order_by("id").only("column_text")
+    for batch in batched(examples.iterator(500), 500):
+        for example in batch:
+            example.column_text_hash = hashlib.sha256(
+                example.column_text.encode()
+            ).hexdigest()
+        MouseImportMappingExample.objects.bulk_update(batch, ["column_text_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mouse_import", "0005_mapping_memory"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mouseimportmappingexample",
+            name="column_text_hash",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name="mouseimportmappingexample",
+            index=models.Index(
+                fields=["column_text_hash", "target_field"],
+                name="mouse_impor_column__b0b38c_idx",
+            ),
+        ),
+        migrations.RunPython(fill_column_text_hashes, migrations.RunPython.noop),
+    ]
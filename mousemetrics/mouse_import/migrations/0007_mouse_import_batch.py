@@ -0,0 +1,85 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mouse_import", "0006_mapping_example_hash"),
+        ("mouseapp", "0029_pedigree_layout_snapshot"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mouseimport",
+            name="batch_position",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="mouseimportjob",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("Q", "Queued"),
+                    ("R", "Running"),
+                    ("W", "Waiting for the other files"),
+                    ("D", "Done"),
+                    ("F", "Failed"),
+                ],
+                db_index=True,
+                default="Q",
+                max_length=1,
+            ),
+        ),
+        migrations.CreateModel(
+            name="MouseImportBatch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("uploaded_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                (
+                    "project",
+                    models.ForeignKey(
+                        help_text="Project that owns the imported mice.",
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="mouse_import_batches",
+                        to="mouseapp.project",
+                    ),
+                ),
+                (
+                    "uploaded_by",
+                    models.ForeignKey(
+                        help_text="User who uploaded the files.",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-uploaded_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="mouseimport",
+            name="batch",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="imports",
+                to="mouse_import.mouseimportbatch",
+            ),
+        ),
+    ]
@@ -2,6 +2,31 @@ from django.db import models
 from django.contrib.auth import get_user_model
 
 
+class MouseImportBatch(models.Model):
+    """
+    Several uploads imported together: the range and mapping chosen for the
+    first file apply to all of them, and they are committed in file order.
+    """
+
+    id: int
+    uploaded_by = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.SET_NULL,
+        null=True,
+        help_text="User who uploaded the files.",
+    )
+    uploaded_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    project = models.ForeignKey(
+        "mouseapp.Project",
+        on_delete=models.PROTECT,
+        related_name="mouse_import_batches",
+        help_text="Project that owns the imported mice.",
+    )
+
+    class Meta:
+        ordering = ["-uploaded_at"]
+
+
 class MouseImport(models.Model):
     id: int
     uploaded_by = models.ForeignKey(
@@ -35,6 +60,16 @@ class MouseImport(models.Model):
         help_text='Excel range such as "A1:M40".',
     )
 
+    batch = models.ForeignKey(
+        MouseImportBatch,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="imports",
+    )
+    # Order of the file within its batch: by filename, as committed.
+    batch_position = models.PositiveIntegerField(default=0)
+
     row_count = models.IntegerField(default=0)
     committed = models.BooleanField(default=False, db_index=True)
     error_log = models.TextField(
@@ -73,15 +108,51 @@ class MouseImportMappingExample(models.Model):
 
     # Header + samples + top values
     column_text = models.TextField()
+    # SHA-256 of column_text; training skips repeats of an earlier example.
+    column_text_hash = models.CharField(max_length=64, blank=True)
 
     class Meta:
         ordering = ["-created_at"]
         indexes = [
             models.Index(fields=["source_header_norm", "target_field"]),
             models.Index(fields=["project", "target_field"]),
+            models.Index(fields=["column_text_hash", "target_field"]),
         ]
 
 
+class MouseImportMappingMemory(models.Model):
+    """
+    How many saved mappings took a normalised header to each field: one row
+    per project, and one over every project with `project` unset. Kept in
+    step with the examples by `record_mapping_examples`.
+    """
+
+    project = models.ForeignKey(
+        "mouseapp.Project",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="mouse_import_mapping_memory",
+    )
+    source_header_norm = models.CharField(max_length=256)
+    target_field = models.CharField(max_length=128)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["project", "source_header_norm", "target_field"],
+                name="unique_mapping_memory",
+            ),
+            models.UniqueConstraint(
+                fields=["source_header_norm", "target_field"],
+                condition=models.Q(project__isnull=True),
+                name="unique_global_mapping_memory",
+            ),
+        ]
+        indexes = [models.Index(fields=["source_header_norm", "project"])]
+
+
 class MouseImportMappingModelState(models.Model):
     """
     Singleton state row (id=1) used to:
@@ -103,3 +174,43 @@ class MouseImportMappingModelState(models.Model):
 
     class Meta:
         verbose_name = "Mouse Import Mapping Model State"
+
+
+class MouseImportJob(models.Model):
+    """
+    A commit of a `MouseImport` run in the background. Progress is saved with
+    every chunk of rows written, so an interrupted job resumes where it stopped.
+    """
+
+    STATUS_CHOICES = {
+        "Q": "Queued",
+        "R": "Running",
+        # Written; parents are linked once every file of the batch is.
+        "W": "Waiting for the other files",
+        "D": "Done",
+        "F": "Failed",
+    }
+
+    mouse_import = models.OneToOneField(
+        MouseImport, on_delete=models.CASCADE, related_name="job"
+    )
+    status = models.CharField(
+        max_length=1, choices=STATUS_CHOICES, default="Q", db_index=True
+    )
+    fixed_fields = models.JSONField(default=dict)
+    mapping = models.JSONField(default=dict)
+
+    rows_processed = models.IntegerField(default=0)
+    created_count = models.IntegerField(default=0)
+    updated_count = models.IntegerField(default=0)
+    # Messages of the rows that failed, in row order, then parent-linking messages.
+    errors = models.JSONField(default=list)
+    # Parent references of written mice, linked once every row is in.
+    pending_links = models.JSONField(default=list)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when queued and bumped with every chunk; a queued or running job
+    # that goes without it for long was interrupted.
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    failure = models.TextField(blank=True)
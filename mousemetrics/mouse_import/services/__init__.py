@@ -1,6 +1,6 @@
 """Service layer API for the mouse_import app."""
 
 from .importer import ImportOptions, Importer
-from .io import read_range
+from .io import iter_range, read_range
 
-__all__ = ["ImportOptions", "Importer", "read_range"]
+__all__ = ["ImportOptions", "Importer", "iter_range", "read_range"]
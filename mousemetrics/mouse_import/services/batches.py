@@ -0,0 +1,130 @@
+"""
+Imports of several uploads at once.
+
+Each file of a `MouseImportBatch` is a `MouseImport`, numbered in filename
+order. The uploads are parsed side by side in worker processes; the wizard
+then runs on the first file, and the range and mapping chosen there apply to
+every file. `jobs.enqueue_batch_commit` commits them.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+
+from mouse_import.models import MouseImport, MouseImportBatch
+
+from .io import prepare_upload, read_range
+from .sheet_cache import delete_workbook_cache
+
+PARSE_PROCESSES = settings.IMPORT_PARSE_PROCESSES
+
+
+def create_batch(project, uploads: list[UploadedFile], *, user) -> MouseImportBatch:
+    """Save `uploads` as one batch, numbered in filename order."""
+    with transaction.atomic():
+        batch = MouseImportBatch.objects.create(project=project, uploaded_by=user)
+        ordered = sorted(
+            uploads, key=lambda upload: (upload.name.casefold(), upload.name)
+        )
+        for position, upload in enumerate(ordered):
+            MouseImport.objects.create(
+                uploaded_by=user,
+                project=project,
+                file=upload,
+                original_filename=upload.name,
+                batch=batch,
+                batch_position=position,
+                sheet_name="",
+                cell_range="",
+            )
+    return batch
+
+
+def batch_imports(batch_id: int) -> list[MouseImport]:
+    return list(
+        MouseImport.objects.filter(batch_id=batch_id).order_by("batch_position")
+    )
+
+
+def parse_batch(batch: MouseImportBatch) -> list[str]:
+    """
+    Parse every file of `batch` in a process pool, so the wizard's steps read
+    snapshots. Returns a message for each file that could not be read.
+    """
+    imports = batch_imports(batch.id)
+    # Workers import the app's models, so Django is set up in each; spawned
+    # rather than forked, as this process runs threads.
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(len(imports), PARSE_PROCESSES)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=django.setup,
+    ) as pool:
+        futures = [
+            pool.submit(
+                prepare_upload,
+                import_obj.file.path,
+                original_filename=import_obj.original_filename,
+            )
+            for import_obj in imports
+        ]
+
+    errors = []
+    for import_obj, future in zip(imports, futures):
+        if (exc := future.exception()) is not None:
+            errors.append(f"{import_obj.original_filename}: {exc}")
+    return errors
+
+
+def apply_range_to_batch(lead: MouseImport) -> list[str]:
+    """
+    Give every file of `lead`'s batch its sheet and range, and check they all
+    have the same columns. Returns a message for each file that differs.
+    """
+    MouseImport.objects.filter(batch_id=lead.batch_id).update(
+        sheet_name=lead.sheet_name, cell_range=lead.cell_range
+    )
+
+    errors = []
+    expected = None
+    for import_obj in batch_imports(lead.batch_id):
+        try:
+            columns = list(
+                read_range(
+                    import_obj.file.path,
+                    lead.sheet_name,
+                    lead.cell_range,
+                    original_filename=import_obj.original_filename,
+                    limit=1,
+                ).columns
+            )
+        except Exception as exc:
+            errors.append(f"{import_obj.original_filename}: {exc}")
+            continue
+        if expected is None:
+            expected = columns
+        elif set(columns) != set(expected):
+            # The mapping picks columns by name, so their order may differ.
+            differences = []
+            if missing := [c for c in expected if c not in columns]:
+                differences.append(f"missing {', '.join(missing)}")
+            if extra := [c for c in columns if c not in expected]:
+                differences.append(f"unexpected {', '.join(extra)}")
+            errors.append(
+                f"{import_obj.original_filename}: columns differ from the "
+                f"first file's ({'; '.join(differences)})"
+            )
+    return errors
+
+
+def delete_batch(batch: MouseImportBatch) -> None:
+    """Delete `batch` with its files."""
+    for import_obj in batch_imports(batch.id):
+        delete_workbook_cache(import_obj.file.path)
+        import_obj.file.delete(save=False)
+    batch.delete()
@@ -2,10 +2,15 @@ from __future__ import annotations
 
 import logging
 import re
+import warnings
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from dataclasses import dataclass, field as dataclass_field
 from typing import Any, Optional
 
+import numpy as np
 import pandas as pd
 
+from django.db.models import ForeignKey
 from django.utils.dateparse import parse_date
 
 logger = logging.getLogger(__name__)
@@ -13,6 +18,15 @@ logger = logging.getLogger(__name__)
 _LEADING_HASH = re.compile(r"^\s*#\s*")
 _SLASH_DATE = re.compile(r"^\s*\d{1,2}/\d{1,2}/\d{2,4}\s*$")
 
+_INTEGER_TYPES = {
+    "IntegerField",
+    "PositiveIntegerField",
+    "BigIntegerField",
+    "AutoField",
+}
+_TRUE_TEXT = {"1", "true", "t", "y", "yes", "✓", "x"}
+_FALSE_TEXT = {"0", "false", "f", "n", "no"}
+
 
 def to_int(value: Any) -> Optional[int]:
     """Cast values coming from Excel into integers when possible."""
@@ -57,9 +71,9 @@ def to_bool(value: Any) -> Optional[bool]:
     if isinstance(value, (int, float)):
         return value != 0
     text = str(value).strip().lower()
-    if text in {"1", "true", "t", "y", "yes", "✓", "x"}:
+    if text in _TRUE_TEXT:
         return True
-    if text in {"0", "false", "f", "n", "no"}:
+    if text in _FALSE_TEXT:
         return False
     return None
 
@@ -70,17 +84,26 @@ def to_text(value: Any) -> str:
     return "" if value is None else str(value).strip()
 
 
+def _choice_key(choices, text: str):
+    for key, _ in choices:
+        if str(key).lower() == text.lower():
+            return key
+    for key, label in choices:
+        if str(label).lower() == text.lower():
+            return key
+    if len(text) == 1:
+        for key, _ in choices:
+            if str(key).lower().startswith(text.lower()):
+                return key
+    return None
+
+
 def normalize_for_field(field, raw_value: Any):
     """Match Django model field expectations without altering semantics."""
 
     internal_type = field.get_internal_type()
 
-    if internal_type in {
-        "IntegerField",
-        "PositiveIntegerField",
-        "BigIntegerField",
-        "AutoField",
-    }:
+    if internal_type in _INTEGER_TYPES:
         return to_int(raw_value)
 
     if internal_type == "DateField":
@@ -94,17 +117,196 @@ def normalize_for_field(field, raw_value: Any):
     if choices:
         if raw_value is None:
             return None
-        text = str(raw_value).strip()
-        for key, _ in choices:
-            if str(key).lower() == text.lower():
-                return key
-        for key, label in choices:
-            if str(label).lower() == text.lower():
-                return key
-        if len(text) == 1:
-            for key, _ in choices:
-                if str(key).lower().startswith(text.lower()):
-                    return key
-        return None
+        return _choice_key(choices, str(raw_value).strip())
 
     return to_text(raw_value)
+
+
+@dataclass
+class CoercedColumn:
+    """
+    One field's values for every row of a frame, as `normalize_for_field` would
+    return them. `errors` holds the exception of each row that failed.
+    """
+
+    values: np.ndarray
+    errors: dict[int, Exception] = dataclass_field(default_factory=dict)
+
+    def value(self, position: int) -> Any:
+        if (exc := self.errors.get(position)) is not None:
+            raise exc
+        return self.values[position]
+
+
+class CoercedRow(Mapping[str, Any]):
+    """
+    One row of `coerce_frame`. Reading a field whose cell failed to coerce
+    raises that cell's exception.
+    """
+
+    def __init__(self, columns: Mapping[str, CoercedColumn], position: int):
+        self._columns = columns
+        self._position = position
+
+    def __getitem__(self, name: str) -> Any:
+        return self._columns[name].value(self._position)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._columns
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._columns)
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+
+def coerce_frame(
+    dataframe: pd.DataFrame,
+    fixed_fields: Mapping[str, Any],
+    mapping: Mapping[str, str],
+    fields: Iterable,
+) -> dict[str, CoercedColumn]:
+    """
+    Coerce every mapped column of `dataframe` for its field in one pass each.
+
+    Fields that are not mapped, and foreign keys, are left out. A fixed value
+    is coerced once and repeated for every row.
+    """
+
+    columns: dict[str, CoercedColumn] = {}
+    for field in fields:
+        if isinstance(field, ForeignKey):
+            continue
+        if fixed_value := fixed_fields.get(field.name):
+            fixed = coerce_column(field, pd.Series([fixed_value], dtype=object))
+            columns[field.name] = CoercedColumn(
+                np.repeat(fixed.values, len(dataframe)),
+                (
+                    {position: fixed.errors[0] for position in range(len(dataframe))}
+                    if fixed.errors
+                    else {}
+                ),
+            )
+        elif (column := mapping.get(field.name)) in dataframe.columns:
+            columns[field.name] = coerce_column(field, dataframe[column])
+    return columns
+
+
+def coerce_column(field, raw: pd.Series) -> CoercedColumn:
+    """
+    Vectorised `normalize_for_field` over a column.
+
+    Strings are converted column-wise; other cells, and strings the
+    column-wise conversion rejects, go through `normalize_for_field`.
+    None cells are left as None.
+    """
+
+    internal_type = field.get_internal_type()
+    if internal_type in _INTEGER_TYPES:
+        convert = _ints_from_strings
+    elif internal_type == "DateField":
+        convert = _dates_from_strings
+    elif internal_type == "BooleanField":
+        convert = _bools_from_strings
+    elif getattr(field, "choices", None):
+        convert = _choice_lookup(field.choices)
+    else:
+        convert = _texts_from_strings
+
+    cells = raw.to_numpy(dtype=object)
+    values = np.full(len(cells), None, dtype=object)
+    codes, kinds = pd.factorize(np.fromiter(map(type, cells), dtype=object))
+    strings = np.array([issubclass(kind, str) for kind in kinds], dtype=bool)[codes]
+    present = np.array([kind is not type(None) for kind in kinds], dtype=bool)[codes]
+
+    fallback = present & ~strings
+    if strings.any():
+        converted, ok = convert(pd.Series(cells[strings], dtype=object))
+        string_positions = np.flatnonzero(strings)
+        values[string_positions[ok]] = converted[ok]
+        fallback[string_positions[~ok]] = True
+
+    errors: dict[int, Exception] = {}
+    for position in np.flatnonzero(fallback).tolist():
+        try:
+            values[position] = normalize_for_field(field, cells[position])
+        except Exception as exc:
+            errors[position] = exc
+    return CoercedColumn(values, errors)
+
+
+# Column-wise converters: given a Series of strings, they return the converted
+# values and a mask of the cells they could convert, as numpy arrays.
+StringConverter = Callable[[pd.Series], tuple[np.ndarray, np.ndarray]]
+
+
+def _ints_from_strings(strings: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    # IDs like "#281" and blanks are not numbers to pandas; `to_int` sees those.
+    numbers = pd.to_numeric(strings, errors="coerce").astype(float).to_numpy()
+    # int(float(value)) truncates towards zero; anything int64 cannot hold
+    # is left to `to_int` too.
+    truncated = np.trunc(numbers)
+    ok = np.isfinite(truncated) & (np.abs(truncated) < 2**63)
+    values = np.full(len(strings), None, dtype=object)
+    values[ok] = truncated[ok].astype(np.int64).tolist()
+    return values, ok
+
+
+def _dates_from_strings(strings: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    values = np.full(len(strings), None, dtype=object)
+    stripped = strings.str.strip()
+    ok = stripped.eq("").to_numpy()
+
+    # dd/mm/yyyy for united kingdom users, as in `to_date`. The formats are
+    # explicit: pandas would otherwise guess one from the first cell, reading
+    # every later day-first date month-first after a "12/13/2024".
+    slash = strings.str.match(_SLASH_DATE).to_numpy(dtype=bool) & ~ok
+    for date_format in ("%d/%m/%Y", "%d/%m/%y"):
+        _parse_dates(stripped, slash & ~ok, values, ok, format=date_format)
+
+    with warnings.catch_warnings():
+        # Values pandas cannot infer one format for are parsed one by one;
+        # mixed time zones end up in `to_date` below.
+        warnings.simplefilter("ignore", UserWarning)
+        warnings.simplefilter("ignore", FutureWarning)
+        _parse_dates(strings, ~slash & ~ok, values, ok)
+    return values, ok
+
+
+def _parse_dates(
+    strings: pd.Series, group: np.ndarray, values: np.ndarray, ok: np.ndarray, **kwargs
+) -> None:
+    """Parse the `group` of `strings` into `values`, marking them `ok`."""
+    if not group.any():
+        return
+    try:
+        parsed = pd.to_datetime(strings[group], errors="coerce", **kwargs)
+    except Exception:
+        # e.g. mixed time zones; `to_date` handles these one at a time.
+        return
+    parsed_ok = parsed.notna().to_numpy()
+    positions = np.flatnonzero(group)
+    values[positions[parsed_ok]] = parsed.dt.date.to_numpy(dtype=object)[parsed_ok]
+    ok[positions[parsed_ok]] = True
+
+
+def _bools_from_strings(strings: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    true = strings.str.strip().str.lower().isin(_TRUE_TEXT)
+    return true.to_numpy(dtype=object), np.ones(len(strings), dtype=bool)
+
+
+def _choice_lookup(choices) -> StringConverter:
+    def convert(strings: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+        codes, texts = pd.factorize(strings.str.strip())
+        table = np.array(
+            [_choice_key(choices, text) for text in texts] + [None], dtype=object
+        )
+        # Missing codes (-1) index the trailing None.
+        return table[codes], np.ones(len(strings), dtype=bool)
+
+    return convert
+
+
+def _texts_from_strings(strings: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    return strings.str.strip().to_numpy(dtype=object), np.ones(len(strings), dtype=bool)
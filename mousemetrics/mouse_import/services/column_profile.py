@@ -0,0 +1,92 @@
+"""
+Bounded-cost profiles of spreadsheet columns for the mapping model.
+
+A profile reads the first `PROFILE_HEAD_ROWS` rows of a column and one row
+from each of `PROFILE_SAMPLE_ROWS` equal stretches of the rest, so it costs
+the same however long the sheet is. Profiles are cached per import, so the
+suggestions and the examples recorded from the same preview share them.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+
+cache = ConnectionProxy(caches, "import_profiles")
+
+PROFILE_HEAD_ROWS = 250
+PROFILE_SAMPLE_ROWS = 250
+PROFILE_TIMEOUT = 60 * 60 * 24
+
+SAMPLE_VALUES_N = 12
+TOP_VALUES_N = 6
+
+
+@dataclass(frozen=True)
+class ColumnProfile:
+    # The first non-blank values, in row order.
+    examples: list[str]
+    # The most frequent sampled values, with how often they were sampled.
+    top_values: list[tuple[str, int]]
+
+
+def profile_column(series: pd.Series) -> ColumnProfile:
+    sampled = series.iloc[_sample_positions(len(series))].tolist()
+    values = [text for v in sampled if v is not None and (text := str(v).strip())]
+
+    # Ties keep the order values first appeared in.
+    counts = (
+        pd.Series(values, dtype=object)
+        .value_counts(sort=False)
+        .sort_values(ascending=False, kind="stable")
+    )
+    return ColumnProfile(
+        examples=values[:SAMPLE_VALUES_N],
+        top_values=[(str(v), int(n)) for v, n in counts.head(TOP_VALUES_N).items()],
+    )
+
+
+def profile_columns(
+    df: pd.DataFrame, columns: list[str], *, import_obj=None
+) -> list[ColumnProfile]:
+    """
+    Profiles of the named columns of `df`, cached for `import_obj` when given.
+    The cache key covers the import's range, so choosing another range gives
+    new profiles.
+    """
+    if import_obj is None:
+        return [profile_column(df[c]) for c in columns]
+
+    keys = [_key(import_obj, df, c) for c in columns]
+    cached = cache.get_many(keys)
+    missing = {
+        key: profile_column(df[c]) for key, c in zip(keys, columns) if key not in cached
+    }
+    if missing:
+        cache.set_many(missing, PROFILE_TIMEOUT)
+    return [cached.get(key) or missing[key] for key in keys]
+
+
+def _sample_positions(n_rows: int) -> np.ndarray:
+    head = np.arange(min(n_rows, PROFILE_HEAD_ROWS))
+    if n_rows <= PROFILE_HEAD_ROWS:
+        return head
+    # Seeded, so the same column always gives the same profile.
+    rng = np.random.default_rng(n_rows)
+    bounds = np.linspace(PROFILE_HEAD_ROWS, n_rows, PROFILE_SAMPLE_ROWS + 1)
+    starts, ends = bounds[:-1].astype(int), bounds[1:].astype(int)
+    starts, ends = starts[ends > starts], ends[ends > starts]
+    return np.concatenate([head, rng.integers(starts, ends)])
+
+
+def _key(import_obj, df: pd.DataFrame, column: str) -> str:
+    source = "\0".join(
+        (import_obj.sheet_name or "", import_obj.cell_range, str(len(df)), column)
+    )
+    digest = hashlib.sha256(source.encode()).hexdigest()
+    return f"mouse_import:profile:{import_obj.pk}:{digest}"
@@ -0,0 +1,299 @@
+"""
+Dry runs of an import's commit.
+
+`dry_run` reads the range in `iter_range` batches as a commit does, and runs
+the same mapping and coercion. Foreign keys are only looked up: boxes and
+strains a commit would create are reported as such, and nothing is written.
+Each batch's rows are compared with the project's mice matching them,
+fetched in bulk, and classified as a create, an update, unchanged or an
+error.
+
+The report is columnar, one array of value codes before and after per
+field, so a page of the diff is a slice however many rows the range has.
+`report_for` caches it per import, mapping and state of the project's mice
+for `REPORT_TIMEOUT`, so paging and filtering do not run it again.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass, replace
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from django.core.cache import caches
+from django.db.models import Count, Max
+from django.utils.connection import ConnectionProxy
+
+from mouse_import.models import MouseImport
+from mouseapp.models import Box, Mouse, Strain
+
+from .importer import FieldValue, ImportOptions, Importer, MouseKey, RowDiff
+from .io import STREAM_BATCH_ROWS, iter_range
+from .mapping import importable_fields
+
+cache = ConnectionProxy(caches, "import_reports")
+
+REPORT_TIMEOUT = 60 * 15
+
+ACTIONS = {
+    "C": "Create",
+    "U": "Update",
+    "N": "Unchanged",
+    "E": "Error",
+}
+
+
+@dataclass(frozen=True)
+class DiffCell:
+    before: Any
+    after: Any
+    # The row sets the field; for a created mouse, every field it sets changes.
+    assigned: bool
+    changed: bool
+
+
+@dataclass(frozen=True)
+class DiffRow:
+    filename: str
+    number: int
+    action: str
+    error: str
+    cells: list[DiffCell]
+
+    @property
+    def action_label(self) -> str:
+        return ACTIONS[self.action]
+
+
+@dataclass(frozen=True)
+class DiffReport:
+    """
+    The rows of a dry run in order. Slicing it gives `DiffRow`s, so it can
+    be handed to a `Paginator`.
+
+    Each distinct value of a field is stored once, in `values`; the rows
+    hold codes into it, -1 picking its trailing None. Sheets repeat a few
+    boxes, strains and dates, so the report stays small enough to cache.
+    """
+
+    # Fields any row sets, in model order, and their labels.
+    fields: list[str]
+    labels: list[str]
+    filenames: list[str]
+    # Per row: its file, as an index into `filenames`, number and action.
+    files: np.ndarray
+    numbers: np.ndarray
+    actions: np.ndarray
+    errors: np.ndarray
+    values: np.ndarray
+    # (rows, fields) arrays of codes into `values` of the values shown.
+    before_codes: np.ndarray
+    after_codes: np.ndarray
+    assigned: np.ndarray
+    changed: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def __getitem__(self, index: slice) -> list[DiffRow]:
+        rows = range(len(self))[index]
+        before = self.values[self.before_codes[index]]
+        after = self.values[self.after_codes[index]]
+        return [
+            DiffRow(
+                filename=self.filenames[self.files[i]],
+                number=int(self.numbers[i]),
+                action=str(self.actions[i]),
+                error=self.errors[i],
+                cells=[
+                    DiffCell(*cell)
+                    for cell in zip(
+                        before[row],
+                        after[row],
+                        self.assigned[i],
+                        self.changed[i],
+                    )
+                ],
+            )
+            for row, i in enumerate(rows)
+        ]
+
+    @property
+    def before(self) -> np.ndarray:
+        return self.values[self.before_codes]
+
+    @property
+    def after(self) -> np.ndarray:
+        return self.values[self.after_codes]
+
+    def counts(self) -> dict[str, int]:
+        return {action: int((self.actions == action).sum()) for action in ACTIONS}
+
+    def only(self, action: str) -> DiffReport:
+        """The rows classified as `action`."""
+        keep = self.actions == action
+        return replace(
+            self,
+            files=self.files[keep],
+            numbers=self.numbers[keep],
+            actions=self.actions[keep],
+            errors=self.errors[keep],
+            before_codes=self.before_codes[keep],
+            after_codes=self.after_codes[keep],
+            assigned=self.assigned[keep],
+            changed=self.changed[keep],
+        )
+
+
+def report_for(
+    imports: list[MouseImport],
+    fixed_fields: dict[str, str],
+    mapping: dict[str, str],
+) -> DiffReport:
+    """
+    The dry run of `imports` with this mapping, from the cache unless the
+    project's mice, boxes or strains changed since it was run.
+    """
+    key = _key(imports, fixed_fields, mapping)
+    if (report := cache.get(key)) is None:
+        report = dry_run(imports, fixed_fields, mapping)
+        cache.set(key, report, REPORT_TIMEOUT)
+    return report
+
+
+def dry_run(
+    imports: list[MouseImport],
+    fixed_fields: dict[str, str],
+    mapping: dict[str, str],
+) -> DiffReport:
+    """
+    Classify every row of `imports`, the files of a batch in order or a
+    single import, as committing them with this mapping would write it.
+    Nothing is saved.
+    """
+    sources: list[tuple[str, RowDiff]] = []
+    # Values earlier rows gave each mouse, carried from file to file.
+    written: dict[MouseKey, dict[str, FieldValue]] = {}
+    for import_obj in imports:
+        importer = Importer(
+            ImportOptions(
+                project_id=import_obj.project_id,
+                sheet=import_obj.sheet_name or "",
+                range_expr=import_obj.cell_range,
+            )
+        )
+        for dataframe in iter_range(
+            import_obj.file.path,
+            import_obj.sheet_name,
+            import_obj.cell_range,
+            original_filename=import_obj.original_filename,
+            mapping=mapping,
+            batch_size=STREAM_BATCH_ROWS,
+        ):
+            sources.extend(
+                (import_obj.original_filename, diff)
+                for diff in importer.diff_batch(
+                    dataframe, fixed_fields, mapping, written
+                )
+            )
+
+    return _report(sources)
+
+
+def _report(sources: list[tuple[str, RowDiff]]) -> DiffReport:
+    diffs = [diff for _, diff in sources]
+    set_fields = {name for diff in diffs for name in diff.after}
+    fields = [field for field in importable_fields() if field.name in set_fields]
+    n_rows, n_fields = len(diffs), len(fields)
+
+    before = np.full((n_rows, n_fields), None, dtype=object)
+    after = np.full((n_rows, n_fields), None, dtype=object)
+    before_compared = np.full((n_rows, n_fields), None, dtype=object)
+    after_compared = np.full((n_rows, n_fields), None, dtype=object)
+    assigned = np.zeros((n_rows, n_fields), dtype=bool)
+    for i, diff in enumerate(diffs):
+        for j, field in enumerate(fields):
+            if (value := diff.after.get(field.name)) is None:
+                continue
+            assigned[i, j] = True
+            after_compared[i, j], after[i, j] = value
+            if diff.before is not None:
+                before_compared[i, j], before[i, j] = diff.before[field.name]
+
+    failed = np.array([bool(diff.error) for diff in diffs], dtype=bool)
+    created = np.array([diff.before is None for diff in diffs], dtype=bool) & ~failed
+    differs = (before_compared != after_compared).astype(bool)
+    changed = assigned & (created[:, None] | differs)
+
+    actions = np.full(n_rows, "N", dtype="<U1")
+    actions[changed.any(axis=1)] = "U"
+    actions[created] = "C"
+    actions[failed] = "E"
+
+    files, filenames = pd.factorize(
+        np.array([filename for filename, _ in sources], dtype=object)
+    )
+    values, (before_codes, after_codes) = _encode(before, after)
+    return DiffReport(
+        fields=[field.name for field in fields],
+        labels=[str(field.verbose_name).capitalize() for field in fields],
+        filenames=list(filenames),
+        files=files.astype(np.int32),
+        numbers=np.array([diff.number for diff in diffs], dtype=np.int64),
+        actions=actions,
+        errors=np.array([diff.error for diff in diffs], dtype=object),
+        values=values,
+        before_codes=before_codes,
+        after_codes=after_codes,
+        assigned=assigned,
+        changed=changed,
+    )
+
+
+def _encode(*arrays: np.ndarray) -> tuple[np.ndarray, list[np.ndarray]]:
+    """
+    Codes into one array of distinct values for each (rows, fields) array,
+    None coded as -1. Fields are encoded one at a time, so that equal values
+    of different types in different fields (1 and True) stay apart.
+    """
+    n_rows, n_fields = arrays[0].shape
+    codes = [np.full((n_rows, n_fields), -1, dtype=np.int32) for _ in arrays]
+    distinct: list[Any] = []
+    for j in range(n_fields):
+        column_codes, uniques = pd.factorize(
+            np.concatenate([array[:, j] for array in arrays])
+        )
+        known = column_codes >= 0
+        column_codes[known] += len(distinct)
+        for k, split in enumerate(np.split(column_codes, len(arrays))):
+            codes[k][:, j] = split
+        distinct.extend(uniques)
+    values = np.empty(len(distinct) + 1, dtype=object)
+    values[:-1] = distinct
+    return values, codes
+
+
+def _key(
+    imports: list[MouseImport], fixed_fields: dict[str, str], mapping: dict[str, str]
+) -> str:
+    project_ids = sorted({i.project_id for i in imports})
+    mice = Mouse.objects.filter(project_id__in=project_ids).aggregate(
+        updated=Max("updated_at"), count=Count("id")
+    )
+    source = json.dumps(
+        [
+            [[i.pk, i.sheet_name, i.cell_range] for i in imports],
+            fixed_fields,
+            mapping,
+            # Deleted mice and new boxes or strains change the report too.
+            [str(mice["updated"]), mice["count"]],
+            Box.objects.filter(project_id__in=project_ids).aggregate(Max("id")),
+            Strain.objects.aggregate(Max("id")),
+        ],
+        sort_keys=True,
+    )
+    digest = hashlib.sha256(source.encode()).hexdigest()
+    return f"mouse_import:dry_run:{imports[0].pk}:{digest}"
@@ -1,17 +1,25 @@
 from __future__ import annotations
 
 import logging
-from typing import Any, Dict
+from itertools import batched, count
+from typing import Any, Iterable
 
 from django.db import DatabaseError, IntegrityError, transaction
 from django.db.models import ForeignKey, Model, Field
+from django.utils import timezone
 
+from mouseapp.layout_snapshots import mark_stale_for_mice
 from mouseapp.models import Mouse, Box, Strain
+from mouseapp.pedigree import update_lineage_depths, update_pedigree_closure
+from mouseapp.tree_cache import invalidate_trees_containing
 
 from .coercion import normalize_for_field
 
 logger = logging.getLogger(__name__)
 
+# Keeps each `IN` list comfortably below SQLite's bound-parameter limit.
+BATCH_SIZE = 500
+
 
 def resolve_fk_instance(
     fk_field: ForeignKey, raw_value: Any, project=None, raw_values=None
@@ -85,34 +93,267 @@ def resolve_fk_instance(
         return None
 
 
+class ForeignKeyResolver:
+    """
+    Per-import cache in front of `resolve_fk_instance`.
+
+    `preload` resolves every distinct value of a column with one `IN` query
+    per target model and creates the missing rows with a single `bulk_create`;
+    `resolve` then answers from memory, falling back to `resolve_fk_instance`
+    for values that were not preloaded.
+
+    A `read_only` resolver never writes: the rows a commit would create are
+    returned unsaved, with negative placeholder ids so that rows naming the
+    same new box or strain still match each other and nothing stored.
+    """
+
+    def __init__(self, project=None, *, read_only: bool = False):
+        self.project = project
+        self.read_only = read_only
+        self._resolved: dict[tuple[type[Model], Any], Model | None] = {}
+        self._placeholder_ids = count(-1, -1)
+
+    def preload(self, fk_field: ForeignKey, raw_values: Iterable[Any]) -> None:
+        target_model = fk_field.remote_field.model
+        if target_model is Mouse:
+            return
+
+        keys = {
+            key
+            for raw_value in raw_values
+            if raw_value is not None
+            and (key := self._key(target_model, raw_value)) is not None
+        }
+        keys -= {key for model, key in self._resolved if model is target_model}
+        if not keys:
+            return
+
+        if target_model is Box:
+            if self.project is None:
+                found = self._fetch(Box, "number", keys)
+            else:
+                found = self._fetch(Box, "number", keys, project=self.project)
+                found.update(
+                    self._create_missing(
+                        Box,
+                        "number",
+                        [
+                            Box(project=self.project, number=number)
+                            for number in keys - found.keys()
+                        ],
+                        project=self.project,
+                    )
+                )
+        elif target_model is Strain:
+            found = self._fetch(Strain, "name", keys)
+            found.update(
+                self._create_missing(
+                    Strain,
+                    "name",
+                    [Strain(name=name) for name in keys - found.keys()],
+                )
+            )
+        else:
+            pk_name = _target_pk_name(target_model)
+            pk_field = _get_model_field(target_model, pk_name)
+            found = self._fetch(target_model, pk_name, keys)
+            found.update(
+                self._create_missing(
+                    target_model,
+                    pk_name,
+                    [
+                        target_model(**{pk_name: pk_value})
+                        for pk_value in keys - found.keys()
+                        if _pk_value_has_valid_type(pk_field, pk_value)
+                    ],
+                )
+            )
+
+        for key in keys:
+            self._resolved[(target_model, key)] = found.get(key)
+
+    def resolve(self, fk_field: ForeignKey, raw_value: Any, raw_values=None):
+        target_model = fk_field.remote_field.model
+        if target_model is Mouse:
+            return resolve_fk_instance(fk_field, raw_value, self.project, raw_values)
+
+        key = self._key(target_model, raw_value)
+        if key is None:
+            return None
+        if self.read_only:
+            self.preload(fk_field, [raw_value])
+            return self._resolved.get((target_model, key))
+        if (target_model, key) not in self._resolved:
+            self._resolved[(target_model, key)] = resolve_fk_instance(
+                fk_field, raw_value, self.project, raw_values
+            )
+        return self._resolved[(target_model, key)]
+
+    @staticmethod
+    def _key(target_model: type[Model], raw_value: Any):
+        """The value `resolve_fk_instance` would look `raw_value` up by."""
+        if target_model is Box:
+            return _coerce_for_field(Box._meta.get_field("number"), raw_value)
+        if target_model is Strain:
+            return str(raw_value)
+        pk_name = _target_pk_name(target_model)
+        return _coerce_for_field(_get_model_field(target_model, pk_name), raw_value)
+
+    @staticmethod
+    def _fetch(
+        model: type[Model], field_name: str, keys: set[Any], **filters
+    ) -> dict[Any, Model]:
+        found: dict[Any, Model] = {}
+        for key_batch in batched(sorted(keys, key=str), BATCH_SIZE):
+            for obj in model.objects.filter(
+                **filters, **{f"{field_name}__in": key_batch}
+            ):
+                # Keep the first match, as `.first()` would.
+                found.setdefault(getattr(obj, field_name), obj)
+        return found
+
+    def _create_missing(
+        self, model: type[Model], field_name: str, objs: list[Model], **filters
+    ) -> dict[Any, Model]:
+        """Create `objs`, or only number them if read-only; return them by key."""
+        if not objs:
+            return {}
+        if self.read_only:
+            for obj in objs:
+                if obj.pk is None:
+                    obj.pk = next(self._placeholder_ids)
+            return {getattr(obj, field_name): obj for obj in objs}
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    objs, batch_size=BATCH_SIZE, ignore_conflicts=True
+                )
+        except (IntegrityError, DatabaseError, ValueError, TypeError) as exc:
+            # Whatever could not be created resolves to None, as before.
+            logger.warning("Failed to create foreign key targets", exc_info=exc)
+        # `ignore_conflicts` leaves the pks unset, so the rows are fetched back.
+        keys = {getattr(obj, field_name) for obj in objs}
+        return self._fetch(model, field_name, keys, **filters)
+
+
 def link_self_foreign_keys(
     pending: list[tuple[int, dict[str, Any], dict[str, Any]]],
     field_by_name: dict[str, Field],
     project,
     errors: list[str],
+    resolver: ForeignKeyResolver | None = None,
 ) -> None:
-    """Resolve deferred parent links after initial row creation."""
+    """
+    Resolve deferred parent links after initial row creation.
 
+    Parents are found in an in-memory (strain, tube_number) index of the
+    project's mice, which by now includes the imported ones, and all links are
+    written with a single `bulk_update`.
+    """
+
+    pending = [item for item in pending if item[1]]
+    if not pending:
+        return
+    resolver = resolver or ForeignKeyResolver(project)
+    strain_field = Mouse._meta.get_field("strain")
+    resolver.preload(
+        strain_field, {raw_values.get("strain") for _, _, raw_values in pending}
+    )
+
+    mice = Mouse.objects.all()
+    if project is not None:
+        mice = mice.filter(project=project)
+    by_strain_and_tube: dict[tuple[int | None, int], int] = {}
+    by_tube: dict[int, int] = {}
+    for pk, strain_id, tube_number in mice.order_by("pk").values_list(
+        "pk", "strain_id", "tube_number"
+    ):
+        by_strain_and_tube.setdefault((strain_id, tube_number), pk)
+        by_tube.setdefault(tube_number, pk)
+
+    # Parents being replaced may lose their deepest line of descendants.
+    current: dict[int, Mouse] = {}
+    for pk_batch in batched(sorted({pk for pk, _, _ in pending}), BATCH_SIZE):
+        current.update(
+            (mouse.pk, mouse)
+            for mouse in Mouse.objects.filter(pk__in=pk_batch).only("father", "mother")
+        )
+    former_parent_ids = {
+        parent_id
+        for mouse in current.values()
+        for parent_id in (mouse.father_id, mouse.mother_id)
+    }
+
+    updates: dict[int, dict[str, Any]] = {}
     for pk, raw_map, raw_values in pending:
-        if not raw_map:
+        if pk not in current:
             continue
+        strain = None
+        if (strain_raw := raw_values.get("strain")) is not None:
+            strain = resolver.resolve(strain_field, strain_raw, raw_values)
+        for field_name, raw_value in raw_map.items():
+            field = field_by_name.get(field_name)
+            if not field or not isinstance(field, ForeignKey):
+                continue
+            if field.remote_field.model is not Mouse:
+                continue
+            tube_number = _coerce_for_field(
+                Mouse._meta.get_field("tube_number"), raw_value
+            )
+            if tube_number is None:
+                continue
+            if strain_raw is None:
+                target = by_tube.get(tube_number)
+            elif strain is not None:
+                target = by_strain_and_tube.get((strain.pk, tube_number))
+            else:
+                target = None
+            if target is None:
+                errors.append(
+                    f"Linking parents for mouse pk={pk}: no {field.verbose_name} "
+                    f"with tube number {tube_number} in this project"
+                )
+                continue
+            updates.setdefault(pk, {})[field.attname] = target
+
+    # Bulk updates leave `auto_now` fields alone.
+    now = timezone.now()
+    for pk, values in updates.items():
+        values["updated_at"] = now
+        for attname, target in values.items():
+            setattr(current[pk], attname, target)
+    linked = list(updates)
+    update_fields = sorted(
+        {attname for values in updates.values() for attname in values}
+    )
+
+    try:
+        with transaction.atomic():
+            Mouse.objects.bulk_update(
+                [current[pk] for pk in linked], update_fields, batch_size=BATCH_SIZE
+            )
+    except (IntegrityError, DatabaseError) as bulk_exc:
+        logger.warning("Bulk parent linking failed, retrying", exc_info=bulk_exc)
+        linked = _link_one_by_one(updates, errors)
 
+    # Bulk updates bypass model signals, so cached family trees, layout
+    # snapshots, the pedigree closure and lineage depths are refreshed here.
+    invalidate_trees_containing(linked)
+    mark_stale_for_mice(linked)
+    update_pedigree_closure(linked)
+    update_lineage_depths(linked, former_parent_ids)
+
+
+def _link_one_by_one(
+    updates: dict[int, dict[str, Any]], errors: list[str]
+) -> list[int]:
+    """Apply parent links mouse by mouse, reporting each one that fails."""
+    linked: list[int] = []
+    for pk, values in updates.items():
         sp = transaction.savepoint()
         try:
-            updates: Dict[str, Any] = {}
-            for field_name, raw_value in raw_map.items():
-                field = field_by_name.get(field_name)
-                if not field or not isinstance(field, ForeignKey):
-                    continue
-                if field.remote_field.model is not Mouse:
-                    continue
-                target = resolve_fk_instance(
-                    field, raw_value, project=project, raw_values=raw_values
-                )
-                if target:
-                    updates[f"{field_name}_id"] = target.pk
-            if updates:
-                Mouse.objects.filter(pk=pk).update(**updates)
+            Mouse.objects.filter(pk=pk).update(**values)
+            linked.append(pk)
             transaction.savepoint_commit(sp)
         except (IntegrityError, DatabaseError) as db_exc:
             transaction.savepoint_rollback(sp)
@@ -120,10 +361,7 @@ def link_self_foreign_keys(
                 f"Linking parents for mouse pk={pk}: database error: {db_exc}"
             )
             logger.warning("Failed to resolve self FK", exc_info=db_exc)
-        except Exception as exc:
-            transaction.savepoint_rollback(sp)
-            errors.append(f"Linking parents for mouse pk={pk}: error: {exc}")
-            logger.warning("Failed to resolve self FK", exc_info=exc)
+    return linked
 
 
 def _target_pk_name(model_class: type[Model]) -> str:
@@ -1,18 +1,30 @@
 import logging
 from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple
+from itertools import batched
+from typing import Any, Dict, Iterable, List, Tuple
 
 import pandas as pd
-from django.db import DatabaseError, IntegrityError, transaction
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import ForeignKey, Model
+from django.utils import timezone
 
+from mouseapp.layout_snapshots import mark_stale_for_mice
 from mouseapp.models import Mouse, Project
+from mouseapp.pedigree import update_pedigree_closure
+from mouseapp.tree_cache import invalidate_trees_containing
 
+from .coercion import CoercedRow, coerce_frame, normalize_for_field
 from .mapping import apply_mapping, importable_fields
 from .validators import missing_required
-from .fks import link_self_foreign_keys
+from .fks import ForeignKeyResolver, link_self_foreign_keys
 
 logger = logging.getLogger(__name__)
 
+# Rows written per bulk INSERT/UPDATE; a chunk that fails is retried row by row.
+BATCH_SIZE = 500
+
+MouseKey = Tuple[Any, Any]
+
 
 @dataclass
 class ImportOptions:
@@ -21,6 +33,49 @@ class ImportOptions:
     range_expr: str
 
 
+@dataclass
+class _PreparedRow:
+    """A spreadsheet row that passed validation and is ready to be written."""
+
+    number: int
+    defaults: Dict[str, Any]
+    self_fk_raw: Dict[str, Any]
+    raw_values: Dict[str, Any]
+
+    @property
+    def key(self) -> MouseKey | None:
+        """The (strain, tube_number) identifying the mouse within the project."""
+        tube_number = self.defaults.get("tube_number")
+        if tube_number is None:
+            return None
+        strain = self.defaults.get("strain")
+        return (strain.pk if strain is not None else None, tube_number)
+
+
+@dataclass
+class ImportResult:
+    created_ids: List[int]
+    updated_ids: List[int]
+    # (row number, message), reported in row order.
+    row_errors: List[Tuple[int, str]]
+    pending_self_fk: List[Tuple[int, Dict[str, Any], dict[str, Any]]]
+
+
+# A field's value as (value compared, value shown), e.g. (box pk, "Box 3").
+FieldValue = Tuple[Any, Any]
+
+
+@dataclass
+class RowDiff:
+    """What writing one row would do to the fields the row sets."""
+
+    number: int
+    after: Dict[str, FieldValue]
+    # The mouse's current values of the same fields; None when it is created.
+    before: Dict[str, FieldValue] | None
+    error: str = ""
+
+
 class Importer:
     """Coordinate the end-to-end import of mouse rows from a DataFrame."""
 
@@ -31,6 +86,11 @@ class Importer:
         self.field_by_name = {field.name: field for field in self.fields}
         self.has_tube = "tube_number" in self.field_by_name
         self.has_strain = "strain" in self.field_by_name
+        self.resolver = ForeignKeyResolver(self.project)
+        # Dry runs look foreign keys up without creating the missing ones.
+        self.diff_resolver = ForeignKeyResolver(self.project, read_only=True)
+        self.rows_read = 0
+        self._displays: Dict[Tuple[type[Model], Any], str] = {}
 
     def run(
         self,
@@ -39,65 +99,387 @@ class Importer:
         mapping: Dict[str, str],
     ) -> Tuple[List[int], List[int], List[str]]:
         """Persist DataFrame rows using the supplied mapping and project context."""
+        return self.run_batches([dataframe], fixed_fields, mapping)
+
+    def run_batches(
+        self,
+        batches: Iterable[pd.DataFrame],
+        fixed_fields: dict[str, str],
+        mapping: Dict[str, str],
+    ) -> Tuple[List[int], List[int], List[str]]:
+        """
+        Persist rows arriving as consecutive DataFrames, e.g. from `iter_range`,
+        holding only one batch in memory at a time.
 
-        created_ids: List[int] = []
-        updated_ids: List[int] = []
-        errors: List[str] = []
-        pending_self_fk: List[Tuple[int, Dict[str, Any], dict[str, Any]]] = []
+        Parents are linked once every batch has been written.
+        """
 
-        for row_num, (_, row) in enumerate(dataframe.iterrows(), start=1):
-            savepoint = transaction.savepoint()
+        result = ImportResult([], [], [], [])
+        for dataframe in batches:
+            self.write_batch(dataframe, fixed_fields, mapping, result)
+
+        errors = [message for _, message in sorted(result.row_errors)]
+        self.link_parents(result.pending_self_fk, errors)
+        return result.created_ids, result.updated_ids, errors
+
+    def write_batch(
+        self,
+        dataframe: pd.DataFrame,
+        fixed_fields: dict[str, str],
+        mapping: Dict[str, str],
+        result: ImportResult,
+    ) -> None:
+        """
+        Write the rows of one batch and add the outcome to `result`; their
+        parents are left for `link_parents`.
+
+        Every row is validated in memory first. Valid rows are then matched
+        against the project's existing mice and written in chunks with
+        `bulk_create`/`bulk_update`; a chunk the database rejects is retried
+        one row at a time so that the failing rows are reported individually.
+        """
+
+        bulk_created: List[int] = []
+        bulk_updated: List[int] = []
+
+        rows = self._prepare_rows(
+            dataframe,
+            fixed_fields,
+            mapping,
+            result.row_errors,
+            first_row=self.rows_read + 1,
+        )
+        self.rows_read += len(dataframe)
+        existing = self._existing_mice(rows)
+
+        for chunk in batched(rows, BATCH_SIZE):
             try:
-                defaults, self_fk_raw, raw_values = apply_mapping(
-                    row, fixed_fields, mapping, self.fields, self.project
+                with transaction.atomic():
+                    written = self._write_chunk(chunk, existing)
+            except Exception as exc:
+                logger.warning(
+                    "Bulk import chunk failed, retrying row by row", exc_info=exc
                 )
+                for row in chunk:
+                    self._write_row(row, existing, result)
+                continue
 
-                # Ensure everything is scoped to this project
-                defaults["project"] = self.project
+            for row, mouse, was_created in written:
+                if row.key is not None:
+                    existing[row.key] = mouse
+                self._record(row, mouse, was_created, result)
+                (bulk_created if was_created else bulk_updated).append(mouse.pk)
 
-                missing = list(missing_required(self.fields, defaults))
-                if self.has_strain and defaults.get("strain") is None:
-                    missing.append("strain")
+        # Bulk writes bypass model signals. Created mice need their closure
+        # rows before their own children can be linked below them.
+        update_pedigree_closure(bulk_created)
+        mark_stale_for_mice(bulk_created)
+        invalidate_trees_containing(bulk_updated)
 
-                if missing:
-                    errors.append(
-                        f"Row {row_num}: missing/invalid required fields: {', '.join(sorted(set(missing)))}"
-                    )
-                    transaction.savepoint_rollback(savepoint)
-                    continue
-
-                if self.has_tube and defaults.get("tube_number") is not None:
-                    obj, was_created = Mouse.objects.update_or_create(
-                        project=self.project,
-                        tube_number=defaults["tube_number"],
-                        strain=defaults["strain"],
-                        defaults=defaults,
-                    )
-                else:
-                    obj = Mouse.objects.create(**defaults)
-                    was_created = True
-
-                if was_created:
-                    created_ids.append(obj.pk)
-                else:
-                    updated_ids.append(obj.pk)
-
-                if self_fk_raw:
-                    pending_self_fk.append((obj.pk, self_fk_raw, raw_values))
-
-                transaction.savepoint_commit(savepoint)
-            except (IntegrityError, DatabaseError) as db_exc:
-                transaction.savepoint_rollback(savepoint)
-                errors.append(f"Row {row_num}: database error: {db_exc}")
-                logger.warning(
-                    "Row import failed due to database error", exc_info=db_exc
+    def diff_batch(
+        self,
+        dataframe: pd.DataFrame,
+        fixed_fields: dict[str, str],
+        mapping: Dict[str, str],
+        written: Dict[MouseKey, Dict[str, FieldValue]],
+    ) -> List[RowDiff]:
+        """
+        What `write_batch` would do with the rows of one batch, without
+        writing them. Rows are compared with the project's mice fetched in
+        bulk; `written` holds the values earlier rows gave their mice, as a
+        later row for the same mouse would be written over them.
+
+        Parents are compared by tube number, without checking they exist.
+        Boxes, strains, ... a commit would create are shown as such, unsaved.
+        """
+
+        errors: List[Tuple[int, str]] = []
+        rows = self._prepare_rows(
+            dataframe,
+            fixed_fields,
+            mapping,
+            errors,
+            first_row=self.rows_read + 1,
+            resolver=self.diff_resolver,
+        )
+        self.rows_read += len(dataframe)
+        # Parents are compared by tube number, so they are fetched too.
+        parents = {name for row in rows for name in row.self_fk_raw}
+        existing = self._existing_mice(rows, related=sorted(parents))
+
+        diffs = [RowDiff(number, {}, None, message) for number, message in errors]
+        for row in rows:
+            after = self._row_values(row)
+            key = row.key if self.has_tube else None
+            mouse = existing.get(key) if key is not None else None
+            before = None
+            if key is not None and (mouse is not None or key in written):
+                earlier = written.get(key, {})
+                unset = [name for name in after if name not in earlier]
+                current = (
+                    self._mouse_values(mouse, unset, after)
+                    if mouse is not None
+                    else dict.fromkeys(unset, (None, None))
+                )
+                before = {
+                    name: earlier[name] if name in earlier else current[name]
+                    for name in after
+                }
+            if key is not None:
+                written.setdefault(key, {}).update(after)
+            diffs.append(RowDiff(row.number, after, before))
+        diffs.sort(key=lambda diff: diff.number)
+        return diffs
+
+    def link_parents(
+        self,
+        pending_self_fk: List[Tuple[int, Dict[str, Any], dict[str, Any]]],
+        errors: List[str],
+    ) -> None:
+        """Link written mice to their parents, appending failures to `errors`."""
+        link_self_foreign_keys(
+            pending_self_fk,
+            self.field_by_name,
+            self.project,
+            errors,
+            self.resolver,
+        )
+
+    def _prepare_rows(
+        self,
+        dataframe: pd.DataFrame,
+        fixed_fields: dict[str, str],
+        mapping: Dict[str, str],
+        errors: List[Tuple[int, str]],
+        first_row: int = 1,
+        resolver: ForeignKeyResolver | None = None,
+    ) -> List[_PreparedRow]:
+        resolver = resolver or self.resolver
+        self._preload_foreign_keys(dataframe, fixed_fields, mapping, resolver)
+        # Each mapped column is coerced in one go; a cell that fails raises
+        # below, when its row reads it, so row errors read as they always have.
+        coerced = coerce_frame(dataframe, fixed_fields, mapping, self.fields)
+
+        rows: List[_PreparedRow] = []
+        # Plain dicts: `apply_mapping` reads every field of every row.
+        for position, row in enumerate(dataframe.to_dict("records")):
+            row_num = first_row + position
+            try:
+                defaults, self_fk_raw, raw_values = apply_mapping(
+                    row,
+                    fixed_fields,
+                    mapping,
+                    self.fields,
+                    self.project,
+                    resolver,
+                    CoercedRow(coerced, position),
                 )
             except Exception as exc:
-                transaction.savepoint_rollback(savepoint)
-                errors.append(f"Row {row_num}: error: {exc}")
+                errors.append((row_num, f"Row {row_num}: error: {exc}"))
                 logger.warning("Row import failed", exc_info=exc)
+                continue
 
-        link_self_foreign_keys(
-            pending_self_fk, self.field_by_name, self.project, errors
+            # Ensure everything is scoped to this project
+            defaults["project"] = self.project
+
+            missing = list(missing_required(self.fields, defaults))
+            if self.has_strain and defaults.get("strain") is None:
+                missing.append("strain")
+
+            if missing:
+                errors.append(
+                    (
+                        row_num,
+                        f"Row {row_num}: missing/invalid required fields: {', '.join(sorted(set(missing)))}",
+                    )
+                )
+                continue
+
+            rows.append(_PreparedRow(row_num, defaults, self_fk_raw, raw_values))
+        return rows
+
+    def _preload_foreign_keys(
+        self,
+        dataframe: pd.DataFrame,
+        fixed_fields: dict[str, str],
+        mapping: Dict[str, str],
+        resolver: ForeignKeyResolver,
+    ) -> None:
+        """Resolve every distinct Box, Strain, ... named by the import at once."""
+        for field in self.fields:
+            if not isinstance(field, ForeignKey):
+                continue
+            if fixed_value := fixed_fields.get(field.name):
+                resolver.preload(field, [fixed_value])
+            elif (column := mapping.get(field.name)) in dataframe.columns:
+                resolver.preload(field, dataframe[column].unique().tolist())
+
+    def _existing_mice(
+        self, rows: List[_PreparedRow], *, related: Iterable[str] = ()
+    ) -> Dict[MouseKey, Mouse]:
+        """
+        Fetch the project's mice matching any (strain, tube_number) in `rows`,
+        with the `related` objects named.
+        """
+        if not self.has_tube:
+            return {}
+        keys = {row.key for row in rows if row.key is not None}
+        strain_ids = {strain_id for strain_id, _ in keys}
+        # Tube numbers the column cannot hold match nothing; their rows fail
+        # when written and are reported then.
+        low, high = connection.ops.integer_field_range("IntegerField")
+        tubes = sorted(
+            tube
+            for tube in {tube for _, tube in keys}
+            if (low is None or tube >= low) and (high is None or tube <= high)
         )
-        return created_ids, updated_ids, errors
+        mice = Mouse.objects.select_related(*related) if related else Mouse.objects
+        existing: Dict[MouseKey, Mouse] = {}
+        for tube_batch in batched(tubes, BATCH_SIZE):
+            for mouse in mice.filter(
+                project=self.project,
+                strain_id__in=strain_ids,
+                tube_number__in=tube_batch,
+            ):
+                existing[(mouse.strain_id, mouse.tube_number)] = mouse
+        return existing
+
+    def _row_values(self, row: _PreparedRow) -> Dict[str, FieldValue]:
+        values: Dict[str, FieldValue] = {}
+        for name, value in row.defaults.items():
+            if name == "project":
+                continue
+            if isinstance(value, Model) and value._state.adding:
+                values[name] = (value.pk, f"{value} (would create)")
+            elif isinstance(value, Model):
+                values[name] = (value.pk, str(value))
+            else:
+                values[name] = (value, value)
+        tube_field = self.field_by_name["tube_number"] if self.has_tube else None
+        for name, raw_value in row.self_fk_raw.items():
+            tube = normalize_for_field(tube_field, raw_value) if tube_field else None
+            values[name] = (tube, tube)
+        return values
+
+    def _mouse_values(
+        self, mouse: Mouse, names: List[str], after: Dict[str, FieldValue]
+    ) -> Dict[str, FieldValue]:
+        """
+        The mouse's values of the fields named. Related objects are only
+        looked up to show values that differ from those in `after`.
+        """
+        values: Dict[str, FieldValue] = {}
+        for field in map(self.field_by_name.__getitem__, names):
+            if not isinstance(field, ForeignKey):
+                value = getattr(mouse, field.name)
+                values[field.name] = (value, value)
+            elif field.remote_field.model is Mouse:
+                parent = getattr(mouse, field.name)
+                tube = parent.tube_number if parent is not None else None
+                values[field.name] = (tube, tube)
+            elif (pk := getattr(mouse, field.attname)) == after[field.name][0]:
+                values[field.name] = after[field.name]
+            else:
+                values[field.name] = (pk, self._display(field, pk))
+        return values
+
+    def _display(self, field: ForeignKey, pk: Any) -> str | None:
+        """How a related object is shown, fetched once per object."""
+        if pk is None:
+            return None
+        model = field.remote_field.model
+        if (model, pk) not in self._displays:
+            self._displays[(model, pk)] = str(model.objects.get(pk=pk))
+        return self._displays[(model, pk)]
+
+    def _write_chunk(
+        self, chunk: Tuple[_PreparedRow, ...], existing: Dict[MouseKey, Mouse]
+    ) -> List[Tuple[_PreparedRow, Mouse, bool]]:
+        # Later rows for the same mouse update the earlier row's mouse, as
+        # separate `update_or_create` calls would.
+        pending: Dict[MouseKey, Mouse] = {}
+        to_create: List[Mouse] = []
+        to_update: Dict[int, Mouse] = {}
+        update_fields: set[str] = set()
+        written: List[Tuple[_PreparedRow, Mouse, bool]] = []
+
+        for row in chunk:
+            key = row.key if self.has_tube else None
+            mouse = pending.get(key) if key is not None else None
+            if mouse is None and key is not None:
+                mouse = existing.get(key)
+
+            if mouse is None:
+                mouse = Mouse(**row.defaults)
+                to_create.append(mouse)
+                was_created = True
+            else:
+                for name, value in row.defaults.items():
+                    setattr(mouse, name, value)
+                if mouse.pk is not None:
+                    to_update[mouse.pk] = mouse
+                    update_fields.update(row.defaults)
+                was_created = False
+
+            if key is not None:
+                pending[key] = mouse
+            written.append((row, mouse, was_created))
+
+        Mouse.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+        update_fields.discard("project")
+        if to_update and update_fields:
+            # `bulk_update` leaves `auto_now` fields alone.
+            now = timezone.now()
+            for mouse in to_update.values():
+                mouse.updated_at = now
+            Mouse.objects.bulk_update(
+                list(to_update.values()),
+                sorted(update_fields | {"updated_at"}),
+                batch_size=BATCH_SIZE,
+            )
+        return written
+
+    def _write_row(
+        self,
+        row: _PreparedRow,
+        existing: Dict[MouseKey, Mouse],
+        result: ImportResult,
+    ) -> None:
+        savepoint = transaction.savepoint()
+        try:
+            defaults = row.defaults
+            if self.has_tube and defaults.get("tube_number") is not None:
+                obj, was_created = Mouse.objects.update_or_create(
+                    project=self.project,
+                    tube_number=defaults["tube_number"],
+                    strain=defaults["strain"],
+                    defaults=defaults,
+                )
+                existing[(obj.strain_id, obj.tube_number)] = obj
+            else:
+                obj = Mouse.objects.create(**defaults)
+                was_created = True
+
+            self._record(row, obj, was_created, result)
+            transaction.savepoint_commit(savepoint)
+        except (IntegrityError, DatabaseError) as db_exc:
+            transaction.savepoint_rollback(savepoint)
+            result.row_errors.append(
+                (row.number, f"Row {row.number}: database error: {db_exc}")
+            )
+            logger.warning("Row import failed due to database error", exc_info=db_exc)
+        except Exception as exc:
+            transaction.savepoint_rollback(savepoint)
+            result.row_errors.append((row.number, f"Row {row.number}: error: {exc}"))
+            logger.warning("Row import failed", exc_info=exc)
+
+    @staticmethod
+    def _record(
+        row: _PreparedRow, mouse: Mouse, was_created: bool, result: ImportResult
+    ) -> None:
+        if was_created:
+            result.created_ids.append(mouse.pk)
+        else:
+            result.updated_ids.append(mouse.pk)
+        if row.self_fk_raw:
+            result.pending_self_fk.append((mouse.pk, row.self_fk_raw, row.raw_values))
@@ -2,22 +2,29 @@ from __future__ import annotations
 
 import csv
 import logging
+from collections.abc import Iterator
 from contextlib import closing
+from itertools import islice
 from os import PathLike
 from pathlib import Path
 from typing import cast
 
+import numpy as np
 import pandas as pd
 from openpyxl import load_workbook
 from openpyxl.worksheet.worksheet import Worksheet
 from datetime import date, datetime
 
+from .sheet_cache import ensure_workbook_cache, load_workbook_cache
 from .validators import excel_col_to_index, parse_cell_range
 
 logger = logging.getLogger(__name__)
 
 FORWARD_FILL_SKIP_COLUMNS = ["death_date", "death_reason", "death_cause"]
 
+# Rows per DataFrame when streaming a range with `iter_range`.
+STREAM_BATCH_ROWS = 2000
+
 
 def read_range(
     file_path: PathLike,
@@ -41,6 +48,38 @@ def read_range(
       - Excel workbooks via openpyxl
       - CSV files (delimiter auto-detected), with the SAME range semantics
     """
+    batches = list(
+        iter_range(
+            file_path,
+            sheet_name,
+            range_expr,
+            original_filename=original_filename,
+            limit=limit,
+            mapping=mapping,
+        )
+    )
+    if len(batches) == 1:
+        return batches[0]
+    return pd.concat(batches, ignore_index=True)
+
+
+def iter_range(
+    file_path: PathLike,
+    sheet_name: str | None,
+    range_expr: str,
+    *,
+    original_filename: str | None = None,
+    limit: int | None = None,
+    mapping: dict[str, str] | None = None,
+    batch_size: int = STREAM_BATCH_ROWS,
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream the rows `read_range` would return as DataFrames of at most
+    `batch_size` rows, so memory stays bounded however large the range is.
+
+    Forward-filling carries over from one batch to the next. A range without
+    data rows yields a single empty DataFrame with the header's columns.
+    """
     c1, r1, c2, r2 = parse_cell_range(range_expr)
 
     if limit:
@@ -52,11 +91,30 @@ def read_range(
 
     ext = _infer_extension(file_path, original_filename)
     if ext == ".csv":
-        df = _read_csv_range(file_path, c1, r1, c2, r2)
+        rows = _iter_csv_range(file_path, c1, r1, c2, r2, batch_size)
     else:
-        df = _read_excel_range(file_path, sheet_name, c1, r1, c2, r2)
+        rows = _iter_excel_range(file_path, sheet_name, c1, r1, c2, r2, batch_size)
+
+    header: pd.Index | None = None
+    previous: pd.Series | None = None
+    for batch in rows:
+        if header is None:
+            if not batch:
+                continue
+            header = pd.Index([str(v or "").strip() for v in batch[0]])
+            batch = batch[1:]
+        if not batch:
+            continue
+        df = _process_dataframe(
+            pd.DataFrame(batch, columns=header, dtype=object), None, mapping, previous
+        )
+        previous = df.iloc[-1]
+        yield df
 
-    return _process_dataframe(df, limit, mapping)
+    if header is None:
+        raise ValueError("Selected range does not contain any cells.")
+    if previous is None:
+        yield _process_dataframe(pd.DataFrame(columns=header), None, mapping)
 
 
 def _infer_extension(file_path: PathLike, original_filename: str | None) -> str:
@@ -78,6 +136,8 @@ def list_sheet_names(
     ext = _infer_extension(file_path, original_filename)
     if ext == ".csv":
         return []
+    if (cache := load_workbook_cache(file_path)) is not None:
+        return list(cache.sheet_names)
 
     with closing(
         load_workbook(filename=file_path, data_only=True, read_only=True)
@@ -85,38 +145,57 @@ def list_sheet_names(
         return list(workbook.sheetnames)
 
 
-def _read_excel_range(
+def prepare_upload(
+    file_path: PathLike, *, original_filename: str | None = None
+) -> list[str]:
+    """
+    Parse an upload once for the wizard's later steps and return its sheet
+    names. Uses no database, so it can run in another process.
+    """
+    ensure_workbook_cache(file_path, original_filename=original_filename)
+    return list_sheet_names(file_path, original_filename=original_filename)
+
+
+def _iter_excel_range(
     file_path: PathLike,
     sheet_name: str | None,
     c1: str,
     r1: int,
     c2: str,
     r2: int,
-) -> pd.DataFrame:
+    batch_size: int,
+) -> Iterator[list[tuple] | list[list]]:
+    min_col, max_col = excel_col_to_index(c1) + 1, excel_col_to_index(c2) + 1
+    cache = load_workbook_cache(file_path)
+    if cache is not None and (sheet := cache.sheet(sheet_name)) is not None:
+        yield from sheet.iter_range(min_col, r1, max_col, r2, batch_size)
+        return
+
     with closing(
         load_workbook(filename=file_path, data_only=True, read_only=True)
     ) as workbook:
         worksheet = workbook[sheet_name] if sheet_name else workbook.active
         worksheet = cast(Worksheet, worksheet)
 
-        rows = worksheet[f"{c1}{r1}":f"{c2}{r2}"]
-        data = [[cell.value for cell in row] for row in rows]
-        if not data:
-            raise ValueError("Selected range does not contain any cells.")
+        rows = worksheet.iter_rows(
+            min_row=r1,
+            max_row=r2,
+            min_col=min_col,
+            max_col=max_col,
+            values_only=True,
+        )
+        while batch := list(islice(rows, batch_size)):
+            yield batch
 
-        header = [str(v or "").strip() for v in data[0]]
-        cols = pd.Index(header)
-        df = pd.DataFrame(data[1:], columns=cols)
-        return df
 
-
-def _read_csv_range(
+def _iter_csv_range(
     file_path: PathLike,
     c1: str,
     r1: int,
     c2: str,
     r2: int,
-) -> pd.DataFrame:
+    batch_size: int,
+) -> Iterator[list[list]]:
     c1i = excel_col_to_index(c1)
     c2i = excel_col_to_index(c2)
 
@@ -132,7 +211,7 @@ def _read_csv_range(
     encoding = _detect_encoding(file_path)
     delimiter = _detect_delimiter(file_path, encoding)
 
-    df_raw = pd.read_csv(
+    chunks = pd.read_csv(
         file_path,
         encoding=encoding,
         sep=delimiter,
@@ -142,28 +221,22 @@ def _read_csv_range(
         nrows=nrows,
         engine="python",
         keep_default_na=False,
+        chunksize=batch_size,
     )
-
-    if df_raw.empty:
-        raise ValueError("Selected range does not contain any cells.")
-
-    # Pad out missing columns so selecting a "wider" range behaves like Excel (empties become NA).
-    needed_cols = c2i + 1
-    current_cols = df_raw.shape[1]
-    if current_cols < needed_cols:
-        for j in range(current_cols, needed_cols):
-            df_raw[j] = pd.NA
-
-    # Slice selected columns
-    df_raw = df_raw.iloc[:, c1i : c2i + 1]
-
-    if df_raw.empty:
-        raise ValueError("Selected range does not contain any cells.")
-
-    header = [str(v or "").strip() for v in df_raw.iloc[0].tolist()]
-    df = df_raw.iloc[1:].copy()
-    df.columns = pd.Index(header)
-    return df
+    with chunks:
+        for df_raw in chunks:
+            # Pad out missing columns so selecting a "wider" range behaves like
+            # Excel (empty cells are None).
+            needed_cols = c2i + 1
+            current_cols = df_raw.shape[1]
+            if current_cols < needed_cols:
+                for j in range(current_cols, needed_cols):
+                    df_raw[j] = None
+
+            # Slice selected columns
+            df_raw = df_raw.iloc[:, c1i : c2i + 1]
+            if df_raw.shape[1]:
+                yield df_raw.values.tolist()
 
 
 def _detect_encoding(file_path: PathLike) -> str:
@@ -190,9 +263,75 @@ def _detect_delimiter(file_path: PathLike, encoding: str) -> str:
         return ","
 
 
+def _blank_to_na(column: pd.Series) -> pd.Series:
+    """
+    Strip strings and turn blank ones into NA. No dtype is inferred: cells are
+    stringified one by one, so 10 reads "10" whether or not its batch has
+    blanks that would make it a float column.
+    """
+    if column.dtype == object:
+        values = column.to_numpy(dtype=object, copy=True)
+        strings = _string_mask(values)
+        if strings.any():
+            # Spreadsheet columns repeat a handful of values, so each distinct
+            # string is stripped once. Only strings are factorized together:
+            # 1, 1.0 and True would otherwise collapse into one value.
+            codes, uniques = pd.factorize(values[strings])
+            stripped = np.array([value.strip() for value in uniques], dtype=object)
+            stripped[stripped == ""] = pd.NA
+            values[strings] = stripped[codes]
+            column = pd.Series(values, index=column.index, name=column.name)
+    return column
+
+
+def _to_strings(column: pd.Series) -> pd.Series:
+    """
+    Stable string output: dates as ISO dates, everything else stripped `str()`,
+    NA as None. Strings are expected to be stripped already.
+    """
+    missing = column.isna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(column.dtype):
+        if column.dt.tz is not None:
+            column = column.dt.tz_localize(None)
+        text = column.to_numpy().astype("datetime64[D]").astype(str).astype(object)
+    elif pd.api.types.is_numeric_dtype(column.dtype):
+        # Numbers and booleans have no surrounding whitespace to strip.
+        text = column.astype(str).to_numpy(dtype=object)
+    else:
+        text = column.to_numpy(dtype=object, copy=True)
+        # Only cells that are not strings (numbers, dates, ...) go through Python.
+        other = ~missing & ~_string_mask(text)
+        if other.any():
+            text[other] = [_cell_to_string(value) for value in text[other]]
+    text[missing] = None
+    return pd.Series(text, index=column.index, name=column.name, dtype=object)
+
+
+def _string_mask(values: np.ndarray) -> np.ndarray:
+    codes, types = pd.factorize(np.fromiter(map(type, values), dtype=object))
+    return np.array([issubclass(kind, str) for kind in types], dtype=bool)[codes]
+
+
+def _cell_to_string(value) -> str:
+    if isinstance(value, pd.Timestamp):
+        return value.date().isoformat()
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value).strip()
+
+
 def _process_dataframe(
-    df: pd.DataFrame, limit: int | None, mapping: dict[str, str] | None
+    df: pd.DataFrame,
+    limit: int | None,
+    mapping: dict[str, str] | None,
+    previous: pd.Series | None = None,
 ) -> pd.DataFrame:
+    """
+    Normalise raw cells; `previous` is the last processed row before `df`,
+    which forward-filling continues from.
+    """
     idxs = iter(range(len(df.columns)))
     df.columns = [col or f"unnamed-{next(idxs) + 1}" for col in df.columns]
     if df.empty:
@@ -201,34 +340,26 @@ def _process_dataframe(
     if limit:
         df = df.head(limit)
 
-    # blanks / whitespace -> NA
-    df = df.replace(r"^\s*$", pd.NA, regex=True)
+    if previous is not None:
+        df = pd.concat(
+            [pd.DataFrame([previous.tolist()], columns=df.columns, dtype=object), df],
+            ignore_index=True,
+        )
 
-    # forward-fill and trim existing strings
     ffill_skip_columns = {(mapping or {}).get(c) for c in FORWARD_FILL_SKIP_COLUMNS}
-    for col in df.columns:
-        if mapping and col not in ffill_skip_columns:
-            df[col] = df[col].ffill()
-
-        if df[col].dtype == object:
-            df[col] = df[col].apply(lambda v: v.strip() if isinstance(v, str) else v)
-
-    # pandas NA -> None
-    df = df.astype("object").mask(pd.isna(df), None)
-
-    # stable string output
-    def _to_string(v):
-        if v is None:
-            return None
-        if isinstance(v, pd.Timestamp):
-            return v.date().isoformat()
-        if isinstance(v, datetime):
-            return v.date().isoformat()
-        if isinstance(v, date):
-            return v.isoformat()
-        return str(v).strip()
-
-    for col in df.columns:
-        df[col] = df[col].apply(_to_string)
-
+    columns = []
+    for position, name in enumerate(df.columns):
+        column = _blank_to_na(df.iloc[:, position])
+        if mapping and name not in ffill_skip_columns:
+            # Kept as objects: pandas deprecates ffill downcasting them.
+            with pd.option_context("future.no_silent_downcasting", True):
+                column = column.ffill()
+        columns.append(_to_strings(column))
+
+    names = df.columns
+    df = pd.DataFrame(dict(enumerate(columns)), index=df.index)
+    df.columns = names
+
+    if previous is not None:
+        df = df.iloc[1:].reset_index(drop=True)
     return df
@@ -0,0 +1,319 @@
+"""
+Background commits of mouse imports.
+
+`enqueue_commit` records a `MouseImportJob` and hands it to a thread pool in
+the current process once the request's transaction commits. The job writes
+the range one `iter_range` batch at a time, saving its progress in the same
+transaction as the batch's mice, so a job interrupted by a restart resumes
+after the last batch written. A job stops being "running" once its
+heartbeat is older than `STALE_AFTER`; `resume_if_stale` restarts it then.
+Queued jobs wait in the pool's in-memory queue, lost with the process, so
+one queued for longer is restarted too.
+
+The files of a batch have a job each, run one after another in file order
+by `run_batch_job`. A written file waits ("W") until all are written; then
+every file's mice are linked to their parents, which may be in any file.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from mouse_import.models import MouseImport, MouseImportBatch, MouseImportJob
+
+from .importer import ImportOptions, Importer, ImportResult
+from .io import STREAM_BATCH_ROWS, iter_range
+from .sheet_cache import delete_workbook_cache
+
+logger = logging.getLogger(__name__)
+
+STALE_AFTER = timedelta(minutes=10)
+
+# Rows written, and progress saved, per transaction.
+CHUNK_ROWS = STREAM_BATCH_ROWS
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.IMPORT_WORKER_THREADS, thread_name_prefix="mouse-import"
+)
+
+
+class _LostClaim(Exception):
+    """Another worker resumed the job while this one was still writing."""
+
+
+def enqueue_commit(
+    import_obj: MouseImport, fixed_fields: dict[str, str], mapping: dict[str, str]
+) -> MouseImportJob:
+    """
+    Queue the commit of `import_obj`. A failed job is queued again and
+    resumes from its last saved batch.
+    """
+    job = _queue(import_obj, fixed_fields, mapping)
+    if job.status == "Q":
+        _submit(run_import_job, job.id)
+    return job
+
+
+def enqueue_batch_commit(
+    batch: MouseImportBatch, fixed_fields: dict[str, str], mapping: dict[str, str]
+) -> list[MouseImportJob]:
+    """
+    Queue the commit of every file of `batch` with one mapping. Failed files
+    are queued again and resume from their last saved batch of rows.
+    """
+    imports = MouseImport.objects.filter(batch=batch).order_by("batch_position")
+    batch_jobs = [_queue(import_obj, fixed_fields, mapping) for import_obj in imports]
+    if any(job.status == "Q" for job in batch_jobs):
+        _submit(run_batch_job, batch.id)
+    return batch_jobs
+
+
+def resume_if_stale(job: MouseImportJob) -> bool:
+    """Restart a job whose worker went away, e.g. when its process restarted."""
+    if _is_stale(job):
+        _submit(run_import_job, job.id)
+        return True
+    return False
+
+
+def resume_batch_if_stale(batch_id: int, batch_jobs: list[MouseImportJob]) -> bool:
+    """
+    `resume_if_stale` for the jobs of a batch. Besides a stale job, a batch
+    whose files are all written but were not linked for `STALE_AFTER` is
+    restarted, to link them.
+    """
+    if any(job.status == "R" and not _is_stale(job) for job in batch_jobs):
+        return False
+    unlinked = all(job.status == "W" for job in batch_jobs) and _is_old(
+        max(job.heartbeat for job in batch_jobs)
+    )
+    if unlinked or any(map(_is_stale, batch_jobs)):
+        _submit(run_batch_job, batch_id)
+        return True
+    return False
+
+
+def _queue(
+    import_obj: MouseImport, fixed_fields: dict[str, str], mapping: dict[str, str]
+) -> MouseImportJob:
+    job, created = MouseImportJob.objects.get_or_create(
+        mouse_import=import_obj,
+        defaults={
+            "fixed_fields": fixed_fields,
+            "mapping": mapping,
+            "heartbeat": timezone.now(),
+        },
+    )
+    if not created and job.status == "F":
+        job.status = "Q"
+        job.failure = ""
+        job.heartbeat = timezone.now()
+        job.save(update_fields=["status", "failure", "heartbeat"])
+    return job
+
+
+def _is_stale(job: MouseImportJob) -> bool:
+    """Running without a heartbeat, or queued, for `STALE_AFTER`."""
+    return job.status in {"Q", "R"} and _is_old(job.heartbeat or job.created_at)
+
+
+def _is_old(moment) -> bool:
+    return moment < timezone.now() - STALE_AFTER
+
+
+def _submit(run: Callable[[int], None], pk: int) -> None:
+    transaction.on_commit(lambda: _executor.submit(_run_in_thread, run, pk))
+
+
+def _run_in_thread(run: Callable[[int], None], pk: int) -> None:
+    try:
+        run(pk)
+    finally:
+        close_old_connections()
+
+
+def run_import_job(job_id: int) -> None:
+    """Run (or resume) a queued job, unless another worker already has it."""
+    job = _claim(job_id)
+    if job is None:
+        return
+    _attempt(job, _run)
+
+
+def run_batch_job(batch_id: int) -> None:
+    """
+    Write the files of a batch in order, then link their parents. Stops at a
+    file that fails, or that another worker is writing.
+    """
+    imports = MouseImport.objects.filter(batch_id=batch_id).order_by("batch_position")
+    for job_id in imports.values_list("job", flat=True):
+        job = _claim(job_id)
+        if job is None:
+            status = MouseImportJob.objects.values_list("status", flat=True).get(
+                pk=job_id
+            )
+            if status in {"W", "D"}:
+                continue
+            return
+        if not _attempt(job, _write_batch_file):
+            return
+
+    try:
+        _link_batch(batch_id)
+    except _LostClaim:
+        logger.info("Import batch %s was resumed elsewhere", batch_id)
+    except Exception as exc:
+        logger.exception("Import batch %s failed", batch_id)
+        MouseImportJob.objects.filter(
+            mouse_import__batch_id=batch_id, status="W"
+        ).update(status="F", failure=str(exc)[:5000], finished_at=timezone.now())
+
+
+def _attempt(job: MouseImportJob, step: Callable[[MouseImportJob], None]) -> bool:
+    """Run `step` on a claimed job, recording a failure. True if it finished."""
+    try:
+        step(job)
+    except _LostClaim:
+        logger.info("Import job %s was resumed elsewhere", job.pk)
+    except Exception as exc:
+        logger.exception("Import job %s failed", job.pk)
+        MouseImportJob.objects.filter(pk=job.pk, heartbeat=job.heartbeat).update(
+            status="F", failure=str(exc)[:5000], finished_at=timezone.now()
+        )
+    else:
+        return True
+    return False
+
+
+def _claim(job_id: int) -> MouseImportJob | None:
+    now = timezone.now()
+    claimable = Q(status="Q") | Q(status="R", heartbeat__lt=now - STALE_AFTER)
+    if not MouseImportJob.objects.filter(claimable, pk=job_id).update(
+        status="R", heartbeat=now
+    ):
+        return None
+    return MouseImportJob.objects.select_related("mouse_import").get(pk=job_id)
+
+
+def _checkpoint(job: MouseImportJob, **changes) -> None:
+    """Save progress, provided this worker still owns the job."""
+    heartbeat = timezone.now()
+    if not MouseImportJob.objects.filter(pk=job.pk, heartbeat=job.heartbeat).update(
+        heartbeat=heartbeat, **changes
+    ):
+        raise _LostClaim()
+    job.heartbeat = heartbeat
+    for name, value in changes.items():
+        setattr(job, name, value)
+
+
+def _run(job: MouseImportJob) -> None:
+    importer = _importer(job.mouse_import)
+    _write(job, importer)
+    with transaction.atomic():
+        _finish(job, importer)
+    _discard_upload(job.mouse_import)
+
+
+def _write_batch_file(job: MouseImportJob) -> None:
+    _write(job, _importer(job.mouse_import))
+    _checkpoint(job, status="W")
+
+
+def _link_batch(batch_id: int) -> None:
+    with transaction.atomic():
+        batch_jobs = list(
+            MouseImportJob.objects.select_for_update()
+            .filter(mouse_import__batch_id=batch_id)
+            .select_related("mouse_import")
+            .order_by("mouse_import__batch_position")
+        )
+        # Linked already by another worker, or not every file is written.
+        if not batch_jobs or any(job.status != "W" for job in batch_jobs):
+            return
+        importer = _importer(batch_jobs[0].mouse_import)
+        for job in batch_jobs:
+            _finish(job, importer)
+
+    for job in batch_jobs:
+        _discard_upload(job.mouse_import)
+
+
+def _importer(import_obj: MouseImport) -> Importer:
+    return Importer(
+        ImportOptions(
+            project_id=import_obj.project_id,
+            sheet=import_obj.sheet_name or "",
+            range_expr=import_obj.cell_range,
+        )
+    )
+
+
+def _write(job: MouseImportJob, importer: Importer) -> None:
+    """Write the rows of the job's range not written yet, chunk by chunk."""
+    import_obj = job.mouse_import
+    batches = iter_range(
+        import_obj.file.path,
+        import_obj.sheet_name,
+        import_obj.cell_range,
+        original_filename=import_obj.original_filename,
+        mapping=job.mapping,
+        batch_size=CHUNK_ROWS,
+    )
+
+    for dataframe in batches:
+        # Batches written before an interruption are read again, to carry
+        # forward-filled values over, but not written.
+        already_written = job.rows_processed - importer.rows_read
+        if already_written >= len(dataframe):
+            importer.rows_read += len(dataframe)
+            continue
+        if already_written > 0:
+            importer.rows_read += already_written
+            dataframe = dataframe.iloc[already_written:]
+
+        result = ImportResult([], [], [], [])
+        with transaction.atomic():
+            importer.write_batch(dataframe, job.fixed_fields, job.mapping, result)
+            _checkpoint(
+                job,
+                rows_processed=importer.rows_read,
+                created_count=job.created_count + len(result.created_ids),
+                updated_count=job.updated_count + len(result.updated_ids),
+                errors=job.errors
+                + [message for _, message in sorted(result.row_errors)],
+                pending_links=job.pending_links
+                + [list(item) for item in result.pending_self_fk if item[1]],
+            )
+
+
+def _finish(job: MouseImportJob, importer: Importer) -> None:
+    """Link the written mice to their parents and mark the import committed."""
+    import_obj = job.mouse_import
+    errors = list(job.errors)
+    importer.link_parents([tuple(item) for item in job.pending_links], errors)
+
+    import_obj.committed = True
+    import_obj.row_count = job.rows_processed
+    import_obj.error_log = "\n".join(errors)[:5000] if errors else ""
+    import_obj.save(update_fields=["committed", "row_count", "error_log"])
+    _checkpoint(
+        job,
+        status="D",
+        errors=errors,
+        pending_links=[],
+        finished_at=timezone.now(),
+    )
+
+
+def _discard_upload(import_obj: MouseImport) -> None:
+    delete_workbook_cache(import_obj.file.path)
+    import_obj.file.delete()
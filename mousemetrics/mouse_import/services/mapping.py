@@ -1,14 +1,14 @@
 from __future__ import annotations
 
 import logging
-from typing import Any, Iterable, Iterator
+from typing import Any, Iterable, Iterator, Mapping
 
 from django.db.models import Field, ForeignKey
 
 from mouseapp.models import Mouse
 
 from .coercion import normalize_for_field
-from .fks import resolve_fk_instance
+from .fks import ForeignKeyResolver, resolve_fk_instance
 
 logger = logging.getLogger(__name__)
 
@@ -41,8 +41,15 @@ def apply_mapping(
     mapping: dict[str, str],
     fields: Iterable[Field],
     project,
+    resolver: ForeignKeyResolver | None = None,
+    coerced: Mapping[str, Any] | None = None,
 ) -> tuple[dict[str, Any], dict[str, Any], dict[str, Any]]:
-    """Translate a pandas row into model-ready defaults and deferred relations."""
+    """
+    Translate a sheet row into model-ready defaults and deferred relations.
+
+    Foreign keys are looked up through `resolver` when one is given. Values
+    in `coerced`, e.g. a `CoercedRow` of `coerce_frame`, are used as they are.
+    """
 
     defaults: dict[str, Any] = {"project": project}
     self_fk_raw: dict[str, Any] = {}
@@ -59,10 +66,14 @@ def apply_mapping(
         if isinstance(field, ForeignKey):
             if field.remote_field.model is Mouse:
                 self_fk_raw[field.name] = raw_value
+            elif resolver is not None:
+                defaults[field.name] = resolver.resolve(field, raw_value, raw_values)
             else:
                 defaults[field.name] = resolve_fk_instance(
                     field, raw_value, project, raw_values
                 )
+        elif coerced is not None and field.name in coerced:
+            defaults[field.name] = coerced[field.name]
         else:
             defaults[field.name] = normalize_for_field(field, raw_value)
 
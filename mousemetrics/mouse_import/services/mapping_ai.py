@@ -1,11 +1,18 @@
+import hashlib
+import os
 import re
-from collections import Counter
 from dataclasses import dataclass
 from difflib import SequenceMatcher
+from functools import cache
+from pathlib import Path
 from typing import Any
 
+import numpy as np
 import pandas as pd
+from django.conf import settings
+from django.db import transaction
 from django.db.utils import OperationalError, ProgrammingError
+from scipy.optimize import linear_sum_assignment
 
 from mouseapp.models import Mouse
 from mouse_import.models import (
@@ -15,17 +22,21 @@ from mouse_import.models import (
 )
 from mouse_import.targets import get_mouse_import_targets
 
+from .column_profile import ColumnProfile, profile_column, profile_columns
+from .mapping_memory import remembered_fields, update_mapping_memory
+
 import joblib
 from io import BytesIO
 
 _NON_ALNUM = re.compile(r"[^a-z0-9]+", re.I)
 _WS = re.compile(r"\s+")
 
-SAMPLE_VALUES_N = 12
-TOP_VALUES_N = 6
-
 DEFAULT_OPTIONAL_THRESHOLD = 0.45  # slightly conservative
 
+# Added to a required field's scores when assigning columns: more than an
+# optional field's best score, so no optional field displaces a required one.
+_REQUIRED_BONUS = 2.0
+
 FIELD_SYNONYMS: dict[str, list[str]] = {
     "date_of_birth": ["dob", "date of birth", "birth date", "birthday"],
     "tube_number": [
@@ -57,51 +68,72 @@ def _normalise_text(s: str) -> str:
     return s
 
 
-def _seq_ratio(a: str, b: str) -> float:
-    return SequenceMatcher(None, a, b).ratio()
+@cache
+def _header_candidates(field_name: str) -> tuple[str, ...]:
+    """The normalised names, verbose name and synonyms a header may match."""
+    field = Mouse._meta.get_field(field_name)
+    verbose = str(getattr(field, "verbose_name", field_name))
+    names = [field_name, field_name.replace("_", " "), verbose]
+    names.extend(FIELD_SYNONYMS.get(field_name, []))
+    return tuple(dict.fromkeys(n for n in map(_normalise_text, names) if n))
 
 
-def _header_similarity(header: str, field_name: str, verbose: str) -> float:
-    h = _normalise_text(header)
-    if not h:
-        return 0.0
-    candidates = [field_name, field_name.replace("_", " "), verbose]
-    candidates.extend(FIELD_SYNONYMS.get(field_name, []))
-    best = 0.0
-    for c in candidates:
-        c2 = _normalise_text(c)
-        if not c2:
-            continue
-        if h == c2:
-            return 1.0
-        best = max(best, _seq_ratio(h, c2))
-    return float(best)
+def _header_similarity_matrix(headers: list[str], fields: list[str]) -> np.ndarray:
+    """
+    (fields x headers) best `SequenceMatcher` ratio between each header and
+    any of the field's candidates; 1.0 for an exact match, 0.0 for a blank.
+
+    Each distinct (header, candidate) ratio is computed once, however many
+    columns share the header or fields share the candidate.
+    """
+    norm_headers, header_index = np.unique(
+        [_normalise_text(h) for h in headers], return_inverse=True
+    )
+    candidates = [_header_candidates(f) for f in fields]
+    distinct = list(dict.fromkeys(c for names in candidates for c in names))
+    position = {c: i for i, c in enumerate(distinct)}
+
+    ratios = np.zeros((len(distinct), len(norm_headers)))
+    matcher = SequenceMatcher(None)
+    for i, candidate in enumerate(distinct):
+        # SequenceMatcher caches what it learns about its second sequence.
+        matcher.set_seq2(candidate)
+        for j, header in enumerate(norm_headers):
+            if header:
+                matcher.set_seq1(header)
+                ratios[i, j] = matcher.ratio()
+
+    rows = [position[c] for names in candidates for c in names]
+    starts = np.cumsum([0] + [len(names) for names in candidates[:-1]])
+    best = np.maximum.reduceat(ratios[rows], starts, axis=0)
+    return best[:, header_index.ravel()]
 
 
 def _build_column_text(header: str, series: pd.Series) -> str:
-    vals: list[str] = []
-    for v in series.tolist():
-        if v is None:
-            continue
-        s = str(v).strip()
-        if not s:
-            continue
-        vals.append(s)
-        if len(vals) >= 250:
-            break
+    return _column_text(header, profile_column(series))
 
-    sample_vals = vals[:SAMPLE_VALUES_N]
-    top = Counter(vals).most_common(TOP_VALUES_N)
 
+def _column_text(header: str, profile: ColumnProfile) -> str:
     parts = [f"Header: {header}"]
-    if sample_vals:
-        parts.append("Examples: " + " | ".join(sample_vals))
-    if top:
-        parts.append("Top values: " + " | ".join(f"{k} ({n})" for k, n in top))
+    if profile.examples:
+        parts.append("Examples: " + " | ".join(profile.examples))
+    if profile.top_values:
+        parts.append(
+            "Top values: " + " | ".join(f"{k} ({n})" for k, n in profile.top_values)
+        )
     text = "\n".join(parts)
     return text[:8000]  # cap to keep DB size reasonable
 
 
+def _column_texts(df: pd.DataFrame, columns: list[str], import_obj=None) -> list[str]:
+    profiles = profile_columns(df, columns, import_obj=import_obj)
+    return [_column_text(c, profile) for c, profile in zip(columns, profiles)]
+
+
+def hash_column_text(column_text: str) -> str:
+    return hashlib.sha256(column_text.encode()).hexdigest()
+
+
 def record_mapping_examples(
     import_obj: MouseImport,
     df: pd.DataFrame,
@@ -110,22 +142,15 @@ def record_mapping_examples(
     mapping: dict[str, str],
 ) -> int:
     """
-    Store supervised examples from the user's saved mapping.
+    Store supervised examples from the user's saved mapping, replacing the
+    import's earlier ones, and count them in the mapping memory.
     Returns number of examples created.
     Skips blanks/unmapped/fixed/nonexistent columns.
     """
-    try:
-        MouseImportMappingExample.objects.filter(mouse_import=import_obj).delete()
-    except (OperationalError, ProgrammingError):
-        return 0
-
-    if not mapping:
-        return 0
-
     cols = set(str(c) for c in df.columns)
 
-    rows: list[MouseImportMappingExample] = []
-    for target_field, selected in mapping.items():
+    selected_columns: dict[str, str] = {}
+    for target_field, selected in (mapping or {}).items():
         if selected is None:
             continue
         selected_str = str(selected).strip()
@@ -139,9 +164,14 @@ def record_mapping_examples(
         if selected_str not in cols:
             continue
 
-        header = selected_str
-        col_text = _build_column_text(header, df[header])
+        selected_columns[target_field] = selected_str
 
+    headers = list(dict.fromkeys(selected_columns.values()))
+    col_texts = dict(zip(headers, _column_texts(df, headers, import_obj)))
+
+    rows: list[MouseImportMappingExample] = []
+    for target_field, header in selected_columns.items():
+        col_text = col_texts[header]
         rows.append(
             MouseImportMappingExample(
                 mouse_import=import_obj,
@@ -151,33 +181,90 @@ def record_mapping_examples(
                 source_header=header,
                 source_header_norm=_normalise_text(header)[:256],
                 column_text=col_text,
+                column_text_hash=hash_column_text(col_text),
             )
         )
 
-    if not rows:
-        return 0
-
     try:
-        MouseImportMappingExample.objects.bulk_create(rows)
+        with transaction.atomic():
+            previous = MouseImportMappingExample.objects.filter(mouse_import=import_obj)
+            removed = list(previous.values_list("source_header_norm", "target_field"))
+            previous.delete()
+            MouseImportMappingExample.objects.bulk_create(rows)
+            update_mapping_memory(
+                import_obj.project_id,
+                removed,
+                [(row.source_header_norm, row.target_field) for row in rows],
+            )
     except (OperationalError, ProgrammingError):
         return 0
 
     return len(rows)
 
 
+@dataclass(frozen=True)
+class _CachedBundle:
+    version: tuple[Any, int]
+    bundle: dict[str, Any] | None
+
+
+# The bundle last loaded by this process, keyed on the state row's version.
+_bundle_cache: _CachedBundle | None = None
+
+
 def _load_model_bundle() -> dict[str, Any] | None:
     """
     Load trained bundle from DB if available. Safe when tables missing.
+
+    The bundle is unpickled once per trained model: later calls only query
+    the state row's version and reuse it while that is unchanged.
     """
+    global _bundle_cache
+
     try:
-        state = MouseImportMappingModelState.objects.filter(id=1).first()
+        version = (
+            MouseImportMappingModelState.objects.filter(id=1)
+            .values_list("updated_at", "trained_up_to_example_id")
+            .first()
+        )
     except (OperationalError, ProgrammingError):
         return None
 
-    if not state or not state.model_blob:
+    if version is None:
         return None
-
-    return joblib.load(BytesIO(state.model_blob))
+    cached = _bundle_cache
+    if cached is not None and cached.version == version:
+        return cached.bundle
+
+    blob = (
+        MouseImportMappingModelState.objects.filter(id=1)
+        .values_list("model_blob", flat=True)
+        .first()
+    )
+    bundle = _unpickle_bundle(bytes(blob), version) if blob else None
+    _bundle_cache = _CachedBundle(version, bundle)
+    return bundle
+
+
+def _unpickle_bundle(blob: bytes, version: tuple[Any, int]) -> dict[str, Any]:
+    mmap_dir = getattr(settings, "MAPPING_MODEL_MMAP_DIR", None)
+    if not mmap_dir:
+        return joblib.load(BytesIO(blob))
+
+    # Processes loading the same file memory-map its arrays, sharing pages.
+    # A model is only stored again once trained on newer examples.
+    _, trained_up_to = version
+    path = Path(mmap_dir) / f"mapping-model-{trained_up_to}.joblib"
+    if not path.exists() or path.stat().st_size != len(blob):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f".{path.name}.{os.getpid()}")
+        partial.write_bytes(blob)
+        os.replace(partial, path)
+        # Processes still mapping an older model keep it until they reload.
+        for old in path.parent.glob("mapping-model-*.joblib"):
+            if old != path:
+                old.unlink(missing_ok=True)
+    return joblib.load(path, mmap_mode="r")
 
 
 @dataclass(frozen=True)
@@ -186,17 +273,47 @@ class Suggestion:
     score: float
 
 
+def _predicted_scores(
+    df: pd.DataFrame, columns: list[str], fields: list[str], import_obj=None
+) -> np.ndarray:
+    """(fields x columns) scores from the trained model and header similarity."""
+    # Build column documents
+    col_texts = _column_texts(df, columns, import_obj)
+
+    # Use trained model if present, else fallback to header similarity only
+    bundle = _load_model_bundle()
+    similarity = _header_similarity_matrix(columns, fields)  # (F, C)
+    if bundle is None:
+        return similarity
+
+    classes = list(bundle["classes"])
+    class_index = {c: i for i, c in enumerate(classes)}
+
+    X = bundle["vectorizer"].transform(col_texts)
+    probs = bundle["clf"].predict_proba(X)  # (C, n_classes)
+
+    # Fields the model does not know score on their header alone.
+    known = np.array([f in class_index for f in fields])
+    base = np.zeros((len(fields), len(columns)))
+    base[known] = probs[:, [class_index[f] for f in np.array(fields)[known]]].T
+    # small header boost
+    return np.minimum(1.0, base + 0.15 * similarity)
+
+
 def suggest_mapping_for_dataframe(
     df: pd.DataFrame,
     project,
     *,
     optional_threshold: float = DEFAULT_OPTIONAL_THRESHOLD,
     top_k: int = 3,
+    import_obj: MouseImport | None = None,
 ) -> tuple[dict[str, str], dict[str, list[Suggestion]]]:
     """
     Returns:
       - initial dict for ColumnMappingForm: {"map_<field>": "<column>"}
       - debug suggestions per field
+
+    Column profiles are cached for `import_obj` when it is given.
     """
     required, optional, _choices = get_mouse_import_targets(project)
     required_fields = [f for f, _ in required]
@@ -207,71 +324,47 @@ def suggest_mapping_for_dataframe(
     if not fields or not columns:
         return {}, {}
 
-    # Build column documents
-    col_texts = [_build_column_text(c, df[c]) for c in columns]
-
-    # Use trained model if present, else fallback to header similarity only
-    bundle = _load_model_bundle()
-    scores = [[0.0 for _ in columns] for _ in fields]
-
-    if bundle is not None:
-        vectorizer = bundle["vectorizer"]
-        clf = bundle["clf"]
-        classes = list(bundle["classes"])
-        class_index = {c: i for i, c in enumerate(classes)}
-
-        X = vectorizer.transform(col_texts)
-        probs = clf.predict_proba(X)  # (C, n_classes)
-
-        for fi, field_name in enumerate(fields):
-            idx = class_index.get(field_name)
-            for ci in range(len(columns)):
-                base = float(probs[ci, idx]) if idx is not None else 0.0
-                # small header boost
-                field = Mouse._meta.get_field(field_name)
-                verbose = str(getattr(field, "verbose_name", field_name))
-                base += 0.15 * _header_similarity(columns[ci], field_name, verbose)
-                scores[fi][ci] = min(1.0, base)
-    else:
-        for fi, field_name in enumerate(fields):
-            field = Mouse._meta.get_field(field_name)
-            verbose = str(getattr(field, "verbose_name", field_name))
-            for ci, col in enumerate(columns):
-                scores[fi][ci] = _header_similarity(col, field_name, verbose)
-
-    suggestions: dict[str, list[Suggestion]] = {}
-    for fi, field_name in enumerate(fields):
-        ranked = sorted(
-            [
-                Suggestion(column=columns[ci], score=float(scores[fi][ci]))
-                for ci in range(len(columns))
-            ],
-            key=lambda s: s.score,
-            reverse=True,
+    # Headers mapped before score from the mapping memory; only the others
+    # go through the model and fuzzy header matching.
+    norm_headers = [_normalise_text(c) for c in columns]
+    memory = remembered_fields(getattr(project, "pk", None), norm_headers)
+    field_index = {f: i for i, f in enumerate(fields)}
+
+    scores = np.zeros((len(fields), len(columns)))
+    unseen = []
+    for ci, header in enumerate(norm_headers):
+        if header not in memory:
+            unseen.append(ci)
+            continue
+        for field_name, share in memory[header].items():
+            if (fi := field_index.get(field_name)) is not None:
+                scores[fi, ci] = share
+    if unseen:
+        scores[:, unseen] = _predicted_scores(
+            df, [columns[ci] for ci in unseen], fields, import_obj
         )
-        suggestions[field_name] = ranked[: max(1, top_k)]
 
-    # Greedy one-to-one assignment (required first)
-    assigned: dict[str, str] = {}
-    used_cols: set[str] = set()
-
-    pairs: list[tuple[int, float, str, str]] = []
+    suggestions: dict[str, list[Suggestion]] = {}
+    ranked = np.argsort(-scores, axis=1, kind="stable")[:, : max(1, top_k)]
     for fi, field_name in enumerate(fields):
-        is_req = 1 if field_name in required_fields else 0
-        for ci, col in enumerate(columns):
-            pairs.append((is_req, float(scores[fi][ci]), field_name, col))
-
-    pairs.sort(key=lambda t: (t[0], t[1]), reverse=True)
-
-    for is_req, score, field_name, col in pairs:
-        if field_name in assigned:
-            continue
-        if col in used_cols:
-            continue
-        if field_name in optional_fields and score < optional_threshold:
-            continue
-        assigned[field_name] = col
-        used_cols.add(col)
+        suggestions[field_name] = [
+            Suggestion(column=columns[ci], score=float(scores[fi, ci]))
+            for ci in ranked[fi]
+        ]
+
+    # One-to-one assignment maximising the total score. Required fields are
+    # worth more than any optional one, so they are placed first; optional
+    # fields below the threshold are worth nothing and are left unmapped.
+    is_required = np.array([f in required_fields for f in fields])
+    value = np.where(is_required[:, None] | (scores >= optional_threshold), scores, 0)
+    value[is_required] += _REQUIRED_BONUS
+    field_idx, col_idx = linear_sum_assignment(value, maximize=True)
+
+    assigned: dict[str, str] = {
+        fields[fi]: columns[ci]
+        for fi, ci in zip(field_idx, col_idx)
+        if is_required[fi] or scores[fi, ci] >= optional_threshold
+    }
 
     for f in required_fields:
         if f not in assigned and suggestions.get(f):
@@ -0,0 +1,79 @@
+"""
+Frequency table of the fields each normalised header has been mapped to.
+
+A header the project has mapped before is suggested from its own mappings,
+one seen only in other projects from everyone's; the model and fuzzy
+header matching score the rest. `MouseImportMappingMemory` holds the
+counts and is updated by `record_mapping_examples` as examples change.
+"""
+
+from __future__ import annotations
+
+from collections import Counter, defaultdict
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.utils import OperationalError, ProgrammingError
+
+from mouse_import.models import MouseImportMappingMemory
+
+# (source_header_norm, target_field)
+HeaderField = tuple[str, str]
+
+
+def update_mapping_memory(
+    project_id: int, removed: Iterable[HeaderField], added: Iterable[HeaderField]
+) -> None:
+    """Count `added` mappings and uncount `removed` ones, in the project and overall."""
+    changes = Counter(pair for pair in added if pair[0])
+    changes.subtract(pair for pair in removed if pair[0])
+
+    with transaction.atomic():
+        for (header, field), n in sorted(changes.items()):
+            if not n:
+                continue
+            for scope in (project_id, None):
+                row, _ = MouseImportMappingMemory.objects.get_or_create(
+                    project_id=scope, source_header_norm=header, target_field=field
+                )
+                MouseImportMappingMemory.objects.filter(pk=row.pk).update(
+                    count=F("count") + n
+                )
+
+
+def remembered_fields(
+    project_id: int | None, headers: Iterable[str]
+) -> dict[str, dict[str, float]]:
+    """
+    For each header that has been mapped before, the share of its mappings
+    that went to each field: from the project's mappings where it has any,
+    else from every project's.
+    """
+    headers = {h for h in headers if h}
+    if not headers:
+        return {}
+    scope = Q(project__isnull=True)
+    if project_id is not None:
+        scope |= Q(project_id=project_id)
+    try:
+        rows = list(
+            MouseImportMappingMemory.objects.filter(
+                scope, source_header_norm__in=headers, count__gt=0
+            ).values_list("project_id", "source_header_norm", "target_field", "count")
+        )
+    except (OperationalError, ProgrammingError):
+        return {}
+
+    own: dict[str, dict[str, int]] = defaultdict(dict)
+    shared: dict[str, dict[str, int]] = defaultdict(dict)
+    for row_project, header, field, count in rows:
+        (shared if row_project is None else own)[header][field] = count
+
+    memory = {}
+    for header in headers:
+        counts = own.get(header) or shared.get(header)
+        if counts:
+            total = sum(counts.values())
+            memory[header] = {field: n / total for field, n in counts.items()}
+    return memory
@@ -1,16 +1,38 @@
+import logging
+from collections import defaultdict
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from io import BytesIO
 
-from django.db import transaction
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, OuterRef, QuerySet
 from django.db.utils import OperationalError, ProgrammingError
+from django.utils import timezone
 
 from mouse_import.models import MouseImportMappingExample, MouseImportMappingModelState
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
 import joblib
 from dataclasses import dataclass
 from enum import Enum
-from typing import Optional
+from typing import Any, Optional
+
+from .mapping import importable_fields
+
+logger = logging.getLogger(__name__)
+
+# Examples vectorised at once, and passes of `partial_fit` over each batch.
+TRAIN_BATCH_SIZE = 1000
+TRAIN_EPOCHS = 5
+
+HASH_FEATURES = 2**15
+
+# One thread, so a process never trains two models at once.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mapping-train")
 
 
 # could have this in a sepeerate module if we add more mapping-related services, but for now it can live here with the training logic
@@ -38,6 +60,8 @@ class TrainOutcome:
     n_examples: Optional[int] = None
     new_examples: Optional[int] = None
     threshold: Optional[int] = None
+    # distinct examples sampled for this run (duplicates and over-cap skipped)
+    n_fitted: Optional[int] = None
 
     # for failures
     error: Optional[str] = None
@@ -51,11 +75,29 @@ class TrainOutcome:
         return None
 
 
+def train_in_background(*, min_new_examples: int = 10) -> None:
+    """Run `maybe_train_mapping_model` in a worker thread once the request commits."""
+    transaction.on_commit(lambda: _executor.submit(_train_in_thread, min_new_examples))
+
+
+def _train_in_thread(min_new_examples: int) -> None:
+    try:
+        outcome = maybe_train_mapping_model(min_new_examples=min_new_examples)
+        if msg := outcome.user_message():
+            failed = outcome.status == TrainStatus.FAILED
+            logger.log(
+                logging.ERROR if failed else logging.INFO, "Mapping model: %s", msg
+            )
+    finally:
+        close_old_connections()
+
+
 def maybe_train_mapping_model(*, min_new_examples: int = 10) -> TrainOutcome:
     """
     Train when >=min_new_examples new examples exist since last training.
 
-    This is called synchronously after saving mappings.
+    The model is trained incrementally: a stored model is only shown the
+    examples added since it was trained, in batches of `TRAIN_BATCH_SIZE`.
     Uses a DB lock on the singleton state row to avoid concurrent training.
     """
     try:
@@ -96,51 +138,55 @@ def maybe_train_mapping_model(*, min_new_examples: int = 10) -> TrainOutcome:
             )
 
         # Mark in-progress and release lock (unblocks other operations)
+        # `updated_at` is left alone: it dates the stored model, which
+        # loaders compare to know when to read it again.
         state.training_in_progress = True
-        state.save(update_fields=["training_in_progress", "updated_at"])
+        state.save(update_fields=["training_in_progress"])
 
     # Train outside the lock/transaction
     try:
-        qs = MouseImportMappingExample.objects.order_by("id")
-        texts = [e.column_text for e in qs if e.column_text]
-        labels = [e.target_field for e in qs if e.column_text]
-
-        if len(set(labels)) < 2:
-            _finish_training(latest_id=int(latest.id), n_examples=len(texts), blob=None)
-            return TrainOutcome(
-                status=TrainStatus.SKIPPED,
-                skip_reason=SkipReason.NEED_2_CLASSES,
-                latest_id=int(latest.id),
-                n_examples=len(texts),
-            )
-
-        vectorizer = TfidfVectorizer(
-            analyzer="char_wb",
-            ngram_range=(3, 5),
-            min_df=1,
-            max_features=40000,
-        )
-        X = vectorizer.fit_transform(texts)
-
-        clf = LogisticRegression(
-            max_iter=2000,
-            solver="lbfgs",
-            class_weight="balanced",
+        classes = _target_classes()
+        since = _age_cutoff()
+        bundle = _load_trained_bundle(state.model_blob, classes, since)
+        if bundle is None:
+            # No model to build on: fit a new one on every example so far.
+            trained_up_to, n_before = 0, 0
+            examples = _examples(0, int(latest.id), classes, since)
+            if examples.order_by().values("target_field").distinct().count() < 2:
+                n_examples = examples.count()
+                _finish_training(
+                    latest_id=int(latest.id), n_examples=n_examples, blob=None
+                )
+                return TrainOutcome(
+                    status=TrainStatus.SKIPPED,
+                    skip_reason=SkipReason.NEED_2_CLASSES,
+                    latest_id=int(latest.id),
+                    n_examples=n_examples,
+                )
+            bundle = _new_bundle(classes)
+        else:
+            trained_up_to = int(state.trained_up_to_example_id or 0)
+            n_before = int(state.n_examples or 0)
+
+        examples = _examples(trained_up_to, int(latest.id), classes, since)
+        n_new = examples.count()
+        n_fitted = _partial_fit(
+            bundle, _distinct(examples, since), classes, seed=trained_up_to
         )
-        clf.fit(X, labels)
-
-        bundle = {"vectorizer": vectorizer, "clf": clf, "classes": list(clf.classes_)}
 
         buf = BytesIO()
         joblib.dump(bundle, buf)
         blob = buf.getvalue()
 
-        _finish_training(latest_id=int(latest.id), n_examples=len(texts), blob=blob)
+        _finish_training(
+            latest_id=int(latest.id), n_examples=n_before + n_new, blob=blob
+        )
 
         return TrainOutcome(
             status=TrainStatus.TRAINED,
             latest_id=int(latest.id),
-            n_examples=len(texts),
+            n_examples=n_before + n_new,
+            n_fitted=n_fitted,
         )
 
     except Exception as exc:
@@ -153,6 +199,147 @@ def maybe_train_mapping_model(*, min_new_examples: int = 10) -> TrainOutcome:
         )
 
 
+def _target_classes() -> list[str]:
+    """Every field a column can be mapped to; the model's classes are fixed."""
+    return sorted(field.name for field in importable_fields())
+
+
+def _age_cutoff() -> datetime | None:
+    max_age_days = getattr(settings, "TRAIN_MAX_AGE_DAYS", None)
+    if max_age_days is None:
+        return None
+    return timezone.now() - timedelta(days=max_age_days)
+
+
+def _examples(
+    after_id: int, up_to_id: int, classes: list[str], since: datetime | None
+) -> QuerySet[MouseImportMappingExample]:
+    examples = MouseImportMappingExample.objects.filter(
+        id__gt=after_id, id__lte=up_to_id, target_field__in=classes
+    ).exclude(column_text="")
+    if since is not None:
+        examples = examples.filter(created_at__gte=since)
+    return examples
+
+
+def _distinct(
+    examples: QuerySet[MouseImportMappingExample], since: datetime | None
+) -> QuerySet[MouseImportMappingExample]:
+    """
+    `examples` without repeats of an earlier example, e.g. from importing the
+    same template again: the same column text mapped to the same field.
+    """
+    earlier = MouseImportMappingExample.objects.filter(
+        column_text_hash=OuterRef("column_text_hash"),
+        target_field=OuterRef("target_field"),
+        id__lt=OuterRef("id"),
+    ).exclude(column_text_hash="")
+    if since is not None:
+        earlier = earlier.filter(created_at__gte=since)
+    return examples.exclude(Exists(earlier))
+
+
+def _new_bundle(classes: list[str]) -> dict[str, Any]:
+    vectorizer = HashingVectorizer(
+        analyzer="char_wb",
+        ngram_range=(3, 5),
+        n_features=HASH_FEATURES,
+        alternate_sign=False,
+    )
+    # log_loss, so suggestions can keep ranking columns by predict_proba.
+    clf = SGDClassifier(loss="log_loss", alpha=1e-4, random_state=0)
+    return {
+        "vectorizer": vectorizer,
+        "clf": clf,
+        "classes": classes,
+        # Distinct examples of each class offered to the model so far.
+        "seen": {},
+        "refit_at": timezone.now(),
+    }
+
+
+def _load_trained_bundle(
+    blob: bytes | None, classes: list[str], since: datetime | None
+) -> dict[str, Any] | None:
+    """
+    The stored model, if it can be trained further: models from before
+    incremental training, trained for other target fields, or last refit
+    before `since`, are refit.
+    """
+    if not blob:
+        return None
+    bundle = joblib.load(BytesIO(bytes(blob)))
+    if not isinstance(bundle.get("vectorizer"), HashingVectorizer):
+        return None
+    if not isinstance(bundle.get("clf"), SGDClassifier):
+        return None
+    if list(bundle["classes"]) != classes or "seen" not in bundle:
+        return None
+    if since is not None and bundle["refit_at"] < since:
+        return None
+    return bundle
+
+
+def _partial_fit(
+    bundle: dict[str, Any],
+    examples: QuerySet[MouseImportMappingExample],
+    classes: list[str],
+    *,
+    seed: int,
+) -> int:
+    """
+    Train `bundle` on a sample of `examples`, at most `TRAIN_MAX_PER_FIELD`
+    of each class. Return how many it was trained on.
+    """
+    rng = np.random.default_rng(seed)
+    rows = (
+        examples.order_by("id")
+        .values_list("column_text", "target_field")
+        .iterator(TRAIN_BATCH_SIZE)
+    )
+    sample = _sample_per_class(rows, bundle["seen"], settings.TRAIN_MAX_PER_FIELD, rng)
+    if not sample:
+        return 0
+
+    vectorizer, clf = bundle["vectorizer"], bundle["clf"]
+    texts, labels = map(np.array, zip(*sample))
+    shuffled = rng.permutation(len(sample))
+    for start in range(0, len(sample), TRAIN_BATCH_SIZE):
+        batch = shuffled[start : start + TRAIN_BATCH_SIZE]
+        X, y = vectorizer.transform(texts[batch]), labels[batch]
+        for _ in range(TRAIN_EPOCHS):
+            order = rng.permutation(len(batch))
+            clf.partial_fit(X[order], y[order], classes=classes)
+    return len(sample)
+
+
+def _sample_per_class(
+    rows: Iterable[tuple[str, str]],
+    seen: dict[str, int],
+    cap: int,
+    rng: np.random.Generator,
+) -> list[tuple[str, str]]:
+    """
+    Reservoir-sample (Algorithm R) up to `cap` rows of each class.
+
+    `seen` counts the rows of each class offered in earlier runs and is
+    updated, so the k-th row of a class is kept with chance cap/k whichever
+    run it arrives in; the model's training per class stays bounded however
+    many examples accumulate.
+    """
+    reservoirs: dict[str, list[tuple[str, str]]] = defaultdict(list)
+    for row in rows:
+        label = row[1]
+        k = seen[label] = seen.get(label, 0) + 1
+        reservoir = reservoirs[label]
+        slot = len(reservoir) if k <= cap else int(rng.integers(k))
+        if slot < len(reservoir):
+            reservoir[slot] = row
+        elif slot < cap:
+            reservoir.append(row)
+    return [row for reservoir in reservoirs.values() for row in reservoir]
+
+
 def _finish_training(
     *,
     latest_id: int | None,
@@ -170,5 +357,6 @@ def _finish_training(
             state.trained_up_to_example_id = latest_id
             state.n_examples = n_examples
             state.model_blob = blob
-
-        state.save()
+            state.save()
+        else:
+            state.save(update_fields=["training_in_progress"])
@@ -0,0 +1,52 @@
+"""
+Server-side store for the preview frame of the import wizard.
+
+The frame is kept in the cache as one NumPy array per column, and the
+session only holds the token naming it. Entries expire after
+`PREVIEW_TIMEOUT`; an expired preview is read from the upload again.
+"""
+
+from __future__ import annotations
+
+import uuid
+
+import pandas as pd
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+
+cache = ConnectionProxy(caches, "import_previews")
+
+PREVIEW_TIMEOUT = 60 * 60 * 24
+
+
+def _key(import_id: int, token: str) -> str:
+    return f"mouse_import:preview:{import_id}:{token}"
+
+
+def save_preview(import_id: int, df: pd.DataFrame) -> str:
+    """Store `df` and return the token to keep in the session."""
+    token = uuid.uuid4().hex
+    frame = {
+        "columns": list(df.columns),
+        "values": [df.iloc[:, i].to_numpy(dtype=object) for i in range(df.shape[1])],
+    }
+    cache.set(_key(import_id, token), frame, PREVIEW_TIMEOUT)
+    return token
+
+
+def load_preview(import_id: int, token: str) -> pd.DataFrame | None:
+    frame = cache.get(_key(import_id, token))
+    if frame is None:
+        return None
+    df = pd.DataFrame(
+        dict(enumerate(frame["values"])),
+        index=pd.RangeIndex(len(frame["values"][0]) if frame["values"] else 0),
+        dtype=object,
+    )
+    df.columns = pd.Index(frame["columns"], dtype=object)
+    return df
+
+
+def discard_preview(import_id: int, token: str | None) -> None:
+    if token is not None:
+        cache.delete(_key(import_id, token))
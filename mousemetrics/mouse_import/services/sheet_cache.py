@@ -0,0 +1,204 @@
+"""
+Parsed snapshots of uploaded workbooks.
+
+Reading an .xlsx means unzipping and parsing its XML, and every step of the
+import wizard reads the upload again. `build_workbook_cache` parses each sheet
+once into NumPy arrays of cell values, stored in a directory next to the
+upload; `io` slices those while they match the file.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+from collections.abc import Iterator
+from contextlib import closing
+from dataclasses import dataclass
+from itertools import batched
+from os import PathLike
+from pathlib import Path
+
+import numpy as np
+from openpyxl import load_workbook
+from openpyxl.worksheet._read_only import ReadOnlyWorksheet
+
+logger = logging.getLogger(__name__)
+
+# Rows per stored array, so a range is read without loading its whole sheet.
+SNAPSHOT_CHUNK_ROWS = 2000
+
+# Largest row number Excel allows; reading up to it reads every row there is.
+_EXCEL_MAX_ROW = 1_048_576
+
+_MANIFEST = "manifest.json"
+_VERSION = 1
+
+
+@dataclass(frozen=True)
+class SheetSnapshot:
+    """The cells of one worksheet, from A1 to its last row and column."""
+
+    directory: Path
+    index: int
+    rows: int
+    chunks: int
+
+    def iter_range(
+        self, min_col: int, min_row: int, max_col: int, max_row: int, batch_size: int
+    ) -> Iterator[list[list]]:
+        """
+        Rows `min_row`..`max_row` of columns `min_col`..`max_col` (1-based,
+        inclusive) in batches, as openpyxl's read-only `iter_rows` returns
+        them: empty cells are None and rows past the sheet's last are left out.
+        """
+        width = max_col - min_col + 1
+        last_row = min(max_row, self.rows)
+
+        def rows() -> Iterator[list]:
+            for chunk in range(self.chunks):
+                first = chunk * SNAPSHOT_CHUNK_ROWS + 1
+                if first + SNAPSHOT_CHUNK_ROWS <= min_row:
+                    continue
+                if first > last_row:
+                    return
+                values = np.load(
+                    _chunk_path(self.directory, self.index, chunk), allow_pickle=True
+                )[max(min_row - first, 0) : last_row - first + 1, min_col - 1 : max_col]
+                # Chunks are only as wide as their own widest row.
+                padding = [None] * (width - values.shape[1])
+                for row in values.tolist():
+                    yield row + padding
+
+        if width > 0:
+            yield from (list(batch) for batch in batched(rows(), batch_size))
+
+
+@dataclass(frozen=True)
+class WorkbookCache:
+    sheet_names: list[str]
+    active: str | None
+    sheets: dict[str, SheetSnapshot]
+
+    def sheet(self, name: str | None) -> SheetSnapshot | None:
+        """The named worksheet, or the active one when `name` is blank."""
+        return self.sheets.get(name or self.active or "")
+
+
+def cache_directory(file_path: PathLike) -> Path:
+    path = Path(file_path)
+    return path.with_name(f"{path.name}.sheets")
+
+
+def load_workbook_cache(file_path: PathLike) -> WorkbookCache | None:
+    """The workbook's cache, or None if there is none for its current contents."""
+    directory = cache_directory(file_path)
+    try:
+        manifest = json.loads((directory / _MANIFEST).read_text())
+        if manifest["version"] != _VERSION or manifest["source"] != _fingerprint(
+            file_path
+        ):
+            return None
+    except (OSError, ValueError, KeyError):
+        return None
+
+    return WorkbookCache(
+        sheet_names=manifest["sheet_names"],
+        active=manifest["active"],
+        sheets={
+            title: SheetSnapshot(directory=directory, **sheet)
+            for title, sheet in manifest["sheets"].items()
+        },
+    )
+
+
+def build_workbook_cache(file_path: PathLike) -> WorkbookCache:
+    """Parse every worksheet of an Excel workbook and store the snapshots."""
+    directory = cache_directory(file_path)
+    building = Path(
+        tempfile.mkdtemp(dir=directory.parent, prefix=f".{directory.name}-")
+    )
+    try:
+        source = _fingerprint(file_path)
+        with closing(
+            load_workbook(filename=file_path, data_only=True, read_only=True)
+        ) as workbook:
+            sheets = {
+                worksheet.title: _snapshot_sheet(worksheet, building, index)
+                for index, worksheet in enumerate(workbook.worksheets)
+            }
+            active = workbook.active.title if workbook.active is not None else None
+            manifest = {
+                "version": _VERSION,
+                "source": source,
+                "sheet_names": list(workbook.sheetnames),
+                "active": active,
+                "sheets": sheets,
+            }
+        (building / _MANIFEST).write_text(json.dumps(manifest))
+
+        shutil.rmtree(directory, ignore_errors=True)
+        try:
+            os.rename(building, directory)
+        except OSError:
+            # Built concurrently by another request; keep theirs.
+            pass
+    finally:
+        shutil.rmtree(building, ignore_errors=True)
+
+    cache = load_workbook_cache(file_path)
+    if cache is None:
+        raise RuntimeError(f"Could not cache workbook {file_path}")
+    return cache
+
+
+def ensure_workbook_cache(
+    file_path: PathLike, *, original_filename: str | None = None
+) -> WorkbookCache | None:
+    """
+    The workbook's cache, building it if needed. CSV files, and workbooks that
+    fail to parse, have none: `io` then reads the file itself.
+    """
+    name = original_filename or str(file_path)
+    if Path(name).suffix.lower() == ".csv":
+        return None
+    if (cache := load_workbook_cache(file_path)) is not None:
+        return cache
+    try:
+        return build_workbook_cache(file_path)
+    except Exception as exc:
+        logger.warning("Could not cache workbook", exc_info=exc)
+        return None
+
+
+def delete_workbook_cache(file_path: PathLike) -> None:
+    shutil.rmtree(cache_directory(file_path), ignore_errors=True)
+
+
+def _snapshot_sheet(worksheet: ReadOnlyWorksheet, directory: Path, index: int) -> dict:
+    # Stored dimensions can be missing or wrong; without them each row is as
+    # wide as its last cell.
+    worksheet.reset_dimensions()
+    rows = worksheet.iter_rows(min_row=1, max_row=_EXCEL_MAX_ROW, values_only=True)
+
+    n_rows = n_chunks = 0
+    for chunk in batched(rows, SNAPSHOT_CHUNK_ROWS):
+        width = max(map(len, chunk))
+        values = np.full((len(chunk), width), None, dtype=object)
+        for position, row in enumerate(chunk):
+            values[position, : len(row)] = row
+        np.save(_chunk_path(directory, index, n_chunks), values, allow_pickle=True)
+        n_rows += len(chunk)
+        n_chunks += 1
+    return {"index": index, "rows": n_rows, "chunks": n_chunks}
+
+
+def _chunk_path(directory: Path, index: int, chunk: int) -> Path:
+    return directory / f"{index}-{chunk}.npy"
+
+
+def _fingerprint(file_path: PathLike) -> dict:
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
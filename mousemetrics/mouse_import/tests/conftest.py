@@ -29,6 +29,17 @@ def authed_client(client, user):
 @pytest.fixture
 def media_root(settings, tmp_path):
     settings.MEDIA_ROOT = tmp_path
+    # The storage's location is read from STORAGES, fixed when settings load.
+    settings.STORAGES = {
+        **settings.STORAGES,
+        "default": {
+            **settings.STORAGES["default"],
+            "OPTIONS": {
+                **settings.STORAGES["default"]["OPTIONS"],
+                "location": tmp_path,
+            },
+        },
+    }
     return tmp_path
 
 
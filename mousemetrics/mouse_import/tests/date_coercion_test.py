@@ -3,7 +3,8 @@ import datetime as dt
 import pandas as pd
 import pytest
 
-from mouse_import.services.coercion import to_date
+from mouseapp.models import Mouse
+from mouse_import.services.coercion import coerce_column, normalize_for_field, to_date
 
 from mouse_import.services.importer import Importer, ImportOptions
 
@@ -65,3 +66,75 @@ def test_to_date_parses_realistic_inputs(raw, expected):
 )
 def test_to_date_handles_empty_inputs(raw):
     assert to_date(raw) is None
+
+
+@pytest.mark.parametrize("field_name", ["tube_number", "date_of_birth", "sex", "notes"])
+def test_column_coercion_matches_cell_by_cell(field_name):
+    field = Mouse._meta.get_field(field_name)
+    cells = [
+        "12",
+        "#281",
+        " 12.7 ",
+        "1_000",
+        "abc",
+        "",
+        "01/02/2024",
+        "1970-01-01",
+        "1970-01-01 13:45:00",
+        "2020-02-30",
+        "f",
+        "Male",
+        dt.date(2020, 2, 3),
+        5,
+        None,
+    ]
+
+    column = coerce_column(field, pd.Series(cells, dtype=object))
+
+    for position, cell in enumerate(cells):
+        if cell is None:
+            continue
+        try:
+            expected = normalize_for_field(field, cell)
+        except ValueError as exc:
+            with pytest.raises(ValueError, match=str(exc)):
+                column.value(position)
+        else:
+            assert column.value(position) == expected
+
+
+def test_slash_dates_are_read_day_first_whatever_the_first_cell():
+    field = Mouse._meta.get_field("date_of_birth")
+    cells = ["12/13/2024", "01/02/2024", "05/06/2024", "1/2/24", " 31/12/99 "]
+
+    column = coerce_column(field, pd.Series(cells, dtype=object))
+
+    assert [column.value(i) for i in range(len(cells))] == [
+        to_date(cell) for cell in cells
+    ]
+    assert column.value(1) == dt.date(2024, 2, 1)
+    assert column.value(2) == dt.date(2024, 6, 5)
+
+
+@pytest.mark.django_db
+def test_import_reports_rows_whose_dates_fail_to_coerce(project):
+    importer = Importer(
+        ImportOptions(project_id=project.id, sheet="", range_expr="A1:C4")
+    )
+    df = pd.DataFrame(
+        [
+            {"Tube ID": "1", "Strain": "S1", "DOB": "01/02/2024"},
+            {"Tube ID": "2", "Strain": "S1", "DOB": "2020-02-30"},
+            {"Tube ID": "3", "Strain": "S1", "DOB": "not a date"},
+        ]
+    )
+    fixed = {"sex": "M", "box": "A1"}
+    mapping = {"tube_number": "Tube ID", "strain": "Strain", "date_of_birth": "DOB"}
+
+    created_ids, _, errors = importer.run(df, fixed, mapping)
+
+    assert Mouse.objects.get(pk=created_ids[0]).date_of_birth == dt.date(2024, 2, 1)
+    assert errors == [
+        "Row 2: error: day is out of range for month",
+        "Row 3: missing/invalid required fields: date_of_birth",
+    ]
@@ -1,7 +1,11 @@
 import pytest
+from django.core.cache import caches
 from django.urls import reverse
 
+from mouse_import import views
 from mouse_import.models import MouseImport
+from mouse_import.services.preview_store import load_preview
+from mouse_import.services.sheet_cache import load_workbook_cache
 
 
 pytestmark = pytest.mark.django_db
@@ -51,6 +55,10 @@ def test_import_form_upload_redirects_to_range_step(
     assert import_obj.sheet_name == ""
     assert import_obj.cell_range == ""
     assert import_obj.uploaded_by is not None
+    assert load_workbook_cache(import_obj.file.path).sheet_names == [
+        "Sheet1",
+        "Sheet2",
+    ]
 
 
 def test_import_select_range_get_renders_second_step(authed_client, import_obj):
@@ -197,3 +205,36 @@ def test_import_range_preview_blank_range_uses_default_preview(
     }
     assert len(payload["columns"]) == 12
     assert len(payload["rows"]) == 10
+
+
+def test_import_preview_keeps_only_a_reference_in_the_session(
+    authed_client, import_obj, monkeypatch
+):
+    import_obj.sheet_name = "Sheet1"
+    import_obj.cell_range = "A1:J3"
+    import_obj.save()
+    url = reverse("mouse_import:import_preview", kwargs={"id": import_obj.id})
+
+    first = authed_client.get(url)
+    token = authed_client.session[f"import_df_{import_obj.id}"]
+    stored = load_preview(import_obj.id, token)
+    # Other stores are culled on their own and never take the preview along.
+    caches["family_tree"].clear()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the range was read again")
+
+    read_range = views.read_range
+    monkeypatch.setattr(views, "read_range", fail)
+    second = authed_client.get(url)
+
+    assert first.status_code == second.status_code == 200
+    assert len(token) == 32
+    expected = read_range(import_obj.file.path, "Sheet1", "A1:J3")
+    assert stored.to_dict(orient="records") == expected.to_dict(orient="records")
+
+    authed_client.post(
+        reverse("mouse_import:import_select_range", kwargs={"id": import_obj.id}),
+        {"sheet_name": "Sheet1", "cell_range": "A1:B3"},
+    )
+    assert load_preview(import_obj.id, token) is None
@@ -0,0 +1,348 @@
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+
+from mouseapp.models import Mouse
+from mouse_import.models import MouseImport, MouseImportBatch, MouseImportJob
+from mouse_import import views
+from mouse_import.services import batches, jobs
+from mouse_import.services.importer import Importer
+
+
+pytestmark = pytest.mark.django_db
+
+MAPPING = {
+    "box": "Box",
+    "tube_number": "Tube ID",
+    "date_of_birth": "DOB",
+    "sex": "Sex",
+    "strain": "Strain",
+    "father": "Father",
+}
+
+
+@pytest.fixture
+def import_obj(project, user, media_root):
+    lines = ["Box,Tube ID,DOB,Sex,Strain,Father"]
+    lines += [f"1-1,{tube},1970-01-01,M,S1,{tube - 1 or ''}" for tube in range(1, 8)]
+    lines.append("1-1,not-a-tube,1970-01-01,M,S1,")
+    return MouseImport.objects.create(
+        uploaded_by=user,
+        project=project,
+        file=SimpleUploadedFile("colony.csv", "\n".join(lines).encode()),
+        original_filename="colony.csv",
+        sheet_name="",
+        cell_range="A1:F9",
+    )
+
+
+@pytest.fixture
+def commit(authed_client, import_obj, django_capture_on_commit_callbacks):
+    session = authed_client.session
+    session[f"import_map_{import_obj.id}"] = ({}, {}, MAPPING)
+    session.save()
+
+    def post():
+        with django_capture_on_commit_callbacks() as callbacks:
+            resp = authed_client.post(
+                reverse("mouse_import:import_commit", args=[import_obj.id])
+            )
+        return resp, callbacks
+
+    return post
+
+
+def test_commit_runs_in_the_background(authed_client, import_obj, commit):
+    resp, callbacks = commit()
+
+    assert resp.url == reverse("mouse_import:import_result", args=[import_obj.id])
+    assert len(callbacks) == 1
+    job = MouseImportJob.objects.get(mouse_import=import_obj)
+    assert job.status == "Q" and not Mouse.objects.exists()
+
+    progress_url = reverse("mouse_import:import_progress", args=[import_obj.id])
+    progress = authed_client.get(progress_url).json()
+    assert progress["finished"] is False and progress["rows_total"] == 8
+    assert b"import-progress" in authed_client.get(resp.url).content
+
+    jobs.run_import_job(job.id)
+
+    progress = authed_client.get(progress_url).json()
+    assert progress["finished"] and progress["committed"]
+    assert (progress["rows_processed"], progress["created"]) == (8, 7)
+    assert progress["errors"] == 1
+    page = authed_client.get(resp.url).content.decode()
+    assert "Row 8: missing/invalid required fields: tube_number" in page
+
+    import_obj.refresh_from_db()
+    assert import_obj.committed and import_obj.row_count == 8
+    assert not import_obj.file
+    fathers = dict(Mouse.objects.values_list("tube_number", "father__tube_number"))
+    assert fathers == {1: None, 2: 1, 3: 2, 4: 3, 5: 4, 6: 5, 7: 6}
+
+    # Committing again does not queue a second job.
+    resp, callbacks = commit()
+    assert resp.url == reverse("mouse_import:import_result", args=[import_obj.id])
+    assert not callbacks
+
+
+def test_interrupted_commit_resumes_after_last_saved_chunk(
+    import_obj, commit, monkeypatch
+):
+    monkeypatch.setattr(jobs, "CHUNK_ROWS", 3)
+    write_batch = Importer.write_batch
+    calls = []
+
+    def crash_on_second_chunk(self, *args, **kwargs):
+        calls.append(self.rows_read)
+        if len(calls) == 2:
+            raise RuntimeError("worker went away")
+        return write_batch(self, *args, **kwargs)
+
+    monkeypatch.setattr(Importer, "write_batch", crash_on_second_chunk)
+    commit()
+    job = MouseImportJob.objects.get(mouse_import=import_obj)
+    jobs.run_import_job(job.id)
+
+    job.refresh_from_db()
+    assert (job.status, job.failure) == ("F", "worker went away")
+    # The first chunk's header row leaves it two data rows.
+    assert job.rows_processed == 2 and Mouse.objects.count() == 2
+
+    _, callbacks = commit()
+    assert len(callbacks) == 1
+    jobs.run_import_job(job.id)
+
+    job.refresh_from_db()
+    assert job.status == "D"
+    assert calls == [0, 2, 2, 5]
+    assert (job.rows_processed, job.created_count, job.updated_count) == (8, 7, 0)
+    assert Mouse.objects.count() == 7
+    assert Mouse.objects.get(tube_number=3).father.tube_number == 2
+
+
+def test_only_stale_running_jobs_are_claimed_again(import_obj, commit):
+    commit()
+    job = MouseImportJob.objects.get(mouse_import=import_obj)
+    assert jobs._claim(job.id) is not None
+    assert jobs._claim(job.id) is None
+
+    MouseImportJob.objects.filter(pk=job.id).update(
+        heartbeat=job.created_at - jobs.STALE_AFTER
+    )
+    assert jobs._claim(job.id) is not None
+
+
+def test_queued_job_lost_with_its_process_is_resumed(import_obj, commit, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(jobs, "_submit", lambda run, pk: submitted.append((run, pk)))
+    commit()
+    job = MouseImportJob.objects.get(mouse_import=import_obj)
+    # Still waiting in the pool's queue.
+    assert not jobs.resume_if_stale(job)
+
+    # The process restarted before a thread took it.
+    job.heartbeat -= jobs.STALE_AFTER
+    job.save()
+    assert jobs.resume_if_stale(job)
+    # Submitted when committed, and again when resumed.
+    assert submitted == [(jobs.run_import_job, job.id)] * 2
+
+    jobs.run_import_job(job.id)
+    job.refresh_from_db()
+    assert job.status == "D" and Mouse.objects.count() == 7
+
+
+def _csv_upload(name, tubes, *, fathers=None, extra_line=None):
+    lines = ["Box,Tube ID,DOB,Sex,Strain,Father"]
+    lines += [
+        f"1-1,{tube},1970-01-01,M,S1,{(fathers or {}).get(tube, '')}" for tube in tubes
+    ]
+    if extra_line:
+        lines.append(extra_line)
+    return SimpleUploadedFile(name, "\n".join(lines).encode(), content_type="text/csv")
+
+
+@pytest.fixture
+def batch(project, user, media_root):
+    # Children in the first file, their fathers in the second.
+    lead_file = _csv_upload("a.csv", [1, 2], fathers={1: 10, 2: 11})
+    other_file = _csv_upload(
+        "B.csv", [10, 11], extra_line="1-1,not-a-tube,1970-01-01,M,S1,"
+    )
+    batch = batches.create_batch(project, [other_file, lead_file], user=user)
+    lead = batches.batch_imports(batch.id)[0]
+    lead.cell_range = "A1:F9"
+    lead.save()
+    assert batches.apply_range_to_batch(lead) == []
+    return batch
+
+
+def test_batch_upload_is_parsed_in_worker_processes(authed_client, project, media_root):
+    url = reverse("mouse_import:import_batch_form")
+    resp = authed_client.post(
+        url,
+        {
+            "project": project.id,
+            "uploads": [
+                _csv_upload("strain-b.csv", [1]),
+                _csv_upload("strain-a.csv", [2]),
+            ],
+        },
+    )
+
+    lead = MouseImport.objects.get(original_filename="strain-a.csv")
+    assert resp.url == reverse("mouse_import:import_select_range", args=[lead.id])
+    assert [i.original_filename for i in batches.batch_imports(lead.batch_id)] == [
+        "strain-a.csv",
+        "strain-b.csv",
+    ]
+
+    broken = SimpleUploadedFile("broken.xlsx", b"not a workbook")
+    resp = authed_client.post(
+        url, {"project": project.id, "uploads": [_csv_upload("ok.csv", [1]), broken]}
+    )
+    assert b"broken.xlsx: " in resp.content
+    assert not MouseImport.objects.filter(original_filename="ok.csv").exists()
+    assert MouseImportBatch.objects.count() == 1
+
+
+def test_batch_files_need_the_same_columns(project, user, media_root):
+    other = SimpleUploadedFile("b.csv", b"Box,Tube,DOB\n1-1,1,1970-01-01")
+    batch = batches.create_batch(project, [_csv_upload("a.csv", [1]), other], user=user)
+    lead = batches.batch_imports(batch.id)[0]
+    lead.cell_range = "A1:F9"
+
+    assert batches.apply_range_to_batch(lead) == [
+        "b.csv: columns differ from the first file's "
+        "(missing Tube ID, Sex, Strain, Father; "
+        "unexpected Tube, unnamed-1, unnamed-2, unnamed-3)"
+    ]
+    assert {i.cell_range for i in batches.batch_imports(batch.id)} == {"A1:F9"}
+
+
+def test_batch_links_parents_across_files(
+    authed_client, batch, django_capture_on_commit_callbacks
+):
+    lead, other = batches.batch_imports(batch.id)
+    session = authed_client.session
+    session[f"import_map_{lead.id}"] = ({}, {}, MAPPING)
+    session.save()
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        resp = authed_client.post(reverse("mouse_import:import_commit", args=[lead.id]))
+    assert resp.url == reverse("mouse_import:import_result", args=[lead.id])
+    assert len(callbacks) == 1
+    assert MouseImportJob.objects.filter(status="Q").count() == 2
+
+    progress_url = reverse("mouse_import:import_progress", args=[lead.id])
+    assert authed_client.get(progress_url).json()["rows_total"] == 16
+
+    jobs.run_batch_job(batch.id)
+
+    progress = authed_client.get(progress_url).json()
+    assert progress["finished"] and progress["committed"]
+    assert (progress["rows_processed"], progress["created"]) == (5, 4)
+    fathers = dict(Mouse.objects.values_list("tube_number", "father__tube_number"))
+    assert fathers == {1: 10, 2: 11, 10: None, 11: None}
+
+    page = authed_client.get(resp.url).content.decode()
+    assert "B.csv: Row 3: missing/invalid required fields: tube_number" in page
+    other.refresh_from_db()
+    assert other.committed and not other.file
+
+
+def test_batch_resumes_at_the_file_that_failed(authed_client, batch, monkeypatch):
+    lead, other = batches.batch_imports(batch.id)
+    write_batch = Importer.write_batch
+    crashed = []
+
+    def crash_on_second_file(self, dataframe, *args, **kwargs):
+        if "10" in dataframe["Tube ID"].tolist():
+            if not crashed:
+                crashed.append(True)
+                raise RuntimeError("worker went away")
+        return write_batch(self, dataframe, *args, **kwargs)
+
+    monkeypatch.setattr(Importer, "write_batch", crash_on_second_file)
+    jobs.enqueue_batch_commit(batch, {}, MAPPING)
+    jobs.run_batch_job(batch.id)
+
+    statuses = dict(MouseImportJob.objects.values_list("mouse_import", "status"))
+    assert statuses == {lead.id: "W", other.id: "F"}
+    # The first file's children wait, unlinked, for their fathers.
+    assert Mouse.objects.get(tube_number=1).father is None
+    page = authed_client.get(reverse("mouse_import:import_result", args=[lead.id]))
+    assert "Resume\n            B.csv\n            from row 1" in page.content.decode()
+
+    authed_client.post(reverse("mouse_import:import_commit", args=[lead.id]))
+    jobs.run_batch_job(batch.id)
+
+    assert set(MouseImportJob.objects.values_list("status", flat=True)) == {"D"}
+    assert Mouse.objects.get(tube_number=1).father.tube_number == 10
+
+
+def _age(batch):
+    for job in MouseImportJob.objects.filter(mouse_import__batch=batch):
+        job.heartbeat -= jobs.STALE_AFTER
+        job.save()
+    return list(
+        MouseImportJob.objects.filter(mouse_import__batch=batch).order_by(
+            "mouse_import__batch_position"
+        )
+    )
+
+
+def test_batch_killed_between_files_is_resumed(batch, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(jobs, "_submit", lambda run, pk: submitted.append((run, pk)))
+    lead_job, other_job = jobs.enqueue_batch_commit(batch, {}, MAPPING)
+
+    # The process dies once the first file is written.
+    assert jobs._attempt(jobs._claim(lead_job.id), jobs._write_batch_file)
+    batch_jobs = list(MouseImportJob.objects.order_by("mouse_import__batch_position"))
+    assert [job.status for job in batch_jobs] == ["W", "Q"]
+    assert not jobs.resume_batch_if_stale(batch.id, batch_jobs)
+
+    assert jobs.resume_batch_if_stale(batch.id, _age(batch))
+    jobs.run_batch_job(batch.id)
+    assert set(MouseImportJob.objects.values_list("status", flat=True)) == {"D"}
+    assert Mouse.objects.get(tube_number=1).father.tube_number == 10
+
+
+def test_batch_killed_before_linking_is_resumed(batch, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(jobs, "_submit", lambda run, pk: submitted.append((run, pk)))
+    # The process dies once every file is written, before they are linked.
+    for job in jobs.enqueue_batch_commit(batch, {}, MAPPING):
+        assert jobs._attempt(jobs._claim(job.id), jobs._write_batch_file)
+    batch_jobs = list(MouseImportJob.objects.all())
+    assert {job.status for job in batch_jobs} == {"W"}
+    assert not jobs.resume_batch_if_stale(batch.id, batch_jobs)
+
+    assert jobs.resume_batch_if_stale(batch.id, _age(batch))
+    assert submitted[-1] == (jobs.run_batch_job, batch.id)
+    jobs.run_batch_job(batch.id)
+    assert set(MouseImportJob.objects.values_list("status", flat=True)) == {"D"}
+    assert Mouse.objects.get(tube_number=1).father.tube_number == 10
+
+
+def test_dry_run_page_lists_rows_without_committing(
+    authed_client, import_obj, monkeypatch
+):
+    monkeypatch.setattr(views, "DRY_RUN_PAGE_SIZE", 3)
+    session = authed_client.session
+    session[f"import_map_{import_obj.id}"] = ({}, {}, MAPPING)
+    session.save()
+    url = reverse("mouse_import:import_dry_run", args=[import_obj.id])
+
+    page = authed_client.get(url).content.decode()
+
+    assert "Create: 7" in page and "Error: 1" in page
+    assert "Page 1 of 3" in page
+    assert not Mouse.objects.exists()
+    assert not MouseImportJob.objects.exists()
+
+    page = authed_client.get(url, {"action": "E"}).content.decode()
+    assert "Row 8: missing/invalid required fields: tube_number" in page
+    assert "Page 1 of" not in page
@@ -1,9 +1,17 @@
 from pathlib import Path
 
-
-from mouse_import.services.io import read_range
+import pandas as pd
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from mouse_import.models import MouseImport
+from mouse_import.services import dry_run as dry_run_module
+from mouse_import.services.dry_run import dry_run, report_for
+from mouse_import.services.io import iter_range, read_range
 from mouse_import.services.importer import Importer, ImportOptions
-from mouseapp.models import Mouse, Strain
+from mouseapp.models import Box, Mouse, Strain
+from mouseapp.pedigree import are_related, descendants_within
 
 
 def run_import_xlsx(
@@ -98,6 +106,19 @@ def test_basic_import(project):
     assert m2.father == m1
 
 
+def test_import_maintains_pedigree(project):
+    created, updated, errors = run_import_xlsx(
+        project.id, "Sheet1", "A1:J3", {}, MAPPING
+    )
+    assert not errors
+
+    m1, m2 = Mouse.objects.filter(pk__in=created).order_by("generation")
+    assert (m1.generation, m1.max_descendant_depth) == (0, 1)
+    assert (m2.generation, m2.max_descendant_depth) == (1, 0)
+    assert list(descendants_within(m1.id, 1)) == [m2]
+    assert are_related(m1.id, m2.id)
+
+
 def test_fixed_strain(project):
     created, updated, errors = run_import_xlsx(
         project.id, "Sheet1", "A1:J2", {"strain": "some-fixed-strain"}, MAPPING
@@ -237,3 +258,227 @@ def test_import_cull_forwardfill(project):
     assert m1.death_reason == "Age"
     assert m2.death_date is None
     assert m2.death_reason is None
+
+
+def test_reimport_updates_existing_mice(project):
+    created, _, errors = run_import_xlsx(project.id, "Sheet2", "A1:J3", {}, MAPPING)
+    assert not errors
+
+    recreated, updated, errors = run_import_xlsx(
+        project.id, "Sheet2", "A1:J3", {}, MAPPING
+    )
+
+    assert not errors and not recreated
+    assert sorted(updated) == sorted(created)
+
+
+def test_failing_row_does_not_stop_its_chunk(project):
+    frame = pd.DataFrame(
+        {
+            "Box": ["1", "1", "1", "1"],
+            "Tube ID": [1, 10**20, 3, 1],
+            "DOB": ["01/02/2020"] * 4,
+            "Sex": ["M", "F", "F", "M"],
+            "Strain": ["S", "S", "S", "S"],
+            "Earmark": ["TL", "TR", "BL", "BR"],
+        }
+    )
+    importer = Importer(ImportOptions(project_id=project.id, sheet="", range_expr=""))
+
+    created, updated, errors = importer.run(frame, {}, MAPPING)
+
+    assert len(errors) == 1 and errors[0].startswith("Row 2: ")
+    assert len(created) == 2
+    # The last row repeats the first row's tube number and updates that mouse.
+    assert updated == created[:1]
+    assert Mouse.objects.get(pk=created[0]).earmark == "BR"
+
+
+def test_foreign_keys_are_resolved_once_per_import(project):
+    Strain.objects.create(name="Known")
+    frame = pd.DataFrame(
+        {
+            "Box": [str(i % 3) for i in range(60)],
+            "Tube ID": list(range(60)),
+            "DOB": ["01/02/2020"] * 60,
+            "Sex": ["M", "F"] * 30,
+            "Strain": ["Known", "New"] * 30,
+        }
+    )
+    importer = Importer(ImportOptions(project_id=project.id, sheet="", range_expr=""))
+
+    with CaptureQueriesContext(connection) as queries:
+        created, _, errors = importer.run(frame, {}, MAPPING)
+
+    assert not errors and len(created) == 60
+    lookups = [
+        query["sql"]
+        for query in queries
+        if 'FROM "mouseapp_box"' in query["sql"]
+        or 'FROM "mouseapp_strain"' in query["sql"]
+    ]
+    # One lookup of the existing rows and one after creating the missing ones.
+    assert len(lookups) == 4
+    assert Box.objects.filter(project=project).count() == 3
+    assert sorted(Strain.objects.values_list("name", flat=True)) == ["Known", "New"]
+
+
+def test_parents_are_linked_in_one_pass(project):
+    size = 40
+    frame = pd.DataFrame(
+        {
+            "Box": ["1"] * size,
+            "Tube ID": list(range(1, size + 1)),
+            "DOB": ["01/02/2020"] * size,
+            "Sex": ["M", "F"] * (size // 2),
+            "Strain": ["S"] * size,
+            # Every mouse after the first pair descends from the pair above it.
+            "Father": [None, None] + [i - 2 if i % 2 else i - 3 for i in range(3, 41)],
+            "Mother": [None, None] + [i - 1 if i % 2 else i - 2 for i in range(3, 41)],
+        }
+    )
+    frame.loc[size - 1, "Mother"] = 999
+    importer = Importer(ImportOptions(project_id=project.id, sheet="", range_expr=""))
+
+    with CaptureQueriesContext(connection) as queries:
+        created, _, errors = importer.run(frame, {}, MAPPING)
+
+    assert len(created) == size
+    assert errors == [
+        f"Linking parents for mouse pk={created[-1]}: no mother with tube number "
+        "999 in this project"
+    ]
+    by_tube = {mouse.tube_number: mouse for mouse in Mouse.objects.all()}
+    assert by_tube[3].father == by_tube[1] and by_tube[3].mother == by_tube[2]
+    assert by_tube[40].father == by_tube[37] and by_tube[40].mother is None
+    links = [
+        query
+        for query in queries
+        if query["sql"].startswith('UPDATE "mouseapp_mouse" SET "father_id"')
+    ]
+    assert len(links) == 1
+
+
+def test_import_from_streamed_batches(project):
+    importer = Importer(ImportOptions(project_id=project.id, sheet="", range_expr=""))
+    batches = iter_range(
+        Path(__file__).with_name("sheet.xlsx"),
+        "Sheet1",
+        "A1:J3",
+        mapping=MAPPING,
+        batch_size=1,
+    )
+
+    created, updated, errors = importer.run_batches(batches, {}, MAPPING)
+
+    assert not errors and not updated
+    assert importer.rows_read == 2
+    child = Mouse.objects.get(pk=created[1])
+    assert child.father_id == created[0]
+
+
+def test_dry_run_classifies_rows_without_writing(project, media_root):
+    lines = [
+        "Box,Tube ID,DOB,Sex,Strain,Notes",
+        "1,1,1970-01-01,M,S1,first",
+        "1,2,1970-01-01,F,S1,",
+        "1,not-a-tube,1970-01-01,M,S1,",
+        "1,1,1970-01-01,M,S1,again",
+    ]
+    import_obj = MouseImport.objects.create(
+        project=project,
+        file=SimpleUploadedFile("colony.csv", "\n".join(lines).encode()),
+        original_filename="colony.csv",
+        cell_range="A1:F5",
+    )
+    mapping = {k: v for k, v in MAPPING.items() if v in lines[0].split(",")}
+
+    with CaptureQueriesContext(connection) as queries:
+        report = dry_run([import_obj], {}, mapping)
+
+    assert all(query["sql"].startswith("SELECT") for query in queries)
+    assert list(report.actions) == ["C", "C", "E", "U"]
+    assert not (Mouse.objects.exists() or Box.objects.exists())
+    assert not Strain.objects.exists()
+    strain = report.fields.index("strain")
+    assert report.after[0, strain] == "S1 (would create)"
+    assert report.counts() == {"C": 2, "U": 1, "N": 0, "E": 1}
+    notes = report.fields.index("notes")
+    # The repeated tube updates the mouse the first row creates.
+    assert (report.before[3, notes], report.after[3, notes]) == ("first", "again")
+    assert list(report.changed[3]) == [name == "notes" for name in report.fields]
+
+    Importer(ImportOptions(project_id=project.id, sheet="", range_expr="")).run(
+        read_range(import_obj.file.path, None, "A1:F5", mapping=mapping), {}, mapping
+    )
+    Mouse.objects.filter(tube_number=2).update(sex="M")
+
+    report = dry_run([import_obj], {}, mapping)
+
+    assert list(report.actions) == ["U", "U", "E", "U"]
+    second = report[1:2][0]
+    changed = [
+        (name, cell.before, cell.after)
+        for name, cell in zip(report.fields, second.cells)
+        if cell.changed
+    ]
+    assert changed == [("sex", "M", "F")]
+    assert [row.number for row in report.only("E")[:]] == [3]
+    assert "missing/invalid required fields: tube_number" in report.errors[2]
+
+
+def test_dry_run_compares_each_batch_in_bulk(project, media_root):
+    lines = ["Box,Tube ID,DOB,Sex,Strain"]
+    lines += [f"1,{tube},1970-01-01,M,S1" for tube in range(1, 301)]
+    import_obj = MouseImport.objects.create(
+        project=project,
+        file=SimpleUploadedFile("colony.csv", "\n".join(lines).encode()),
+        original_filename="colony.csv",
+        cell_range="A1:E301",
+    )
+    mapping = {k: v for k, v in MAPPING.items() if v in lines[0].split(",")}
+    importer = Importer(ImportOptions(project_id=project.id, sheet="", range_expr=""))
+    importer.run(read_range(import_obj.file.path, None, "A1:E301"), {}, mapping)
+
+    with CaptureQueriesContext(connection) as queries:
+        report = dry_run([import_obj], {}, mapping)
+
+    assert report.counts()["N"] == 300
+    assert len(queries) < 15
+
+
+def test_dry_run_report_is_cached_until_the_mice_change(
+    project, media_root, monkeypatch
+):
+    lines = ["Box,Tube ID,DOB,Sex,Strain", "1,1,1970-01-01,M,S1", "1,2,1970-01-01,F,S1"]
+    import_obj = MouseImport.objects.create(
+        project=project,
+        file=SimpleUploadedFile("colony.csv", "\n".join(lines).encode()),
+        original_filename="colony.csv",
+        cell_range="A1:E3",
+    )
+    mapping = {k: v for k, v in MAPPING.items() if v in lines[0].split(",")}
+    dry_run_module.cache.clear()
+    runs = []
+    monkeypatch.setattr(
+        dry_run_module,
+        "dry_run",
+        lambda *args: runs.append(args) or dry_run(*args),
+    )
+
+    report = report_for([import_obj], {}, mapping)
+    cached = report_for([import_obj], {}, mapping)
+
+    assert len(runs) == 1
+    assert list(cached.actions) == list(report.actions) == ["C", "C"]
+    assert [row.cells for row in cached[:]] == [row.cells for row in report[:]]
+
+    Importer(ImportOptions(project_id=project.id, sheet="", range_expr="")).run(
+        read_range(import_obj.file.path, None, "A1:E3", mapping=mapping), {}, mapping
+    )
+    assert list(report_for([import_obj], {}, mapping).actions) == ["N", "N"]
+    Mouse.objects.get(tube_number=2).save()
+    report_for([import_obj], {}, mapping)
+    report_for([import_obj], {}, {**mapping, "sex": ""})
+
+    assert len(runs) == 4
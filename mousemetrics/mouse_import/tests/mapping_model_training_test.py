@@ -1,11 +1,17 @@
+from datetime import timedelta
+
 import pytest
 import pandas as pd
+from django.utils import timezone
 
+from mouseapp.models import Project
 from mouse_import.models import (
     MouseImport,
     MouseImportMappingExample,
+    MouseImportMappingMemory,
     MouseImportMappingModelState,
 )
+from mouse_import.services import column_profile, mapping_ai, mapping_train
 from mouse_import.services.mapping_ai import (
     record_mapping_examples,
     suggest_mapping_for_dataframe,
@@ -54,6 +60,96 @@ def test_record_mapping_examples_only_real_columns(db, import_obj, django_user_m
     assert MouseImportMappingExample.objects.count() == 3
 
 
+def _memory(project):
+    return {
+        (row.source_header_norm, row.target_field): row.count
+        for row in MouseImportMappingMemory.objects.filter(project=project)
+        if row.count
+    }
+
+
+def test_record_mapping_examples_keeps_memory_counts(db, project, import_obj):
+    df = pd.DataFrame([{"Tube ID": "1", "Sex": "M", "Cage": "A"}])
+    other = MouseImport.objects.create(
+        uploaded_by=None,
+        project=project,
+        file="mouse_imports/other.csv",
+        original_filename="other.csv",
+        sheet_name="",
+        cell_range="A1:C2",
+    )
+
+    record_mapping_examples(
+        import_obj, df, user=None, mapping={"tube_number": "Tube ID", "sex": "Sex"}
+    )
+    record_mapping_examples(
+        other, df, user=None, mapping={"tube_number": "Tube ID", "box": "Cage"}
+    )
+    assert _memory(project) == {
+        ("tube id", "tube_number"): 2,
+        ("sex", "sex"): 1,
+        ("cage", "box"): 1,
+    }
+
+    # Saving an import's mapping again replaces its earlier counts.
+    record_mapping_examples(
+        import_obj, df, user=None, mapping={"tube_number": "Tube ID", "notes": "Sex"}
+    )
+    expected = {
+        ("tube id", "tube_number"): 2,
+        ("sex", "notes"): 1,
+        ("cage", "box"): 1,
+    }
+    assert _memory(project) == expected
+    assert _memory(None) == expected
+
+
+def test_remembered_headers_are_suggested_without_the_model(
+    db, project, import_obj, monkeypatch
+):
+    elsewhere = Project.objects.create(name="Q", start_date="2000-01-01")
+    other_import = MouseImport.objects.create(
+        uploaded_by=None,
+        project=elsewhere,
+        file="mouse_imports/other.csv",
+        original_filename="other.csv",
+        sheet_name="",
+        cell_range="A1:C2",
+    )
+    df = pd.DataFrame(
+        [{"Col 7": "x", "Tube ID": "1", "DOB": "1970-01-01", "Sex": "M", "Cage": "A"}]
+    )
+    record_mapping_examples(import_obj, df, user=None, mapping={"notes": "Col 7"})
+    record_mapping_examples(
+        other_import, df, user=None, mapping={"earmark": "Col 7", "box": "Cage"}
+    )
+
+    predicted = []
+    predicted_scores = mapping_ai._predicted_scores
+
+    def spy(df, columns, *args):
+        predicted.extend(columns)
+        return predicted_scores(df, columns, *args)
+
+    monkeypatch.setattr(mapping_ai, "_predicted_scores", spy)
+
+    # The project's own mappings win over other projects'.
+    initial, suggestions = suggest_mapping_for_dataframe(df, project)
+    assert initial["map_notes"] == "Col 7"
+    assert initial["map_earmark"] == ""
+    assert suggestions["notes"][0] == mapping_ai.Suggestion("Col 7", 1.0)
+    # Cage was only mapped elsewhere.
+    assert initial["map_box"] == "Cage"
+    assert predicted == ["Tube ID", "DOB", "Sex"]
+
+    # A new project's suggestions come from every project's mappings.
+    third = Project.objects.create(name="R", start_date="2000-01-01")
+    initial, suggestions = suggest_mapping_for_dataframe(df, third)
+    assert suggestions["notes"][0] == mapping_ai.Suggestion("Col 7", 0.5)
+    assert suggestions["earmark"][0] == mapping_ai.Suggestion("Col 7", 0.5)
+    assert initial["map_box"] == "Cage"
+
+
 def _seed_examples(project, import_obj, n_pairs: int):
     """
     Each pair adds 3 examples (tube_number, date_of_birth, sex).
@@ -192,3 +288,265 @@ def test_training_in_progress_short_circuits(db, project, import_obj):
     out = maybe_train_mapping_model(min_new_examples=10)
     assert out.status == TrainStatus.SKIPPED
     assert out.skip_reason == SkipReason.IN_PROGRESS
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_model_bundle_is_loaded_once_per_trained_model(
+    db, project, import_obj, monkeypatch, settings, tmp_path, mmap
+):
+    settings.MAPPING_MODEL_MMAP_DIR = str(tmp_path) if mmap else None
+    loads = []
+    load = mapping_ai.joblib.load
+
+    def counting_load(*args, **kwargs):
+        loads.append(kwargs.get("mmap_mode"))
+        return load(*args, **kwargs)
+
+    monkeypatch.setattr(mapping_ai.joblib, "load", counting_load)
+    MouseImportMappingModelState.objects.get_or_create(id=1)
+    _seed_examples(project, import_obj, n_pairs=4)
+    maybe_train_mapping_model(min_new_examples=10)
+
+    first = mapping_ai._load_model_bundle()
+    assert mapping_ai._load_model_bundle() is first
+    assert len(loads) == 1
+
+    _seed_examples(project, import_obj, n_pairs=4)
+    maybe_train_mapping_model(min_new_examples=10)
+    # Training loads the stored model too, to train it further.
+    loads.pop()
+    retrained = mapping_ai._load_model_bundle()
+
+    assert retrained is not first
+    assert loads == (["r", "r"] if mmap else [None, None])
+    # The older model's file is removed once the new one is stored.
+    assert len(list(tmp_path.iterdir())) == (1 if mmap else 0)
+    assert "tube_number" in retrained["classes"]
+
+
+def test_retraining_only_fits_new_examples(db, project, import_obj, monkeypatch):
+    MouseImportMappingModelState.objects.get_or_create(id=1)
+    _seed_examples(project, import_obj, n_pairs=4)
+    first = maybe_train_mapping_model(min_new_examples=10)
+
+    fitted = []
+    partial_fit = mapping_train.SGDClassifier.partial_fit
+
+    def counting_partial_fit(self, X, y, **kwargs):
+        fitted.append(X.shape[0])
+        return partial_fit(self, X, y, **kwargs)
+
+    monkeypatch.setattr(
+        mapping_train.SGDClassifier, "partial_fit", counting_partial_fit
+    )
+    _seed_examples(project, import_obj, n_pairs=5)
+    out = maybe_train_mapping_model(min_new_examples=10)
+
+    assert out.status == TrainStatus.TRAINED
+    assert fitted == [15] * mapping_train.TRAIN_EPOCHS
+    assert out.n_examples == first.n_examples + 15
+    assert MouseImportMappingModelState.objects.get(id=1).n_examples == 27
+
+    df = pd.DataFrame([{"Tube ID": "1", "DOB": "1970-01-01", "Sex": "M"}])
+    initial, _debug = suggest_mapping_for_dataframe(df, project)
+    assert initial.get("map_date_of_birth") == "DOB"
+
+
+def test_training_runs_after_the_request_commits(
+    db, project, import_obj, django_capture_on_commit_callbacks
+):
+    MouseImportMappingModelState.objects.get_or_create(id=1)
+    _seed_examples(project, import_obj, n_pairs=4)
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        mapping_train.train_in_background(min_new_examples=10)
+    assert MouseImportMappingModelState.objects.get(id=1).model_blob is None
+
+    # Run the queued job here rather than in the worker thread, which would
+    # not see this test's transaction.
+    assert len(callbacks) == 1
+    mapping_train._train_in_thread(10)
+    assert MouseImportMappingModelState.objects.get(id=1).model_blob is not None
+
+
+def test_assignment_keeps_exact_optional_matches(db, project):
+    # Greedy assignment gave the required box field "Strain", its best
+    # column left, and the strain field nothing.
+    headers = ["DOB", "Sex", "Mother", "Tag", "Strain", "ID"]
+    df = pd.DataFrame([dict.fromkeys(headers, "")])
+
+    initial, suggestions = suggest_mapping_for_dataframe(df, project)
+
+    assert initial["map_date_of_birth"] == "DOB"
+    assert initial["map_sex"] == "Sex"
+    assert initial["map_strain"] == "Strain"
+    assert initial["map_mother"] == "Mother"
+    assert initial["map_tube_number"] in {"Tag", "ID"}
+    assert initial["map_box"] in {"Tag", "ID"}
+    assert suggestions["strain"][0] == mapping_ai.Suggestion("Strain", 1.0)
+
+
+def test_header_similarity_matrix_matches_pairwise_ratios():
+    from difflib import SequenceMatcher
+
+    headers = ["Tube #", "", "date of birth", "DOB", "Cage", "tube_#"]
+    fields = ["tube_number", "date_of_birth", "box"]
+
+    similarity = mapping_ai._header_similarity_matrix(headers, fields)
+
+    for fi, field_name in enumerate(fields):
+        for ci, header in enumerate(headers):
+            norm = mapping_ai._normalise_text(header)
+            expected = max(
+                (
+                    SequenceMatcher(None, norm, candidate).ratio()
+                    for candidate in mapping_ai._header_candidates(field_name)
+                ),
+                default=0.0,
+            )
+            assert similarity[fi, ci] == (expected if norm else 0.0)
+    assert similarity[1, 2] == similarity[1, 3] == 1.0
+
+
+def test_column_profile_samples_a_bounded_number_of_rows():
+    short = pd.Series(["M", "F", None, " ", " F ", "M", "M"], dtype=object)
+    assert mapping_ai._build_column_text("Sex", short) == (
+        "Header: Sex\nExamples: M | F | F | M | M\nTop values: M (3) | F (2)"
+    )
+
+    n_rows = 100_000
+    long = pd.Series([str(i) for i in range(n_rows)], dtype=object)
+    profile = column_profile.profile_column(long)
+    positions = column_profile._sample_positions(n_rows)
+
+    assert len(positions) == (
+        column_profile.PROFILE_HEAD_ROWS + column_profile.PROFILE_SAMPLE_ROWS
+    )
+    assert list(positions[: column_profile.PROFILE_HEAD_ROWS]) == list(
+        range(column_profile.PROFILE_HEAD_ROWS)
+    )
+    # One row from every stretch after the head, reaching the end of the sheet.
+    assert (positions[column_profile.PROFILE_HEAD_ROWS :] > 50_000).sum() > 100
+    assert profile.examples == [str(i) for i in range(column_profile.SAMPLE_VALUES_N)]
+    assert profile == column_profile.profile_column(long)
+
+
+def test_column_profiles_are_cached_per_import(db, import_obj, monkeypatch):
+    df = pd.DataFrame({"Tube": ["1", "2"], "Sex": ["M", "F"]})
+    profiled = []
+    profile_column = column_profile.profile_column
+
+    def spy(series):
+        profiled.append(series.name)
+        return profile_column(series)
+
+    monkeypatch.setattr(column_profile, "profile_column", spy)
+
+    suggest_mapping_for_dataframe(df, import_obj.project, import_obj=import_obj)
+    record_mapping_examples(import_obj, df, user=None, mapping={"sex": "Sex"})
+    assert profiled == ["Tube", "Sex"]
+
+    # Another range of the same file is profiled afresh.
+    import_obj.cell_range = "A1:B2"
+    column_profile.profile_columns(df, ["Sex"], import_obj=import_obj)
+    assert profiled == ["Tube", "Sex", "Sex"]
+
+
+def _seed_distinct_examples(project, import_obj, n_pairs: int, start: int = 0):
+    """Like `_seed_examples`, with different sample values in every pair."""
+    rows = []
+    for i in range(start, start + n_pairs):
+        for field, text in (
+            ("tube_number", f"Header: Tube ID\nExamples: {i} | {i + 1}"),
+            ("sex", f"Header: Sex {i}\nExamples: M | F"),
+        ):
+            rows.append(
+                MouseImportMappingExample(
+                    project=project,
+                    mouse_import=import_obj,
+                    target_field=field,
+                    source_header=text,
+                    source_header_norm=text.lower(),
+                    column_text=text,
+                    column_text_hash=mapping_ai.hash_column_text(text),
+                )
+            )
+    MouseImportMappingExample.objects.bulk_create(rows)
+
+
+def test_training_skips_repeated_examples(db, project, import_obj):
+    df = pd.DataFrame(
+        [{"Tube ID": str(i), "DOB": "1970-01-01", "Sex": "MF"[i % 2]} for i in range(5)]
+    )
+    mapping = {"tube_number": "Tube ID", "date_of_birth": "DOB", "sex": "Sex"}
+    # The same template imported four times.
+    for n in range(4):
+        repeat = MouseImport.objects.create(
+            project=project,
+            file=f"mouse_imports/{n}.csv",
+            original_filename=f"{n}.csv",
+            cell_range="A1:C6",
+        )
+        record_mapping_examples(repeat, df, user=None, mapping=mapping)
+
+    out = maybe_train_mapping_model(min_new_examples=10)
+
+    assert out.status == TrainStatus.TRAINED
+    assert out.n_examples == 12
+    assert out.n_fitted == 3
+
+
+def test_training_samples_at_most_the_cap_per_field(db, project, import_obj, settings):
+    settings.TRAIN_MAX_PER_FIELD = 4
+    _seed_distinct_examples(project, import_obj, n_pairs=10)
+
+    out = maybe_train_mapping_model(min_new_examples=10)
+    assert out.n_examples == 20
+    assert out.n_fitted == 8
+
+    _seed_distinct_examples(project, import_obj, n_pairs=50, start=10)
+    out = maybe_train_mapping_model(min_new_examples=10)
+    assert out.n_examples == 120
+    assert out.n_fitted <= 8
+    bundle = mapping_ai._load_model_bundle()
+    assert bundle["seen"] == {"tube_number": 60, "sex": 60}
+
+
+def test_sample_per_class_is_a_reservoir():
+    rows = [(str(i), "a") for i in range(100)] + [("b0", "b")]
+    seen = {"b": 1}
+    rng = mapping_train.np.random.default_rng(0)
+
+    sample = mapping_train._sample_per_class(rows, seen, 10, rng)
+
+    assert seen == {"a": 100, "b": 2}
+    assert [text for text, label in sample if label == "b"] == ["b0"]
+    kept = [int(text) for text, label in sample if label == "a"]
+    assert len(kept) == len(set(kept)) == 10
+    # Later rows replace earlier ones rather than being dropped.
+    assert max(kept) >= 10
+
+
+def test_training_forgets_examples_past_the_max_age(db, project, import_obj, settings):
+    settings.TRAIN_MAX_AGE_DAYS = 30
+    _seed_distinct_examples(project, import_obj, n_pairs=10)
+    first = maybe_train_mapping_model(min_new_examples=10)
+    assert first.n_examples == 20
+
+    # A month on, the first examples are too old, and so is the model.
+    long_ago = timezone.now() - timedelta(days=40)
+    MouseImportMappingExample.objects.update(created_at=long_ago)
+    state = MouseImportMappingModelState.objects.get(id=1)
+    bundle = mapping_train.joblib.load(mapping_train.BytesIO(bytes(state.model_blob)))
+    bundle["refit_at"] = long_ago
+    buf = mapping_train.BytesIO()
+    mapping_train.joblib.dump(bundle, buf)
+    state.model_blob = buf.getvalue()
+    state.save()
+
+    _seed_distinct_examples(project, import_obj, n_pairs=6, start=10)
+    out = maybe_train_mapping_model(min_new_examples=10)
+
+    assert out.status == TrainStatus.TRAINED
+    assert out.n_examples == 12
+    assert mapping_ai._load_model_bundle()["seen"] == {"tube_number": 6, "sex": 6}
@@ -0,0 +1,68 @@
+import warnings
+
+import pandas as pd
+import pytest
+
+from mouse_import.management.commands.benchmark_import_normalisation import (
+    MAPPING,
+    legacy_process_dataframe,
+    make_frame,
+)
+from mouse_import.services.io import _process_dataframe
+
+
+@pytest.mark.parametrize("mapping", [None, MAPPING])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_vectorised_normalisation_matches_cell_by_cell(seed, mapping):
+    frame = make_frame(500, seed)
+
+    expected = legacy_process_dataframe(frame.copy(), None, mapping)
+    actual = _process_dataframe(frame.copy(), None, mapping)
+
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_normalisation_continues_forward_fill_from_previous_row():
+    frame = make_frame(200)
+    expected = legacy_process_dataframe(frame.copy(), None, MAPPING)
+
+    head = _process_dataframe(frame.iloc[:80].copy(), None, MAPPING)
+    tail = _process_dataframe(
+        frame.iloc[80:].reset_index(drop=True), None, MAPPING, previous=head.iloc[-1]
+    )
+
+    pd.testing.assert_frame_equal(
+        pd.concat([head, tail], ignore_index=True), expected, check_dtype=False
+    )
+
+
+def test_normalisation_of_single_typed_columns():
+    frame = pd.DataFrame(
+        {
+            "Count": [1, 2, None],
+            "Flag": [True, False, True],
+            "Born": pd.to_datetime(["2020-01-02", None, "2021-03-04"]),
+            "Seen": pd.to_datetime(["2020-01-02 23:30", None, None]).tz_localize(
+                "Europe/London"
+            ),
+        }
+    )
+
+    expected = legacy_process_dataframe(frame.copy(), None, None)
+    actual = _process_dataframe(frame.copy(), None, None)
+
+    pd.testing.assert_frame_equal(actual, expected)
+    assert actual["Born"].tolist() == ["2020-01-02", None, "2021-03-04"]
+    assert actual["Seen"].tolist() == ["2020-01-02", None, None]
+
+
+def test_forward_fill_of_blank_cells_does_not_warn():
+    # Blank strings become NA, which leaves the numbers in an object column.
+    frame = pd.DataFrame({"Box": [1, " ", 2, ""], "Tube ID": [1, None, "2a", None]})
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        actual = _process_dataframe(frame, None, MAPPING)
+
+    assert actual["Box"].tolist() == ["1", "1", "2", "2"]
+    assert actual["Tube ID"].tolist() == ["1", "1", "2a", "2a"]
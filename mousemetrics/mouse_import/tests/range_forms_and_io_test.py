@@ -1,9 +1,16 @@
 import re
+from datetime import datetime
+
 import pytest
+from openpyxl import Workbook
 
 from mouse_import.forms import MouseImportForm, MouseImportSheetRangeForm
 from mouse_import.models import MouseImport
-from mouse_import.services.io import list_sheet_names, read_range
+import pandas as pd
+
+from mouse_import.services import io, sheet_cache
+from mouse_import.services.io import iter_range, list_sheet_names, read_range
+from mouse_import.services.sheet_cache import ensure_workbook_cache
 from mouse_import.services.validators import (
     cell_range_boundaries,
     excel_col_to_index,
@@ -125,3 +132,95 @@ def test_read_range_limit_applies_to_excel_and_csv(sheet_xlsx_path, sheet_csv_pa
     assert len(csv_df) == 1
     assert list(xlsx.columns) == list(csv_df.columns)
     assert xlsx.to_dict(orient="records") == csv_df.to_dict(orient="records")
+
+
+@pytest.mark.parametrize("extension", [".csv", ".xlsx"])
+def test_iter_range_streams_batches_like_read_range(tmp_path, extension):
+    rows = [["Box", "Tube", "Cull Date"]]
+    rows += [
+        ["A" if i % 4 == 0 else "", str(i), "2024-01-01" if i == 1 else ""]
+        for i in range(10)
+    ]
+    path = tmp_path / f"colony{extension}"
+    if extension == ".csv":
+        path.write_text("\n".join(",".join(row) for row in rows))
+    else:
+        pd.DataFrame(rows).to_excel(path, header=False, index=False)
+    mapping = {"box": "Box", "tube_number": "Tube", "death_date": "Cull Date"}
+
+    batches = list(iter_range(path, None, "A1:C11", mapping=mapping, batch_size=3))
+
+    assert len(batches) > 1 and all(len(batch) <= 3 for batch in batches)
+    streamed = pd.concat(batches, ignore_index=True)
+    whole = read_range(path, None, "A1:C11", mapping=mapping)
+    assert streamed.to_dict(orient="records") == whole.to_dict(orient="records")
+    # Forward-filling carries over from one batch into the next.
+    assert streamed["Box"].tolist() == ["A"] * 4 + ["A"] * 4 + ["A"] * 2
+    assert streamed["Cull Date"].tolist()[:3] == [None, "2024-01-01", None]
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_iter_range_reads_cells_the_same_in_any_batch(tmp_path, batch_size):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["Tube", "Weight", "Alive"])
+    for row in [[10, 20.5, True], [11, None, None], [None, 21.0, False], [12, 22, 1]]:
+        sheet.append(row)
+    path = tmp_path / "colony.xlsx"
+    workbook.save(path)
+
+    whole = read_range(path, None, "A1:C5")
+    streamed = pd.concat(
+        iter_range(path, None, "A1:C5", batch_size=batch_size), ignore_index=True
+    )
+
+    assert streamed.to_dict(orient="records") == whole.to_dict(orient="records")
+    # Integer cells stay integers next to blanks, as they were read cell by cell.
+    assert whole["Tube"].tolist() == ["10", "11", None, "12"]
+    assert whole["Weight"].tolist() == ["20.5", None, "21", "22"]
+
+
+def test_workbook_cache_reads_ranges_like_the_workbook(tmp_path, monkeypatch):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Mice"
+    sheet.append(["Box", "Tube", "Born", "Notes"])
+    for tube in range(1, 12):
+        # A gap at rows 6-7 and rows of different widths.
+        if tube not in (5, 6):
+            cells = ["A", tube, datetime(2024, 1, tube)] + ["x"] * (tube % 2)
+            for column, value in enumerate(cells, start=1):
+                sheet.cell(row=tube + 1, column=column, value=value)
+    workbook.create_sheet("Other").append(["Only", "header"])
+    path = tmp_path / "colony.xlsx"
+    workbook.save(path)
+
+    ranges = ["A1:D13", "A1:F20", "B3:C9", "A5:D6", "E1:G4", "A14:D20"]
+
+    def read_all():
+        results = []
+        for range_expr in ranges:
+            try:
+                df = read_range(path, "Mice", range_expr)
+                results.append(df.to_dict(orient="records"))
+            except ValueError as exc:
+                results.append(str(exc))
+        return results + [list_sheet_names(path)]
+
+    expected = read_all()
+    monkeypatch.setattr(sheet_cache, "SNAPSHOT_CHUNK_ROWS", 3)
+    cache = ensure_workbook_cache(path)
+
+    assert cache.sheet(None) is cache.sheet("Mice")
+    assert cache.sheet("Mice").chunks == 4
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the workbook was parsed again")
+
+    monkeypatch.setattr(io, "load_workbook", fail)
+    assert read_all() == expected
+
+    # A changed upload no longer matches its snapshot.
+    path.write_bytes(path.read_bytes() + b"\0")
+    assert ensure_workbook_cache(path, original_filename="colony.csv") is None
+    assert sheet_cache.load_workbook_cache(path) is None
@@ -5,6 +5,7 @@ app_name = "mouse_import"
 
 urlpatterns = [
     path("import/", views.import_form, name="import_form"),
+    path("import/batch/", views.import_batch_form, name="import_batch_form"),
     path(
         "import/<int:id>/range/",
         views.import_select_range,
@@ -16,5 +17,8 @@ urlpatterns = [
         name="import_range_preview",
     ),
     path("import/<int:id>/preview/", views.import_preview, name="import_preview"),
+    path("import/<int:id>/dry-run/", views.import_dry_run, name="import_dry_run"),
     path("import/<int:id>/commit/", views.import_commit, name="import_commit"),
+    path("import/<int:id>/result/", views.import_result, name="import_result"),
+    path("import/<int:id>/progress/", views.import_progress, name="import_progress"),
 ]
@@ -3,21 +3,52 @@ from typing import Any, Dict, Callable, TypeVar
 import pandas as pd
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import HttpRequest, HttpResponse, JsonResponse, HttpResponseBase
+from django.core.paginator import Paginator
+from django.http import (
+    Http404,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBase,
+    JsonResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.http import require_GET
 
 from mouseapp.models import Project
 from mouseapp.views import AuthedRequest
 
-from .forms import ColumnMappingForm, MouseImportForm, MouseImportSheetRangeForm
-from .models import MouseImport
-from .services.importer import ImportOptions, Importer
+from .forms import (
+    ColumnMappingForm,
+    MouseImportBatchForm,
+    MouseImportForm,
+    MouseImportSheetRangeForm,
+)
+from .models import MouseImport, MouseImportJob
+from .services.batches import (
+    apply_range_to_batch,
+    batch_imports,
+    create_batch,
+    delete_batch,
+    parse_batch,
+)
+from .services.dry_run import ACTIONS, report_for
 from .services.io import list_sheet_names, read_range
-from .services.validators import cell_range_boundaries, normalise_cell_range
+from .services.jobs import (
+    enqueue_batch_commit,
+    enqueue_commit,
+    resume_batch_if_stale,
+    resume_if_stale,
+)
+from .services.preview_store import discard_preview, load_preview, save_preview
+from .services.sheet_cache import ensure_workbook_cache
+from .services.validators import (
+    cell_range_boundaries,
+    normalise_cell_range,
+    parse_cell_range,
+)
 
 from .services.mapping_ai import suggest_mapping_for_dataframe, record_mapping_examples
-from .services.mapping_train import maybe_train_mapping_model
+from .services.mapping_train import train_in_background
 from django.conf import settings
 
 # Type-checker-friendly aliases for decorators
@@ -26,6 +57,7 @@ login_required_decorator: Callable[[F], F] = login_required  # type: ignore[assi
 require_get_decorator: Callable[[F], F] = require_GET  # type: ignore[assignment]
 
 PREVIEW_ROW_LIMIT = settings.PREVIEW_ROW_LIMIT
+DRY_RUN_PAGE_SIZE = settings.DRY_RUN_PAGE_SIZE
 TRAIN_ON_SAVE = settings.TRAIN_ON_SAVE
 TRAIN_MIN_NEW = settings.TRAIN_MIN_NEW
 
@@ -77,6 +109,10 @@ def import_form(request: AuthedRequest) -> HttpResponse:
         import_obj.cell_range = ""
 
         import_obj.save()
+        # Parse the workbook once; the following steps slice the snapshot.
+        ensure_workbook_cache(
+            import_obj.file.path, original_filename=import_obj.original_filename
+        )
         messages.success(request, "Upload saved. Choose sheet and range…")
         return redirect("mouse_import:import_select_range", id=import_obj.id)
 
@@ -91,11 +127,51 @@ def import_form(request: AuthedRequest) -> HttpResponse:
     )
 
 
+@login_required_decorator
+def import_batch_form(request: AuthedRequest) -> HttpResponse:
+    """Upload several files to import with the first file's range and mapping."""
+    form = MouseImportBatchForm(request.POST or None, request.FILES or None)
+
+    if request.method == "POST" and form.is_valid():
+        batch = create_batch(
+            form.cleaned_data["project"],
+            form.cleaned_data["uploads"],
+            user=request.user,
+        )
+        errors = parse_batch(batch)
+        if errors:
+            delete_batch(batch)
+            for error in errors:
+                form.add_error("uploads", error)
+        else:
+            lead = batch_imports(batch.id)[0]
+            messages.success(
+                request,
+                "Uploads saved. Choose the sheet and range of the first file; "
+                "every file uses them.",
+            )
+            return redirect("mouse_import:import_select_range", id=lead.id)
+
+    return render(
+        request,
+        "mouse_import/import_batch_form.html",
+        {
+            "form": form,
+            "user": request.user,
+            "projects": Project.writable_for_user(request.user),
+        },
+    )
+
+
 @login_required_decorator
 def import_select_range(request: HttpRequest, id: int) -> HttpResponse:
     """Step 2: capture sheet_name + cell_range, with live preview."""
 
     import_obj = get_object_or_404(MouseImport, id=id)
+    # Uploads from before workbooks were cached get their snapshot here.
+    ensure_workbook_cache(
+        import_obj.file.path, original_filename=import_obj.original_filename
+    )
 
     try:
         sheets = list_sheet_names(
@@ -113,16 +189,25 @@ def import_select_range(request: HttpRequest, id: int) -> HttpResponse:
         form.save()
 
         # Range/sheet changes invalidate any cached preview + mapping selections.
-        request.session.pop(_df_session_key(import_obj.id), None)
+        discard_preview(
+            import_obj.id, request.session.pop(_df_session_key(import_obj.id), None)
+        )
         request.session.pop(_map_session_key(import_obj.id), None)
 
-        messages.success(request, "Range saved. Continue to mapping…")
-        return redirect("mouse_import:import_preview", id=import_obj.id)
+        batch_errors = (
+            apply_range_to_batch(import_obj) if import_obj.batch_id is not None else []
+        )
+        for error in batch_errors:
+            messages.error(request, error, extra_tags="range_error")
+        if not batch_errors:
+            messages.success(request, "Range saved. Continue to mapping…")
+            return redirect("mouse_import:import_preview", id=import_obj.id)
 
     context: Dict[str, Any] = {
         "import_obj": import_obj,
         "range_form": form,
         "sheet_names": sheets,
+        "batch_files": _batch_files(import_obj),
     }
     return render(request, "mouse_import/import_preview.html", context)
 
@@ -226,10 +311,10 @@ def import_preview(request: HttpRequest, id: int) -> HttpResponse:
     df_key = _df_session_key(import_obj.id)
     map_key = _map_session_key(import_obj.id)
 
+    df = None
     if df_key in request.session:
-        raw_df = request.session[df_key]
-        df = pd.read_json(raw_df, orient="records")
-    else:
+        df = load_preview(import_obj.id, request.session[df_key])
+    if df is None:
         try:
             df = read_range(
                 import_obj.file.path,
@@ -238,7 +323,7 @@ def import_preview(request: HttpRequest, id: int) -> HttpResponse:
                 original_filename=import_obj.original_filename,
                 limit=PREVIEW_ROW_LIMIT,
             )
-            request.session[df_key] = df.to_json(orient="records")
+            request.session[df_key] = save_preview(import_obj.id, df)
         except Exception as exc:  # pragma: no cover - reported to the user
             messages.error(
                 request, f"Error reading file range: {exc}", extra_tags="range_error"
@@ -267,7 +352,7 @@ def import_preview(request: HttpRequest, id: int) -> HttpResponse:
     suggestions_debug = None
     if saved_initial is None:
         suggested_initial, suggestions_debug = suggest_mapping_for_dataframe(
-            df, import_obj.project
+            df, import_obj.project, import_obj=import_obj
         )
 
     if request.method == "POST":
@@ -283,14 +368,10 @@ def import_preview(request: HttpRequest, id: int) -> HttpResponse:
                 import_obj, df, user=request.user, mapping=mapping
             )
 
-            # Trigger training (simple: on-save check) if enabled
+            # Trigger training (simple: on-save check) if enabled; it runs
+            # after the response, so its outcome is logged rather than shown.
             if TRAIN_ON_SAVE and created_n > 0:
-                outcome = maybe_train_mapping_model(min_new_examples=TRAIN_MIN_NEW)
-
-                # Keep low-noise unless training occurred/failure:
-                msg = outcome.user_message()
-                if msg:
-                    messages.info(request, msg)
+                train_in_background(min_new_examples=TRAIN_MIN_NEW)
 
             messages.success(request, "Column mapping saved.")
             return redirect("mouse_import:import_preview", id=import_obj.id)
@@ -305,6 +386,7 @@ def import_preview(request: HttpRequest, id: int) -> HttpResponse:
 
     context: Dict[str, Any] = {
         "import_obj": import_obj,
+        "batch_files": _batch_files(import_obj),
         "columns": columns,
         "rows": preview_rows,
         "form": form,
@@ -321,9 +403,20 @@ def import_commit(request: HttpRequest, id: int) -> HttpResponse:
 
     if not (import_obj.cell_range or "").strip():
         return redirect("mouse_import:import_select_range", id=import_obj.id)
+    if import_obj.batch_id is not None:
+        return _batch_commit(request, import_obj)
+    job = MouseImportJob.objects.filter(mouse_import=import_obj).first()
+    if import_obj.committed or (job is not None and job.status != "F"):
+        return redirect("mouse_import:import_result", id=import_obj.id)
+
     df_key = _df_session_key(import_obj.id)
     map_key = _map_session_key(import_obj.id)
 
+    if job is not None:
+        # Retry a failed commit from its last saved batch.
+        enqueue_commit(import_obj, job.fixed_fields, job.mapping)
+        return redirect("mouse_import:import_result", id=import_obj.id)
+
     _, fixed, mapping = request.session.get(map_key) or (None, None, None)
 
     if mapping is None or fixed is None:
@@ -333,37 +426,197 @@ def import_commit(request: HttpRequest, id: int) -> HttpResponse:
         )
         return redirect("mouse_import:import_preview", id=import_obj.id)
 
-    df = read_range(
-        import_obj.file.path,
-        import_obj.sheet_name,
-        import_obj.cell_range,
-        original_filename=import_obj.original_filename,
-        mapping=mapping,
+    enqueue_commit(import_obj, fixed, mapping)
+
+    discard_preview(import_obj.id, request.session.pop(df_key, None))
+    request.session.pop(map_key, None)
+
+    return redirect("mouse_import:import_result", id=import_obj.id)
+
+
+@login_required_decorator
+@require_get_decorator
+def import_dry_run(request: HttpRequest, id: int) -> HttpResponse:
+    """What committing the saved mapping would do to each row, page by page."""
+
+    import_obj = get_object_or_404(MouseImport, id=id)
+    if import_obj.committed:
+        return redirect("mouse_import:import_result", id=import_obj.id)
+    if not (import_obj.cell_range or "").strip():
+        return redirect("mouse_import:import_select_range", id=import_obj.id)
+
+    _, fixed, mapping = request.session.get(_map_session_key(import_obj.id)) or (
+        None,
+        None,
+        None,
     )
-    importer = Importer(
-        ImportOptions(
-            project_id=import_obj.project.id,
-            sheet=import_obj.sheet_name or "",
-            range_expr=import_obj.cell_range,
-        )
+    if mapping is None or fixed is None:
+        messages.error(request, "Save a column mapping before checking the commit.")
+        return redirect("mouse_import:import_preview", id=import_obj.id)
+
+    imports = (
+        batch_imports(import_obj.batch_id)
+        if import_obj.batch_id is not None
+        else [import_obj]
     )
-    created_ids, updated_ids, errors = importer.run(df, fixed, mapping)
+    try:
+        report = report_for(imports, fixed, mapping)
+    except Exception as exc:  # pragma: no cover - reported to the user
+        messages.error(request, f"Could not check the commit: {exc}")
+        return redirect("mouse_import:import_preview", id=import_obj.id)
+
+    action = request.GET.get("action", "")
+    rows = report.only(action) if action in ACTIONS else report
+    page_obj = Paginator(rows, DRY_RUN_PAGE_SIZE).get_page(request.GET.get("page"))
+
+    context: Dict[str, Any] = {
+        "import_obj": import_obj,
+        "batch_files": _batch_files(import_obj),
+        "report": report,
+        "counts": report.counts(),
+        "actions": ACTIONS,
+        "action_filter": action if action in ACTIONS else "",
+        "page_obj": page_obj,
+    }
+    return render(request, "mouse_import/import_dry_run.html", context)
+
+
+def _batch_commit(request: HttpRequest, import_obj: MouseImport) -> HttpResponse:
+    """`import_commit` for a file of a batch: commits every file of the batch."""
+    batch = import_obj.batch
+    batch_jobs = list(MouseImportJob.objects.filter(mouse_import__batch=batch))
+    if batch_jobs:
+        # Retry failed files from their last saved batch of rows.
+        if any(job.status == "F" for job in batch_jobs):
+            enqueue_batch_commit(
+                batch, batch_jobs[0].fixed_fields, batch_jobs[0].mapping
+            )
+        return redirect("mouse_import:import_result", id=import_obj.id)
 
-    import_obj.committed = True
-    import_obj.row_count = len(df)
-    import_obj.error_log = "\n".join(errors)[:5000] if errors else ""
+    df_key = _df_session_key(import_obj.id)
+    map_key = _map_session_key(import_obj.id)
+    _, fixed, mapping = request.session.get(map_key) or (None, None, None)
 
-    import_obj.file.delete()
+    if mapping is None or fixed is None:
+        messages.error(
+            request,
+            "Missing preview data or column mapping. Please re-upload and save the mapping.",
+        )
+        return redirect("mouse_import:import_preview", id=import_obj.id)
 
-    import_obj.save(update_fields=["committed", "row_count", "error_log"])
+    enqueue_batch_commit(batch, fixed, mapping)
 
-    request.session.pop(df_key, None)
+    discard_preview(import_obj.id, request.session.pop(df_key, None))
     request.session.pop(map_key, None)
 
+    return redirect("mouse_import:import_result", id=import_obj.id)
+
+
+def _batch_files(import_obj: MouseImport) -> list[str]:
+    if import_obj.batch_id is None:
+        return []
+    return [other.original_filename for other in batch_imports(import_obj.batch_id)]
+
+
+def _job_progress(import_obj: MouseImport, job: MouseImportJob) -> Dict[str, Any]:
+    _, first_row, _, last_row = parse_cell_range(import_obj.cell_range)
+    return {
+        "status": job.get_status_display(),
+        "committed": import_obj.committed,
+        "finished": job.status in {"D", "F"},
+        # Upper bound: the range may end with empty rows.
+        "rows_total": max(0, last_row - first_row),
+        "rows_processed": job.rows_processed,
+        "created": job.created_count,
+        "updated": job.updated_count,
+        "errors": len(job.errors),
+        "failure": job.failure,
+    }
+
+
+def _batch_progress(batch_jobs: list[MouseImportJob]) -> Dict[str, Any]:
+    """`_job_progress` summed over the files of a batch."""
+    per_file = [_job_progress(job.mouse_import, job) for job in batch_jobs]
+    # The first file not done yet, or one that stopped the batch.
+    current = next(
+        (job for job in batch_jobs if job.status == "F"),
+        next((job for job in batch_jobs if job.status != "D"), batch_jobs[-1]),
+    )
+    return {
+        "status": current.get_status_display(),
+        "committed": all(p["committed"] for p in per_file),
+        "finished": current.status in {"D", "F"},
+        "rows_total": sum(p["rows_total"] for p in per_file),
+        "rows_processed": sum(p["rows_processed"] for p in per_file),
+        "created": sum(p["created"] for p in per_file),
+        "updated": sum(p["updated"] for p in per_file),
+        "errors": sum(p["errors"] for p in per_file),
+        "failure": current.failure,
+    }
+
+
+def _batch_jobs(import_obj: MouseImport) -> list[MouseImportJob]:
+    batch_jobs = list(
+        MouseImportJob.objects.filter(mouse_import__batch_id=import_obj.batch_id)
+        .select_related("mouse_import")
+        .order_by("mouse_import__batch_position")
+    )
+    if not batch_jobs:
+        raise Http404("No commit of this batch has been started.")
+    resume_batch_if_stale(import_obj.batch_id, batch_jobs)
+    return batch_jobs
+
+
+@login_required_decorator
+@require_get_decorator
+def import_progress(request: HttpRequest, id: int) -> JsonResponse:
+    """Polled by the result page while the commit runs in the background."""
+
+    import_obj = get_object_or_404(MouseImport, id=id)
+    if import_obj.batch_id is not None:
+        return JsonResponse(_batch_progress(_batch_jobs(import_obj)))
+    job = get_object_or_404(MouseImportJob, mouse_import=import_obj)
+    resume_if_stale(job)
+    return JsonResponse(_job_progress(import_obj, job))
+
+
+@login_required_decorator
+def import_result(request: HttpRequest, id: int) -> HttpResponse:
+    import_obj = get_object_or_404(MouseImport, id=id)
+    if import_obj.batch_id is not None:
+        return _batch_result(request, import_obj)
+    job = get_object_or_404(MouseImportJob, mouse_import=import_obj)
+    resume_if_stale(job)
+
+    context = {
+        "import_obj": import_obj,
+        "job": job,
+        "progress": _job_progress(import_obj, job),
+        "created": job.created_count,
+        "updated": job.updated_count,
+        "errors": job.errors if job.status == "D" else [],
+    }
+    return render(request, "mouse_import/import_result.html", context)
+
+
+def _batch_result(request: HttpRequest, import_obj: MouseImport) -> HttpResponse:
+    batch_jobs = _batch_jobs(import_obj)
+    progress = _batch_progress(batch_jobs)
+    failed = next((job for job in batch_jobs if job.status == "F"), None)
+
+    # One report for the batch: each file's issues, prefixed with its name.
+    errors = [
+        f"{job.mouse_import.original_filename}: {error}"
+        for job in batch_jobs
+        for error in job.errors
+    ]
     context = {
         "import_obj": import_obj,
-        "created": len(created_ids),
-        "updated": len(updated_ids),
-        "errors": errors,
+        "job": failed or batch_jobs[0],
+        "batch_files": [job.mouse_import.original_filename for job in batch_jobs],
+        "progress": progress,
+        "created": progress["created"],
+        "updated": progress["updated"],
+        "errors": errors if progress["committed"] else [],
     }
     return render(request, "mouse_import/import_result.html", context)
@@ -7,6 +7,7 @@ from django.core.exceptions import ValidationError
 from django.contrib.auth.base_user import BaseUserManager
 from django.db.models import Q
 
+from .kinship import project_kinship
 from .models import Mouse, MouseObservation, Request, Project, RequestReply, StudyPlan
 
 
@@ -370,11 +371,62 @@ class RequestForm(forms.ModelForm):
         return mouse
 
 
+class PartnerChoiceField(forms.ModelChoiceField):
+    """Lists candidate mates with their kinship to the selected mouse, if known."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.kinship: dict[int, float] = {}
+
+    def label_from_instance(self, obj: Mouse) -> str:
+        label = f"{obj.strain} - Tube {obj.tube_number} ({obj.get_sex_display()})"
+        if obj.id in self.kinship:
+            label += f" - offspring inbreeding {self.kinship[obj.id]:.2%}"
+        return label
+
+
 class BreedingRequestForm(RequestForm):
     kind = forms.CharField(
         initial="B",
         widget=forms.HiddenInput(),
     )
+    partner = PartnerChoiceField(
+        queryset=Mouse.objects.none(),
+        required=False,
+        label="Partner",
+        widget=forms.Select(attrs={"class": "input", "id": "id_partner"}),
+        help_text="The proposed mate. Its kinship with the mouse is the "
+        "inbreeding coefficient of their offspring.",
+    )
+
+    class Meta(RequestForm.Meta):
+        fields = ["project", "mouse", "partner", "kind", "details"]
+
+    @override
+    def _set_mouse_queryset(self, project: Project, user: User) -> None:
+        super()._set_mouse_queryset(project, user)
+        mouse_field = self.fields["mouse"]
+        partner_field = self.fields["partner"]
+        if not isinstance(mouse_field, forms.ModelChoiceField) or not isinstance(
+            partner_field, PartnerChoiceField
+        ):
+            return
+
+        partner_field.queryset = mouse_field.queryset
+        mouse_id = self.data.get("mouse") or self.initial.get("mouse")
+        try:
+            mouse = mouse_field.queryset.get(id=int(mouse_id))
+        except (ValueError, TypeError, Mouse.DoesNotExist):
+            return
+
+        # Only mice of the opposite sex are offered, or accepted on submit.
+        candidates = mouse_field.queryset.exclude(sex=mouse.sex)
+        partner_field.queryset = candidates
+        # Left out until the project's table is built in the background.
+        if (table := project_kinship(project.id)) is not None:
+            partner_field.kinship = table.kinship_with(
+                mouse.id, candidates.values_list("id", flat=True)
+            )
 
 
 class CullingRequestForm(RequestForm):
@@ -0,0 +1,363 @@
+import logging
+from collections import OrderedDict, defaultdict, deque
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import batched
+from threading import Lock
+
+import numpy as np
+from django.db import close_old_connections, transaction
+from scipy import sparse
+from scipy.sparse.linalg import spsolve_triangular
+
+from .models import Mouse, MousePedigreeClosure
+
+logger = logging.getLogger(__name__)
+
+# Kinship tables kept per process; each costs a few numbers per mouse.
+MAX_CACHED_PROJECTS = 4
+# New mice appended to a cached table during a request; more are left to a
+# rebuild in the background.
+MAX_APPENDED_IN_REQUEST = 500
+# Mice whose kinships are worked out together, bounding the memory used to
+# (mice in the table) x SOLVE_COLUMNS floats.
+SOLVE_COLUMNS = 256
+
+BATCH_SIZE = 500
+
+_tables: OrderedDict[int, "KinshipTable"] = OrderedDict()
+# Projects whose table a background thread is building.
+_building: set[int] = set()
+_tables_lock = Lock()
+# One thread, so a process never builds two tables at once.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kinship")
+
+
+class KinshipTable:
+    """
+    Coefficients of kinship between mice of a pedigree, from its sparse
+    relationship matrix.
+
+    The kinship of a mouse with itself is `(1 + F) / 2`, where `F` is its
+    inbreeding coefficient (the kinship of its parents); with any earlier
+    mouse it is the mean of that mouse's kinship with the two parents, an
+    unknown parent counting as unrelated. The kinship of a proposed father
+    and mother is the inbreeding coefficient of their offspring.
+
+    Only the parent links and each mouse's inbreeding are stored. Twice the
+    kinship matrix factors as `T D T'`, where `T = (I - P)^-1` for the
+    matrix `P` of parent links (a half per known parent) and `D` is diagonal,
+    from the parents' inbreeding. A mouse's kinship with every other is then
+    two sparse triangular solves with `I - P`. Mice are added parents first,
+    a generation at a time, as a generation's inbreeding is the kinship of
+    parents already in the table.
+    """
+
+    def __init__(self):
+        self.parents: dict[int, tuple[int | None, int | None]] = {}
+        self.index: dict[int, int] = {}
+        # Positions of each mouse's parents, -1 for one unknown when it was added.
+        self._fathers = np.zeros(0, dtype=np.int64)
+        self._mothers = np.zeros(0, dtype=np.int64)
+        self._generation = np.zeros(0, dtype=np.int64)
+        self._inbreeding = np.zeros(0)
+        # The diagonal of D.
+        self._variance = np.zeros(0)
+        # I - P, and its transpose.
+        self._lower = sparse.csr_array((0, 0))
+        self._upper = sparse.csr_array((0, 0))
+
+    def __contains__(self, mouse_id: object) -> bool:
+        return mouse_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def add(self, parents: dict[int, tuple[int | None, int | None]]) -> None:
+        """Append new mice, given as `{id: (father_id, mother_id)}`."""
+        start = len(self.index)
+        # Published once their inbreeding is set, for readers of the table.
+        added: dict[int, int] = {}
+        fathers, mothers, generations = [], [], []
+        for mouse_id in _parents_first(parents):
+            father, mother = (
+                self.index.get(parent_id, added.get(parent_id, -1))
+                for parent_id in parents[mouse_id]
+            )
+            fathers.append(father)
+            mothers.append(mother)
+            parent_generations = (
+                self._generation_of(parent, generations, start)
+                for parent in (father, mother)
+            )
+            generations.append(1 + max(parent_generations))
+            added[mouse_id] = start + len(added)
+        if not added:
+            return
+
+        self._fathers = np.concatenate([self._fathers, fathers])
+        self._mothers = np.concatenate([self._mothers, mothers])
+        self._generation = np.concatenate([self._generation, generations])
+        self._inbreeding = np.concatenate([self._inbreeding, np.zeros(len(added))])
+        self._variance = np.concatenate([self._variance, np.zeros(len(added))])
+        self._build_matrices()
+
+        new = np.arange(start, start + len(added))
+        by_generation = new[np.argsort(self._generation[new], kind="stable")]
+        splits = np.flatnonzero(np.diff(self._generation[by_generation])) + 1
+        for generation in np.split(by_generation, splits):
+            self._add_generation(generation)
+
+        for mouse_id in added:
+            self.parents[mouse_id] = parents[mouse_id]
+        self.index.update(added)
+
+    def kinship(self, mouse_id: int, other_id: int) -> float | None:
+        if mouse_id not in self.index or other_id not in self.index:
+            return None
+        return self.kinship_with(mouse_id, [other_id])[other_id]
+
+    def inbreeding(self, mouse_id: int) -> float | None:
+        if mouse_id not in self.index:
+            return None
+        return float(self._inbreeding[self.index[mouse_id]])
+
+    def kinship_with(self, mouse_id: int, other_ids: Iterable[int]) -> dict[int, float]:
+        """Kinship of `mouse_id` with each of `other_ids` in the table."""
+        if mouse_id not in self.index:
+            return {}
+        other_ids = [other_id for other_id in other_ids if other_id in self.index]
+        rows = [self.index[other_id] for other_id in other_ids]
+        values = self._kinship_columns([self.index[mouse_id]])[rows, 0].tolist()
+        return dict(zip(other_ids, values))
+
+    def pair_kinship(self, father_ids: list[int], mother_ids: list[int]) -> np.ndarray:
+        """
+        Offspring inbreeding for every father x mother pair, as a matrix
+        with one row per father; mice missing from the table give NaN.
+        """
+        result = np.full((len(father_ids), len(mother_ids)), np.nan)
+        rows = [i for i, father_id in enumerate(father_ids) if father_id in self.index]
+        cols = [j for j, mother_id in enumerate(mother_ids) if mother_id in self.index]
+        mothers = [self.index[mother_ids[j]] for j in cols]
+        for chunk in batched(rows, SOLVE_COLUMNS):
+            fathers = [self.index[father_ids[i]] for i in chunk]
+            result[np.ix_(chunk, cols)] = self._kinship_columns(fathers)[mothers].T
+        return result
+
+    def _generation_of(self, position: int, new: list[int], start: int) -> int:
+        if position < 0:
+            return -1
+        if position < start:
+            return int(self._generation[position])
+        return new[position - start]
+
+    def _build_matrices(self) -> None:
+        size = len(self._fathers)
+        children = np.arange(size)
+        known_father, known_mother = self._fathers >= 0, self._mothers >= 0
+        rows = np.concatenate(
+            [children, children[known_father], children[known_mother]]
+        )
+        cols = np.concatenate(
+            [children, self._fathers[known_father], self._mothers[known_mother]]
+        )
+        values = np.concatenate(
+            [np.ones(size), np.full(known_father.sum() + known_mother.sum(), -0.5)]
+        )
+        # The solver takes 32-bit indices only.
+        self._lower = sparse.csr_array(
+            (values, (rows.astype(np.int32), cols.astype(np.int32))),
+            shape=(size, size),
+        )
+        self._upper = self._lower.T.tocsr()
+
+    def _add_generation(self, positions: np.ndarray) -> None:
+        """Set the inbreeding of mice whose parents are all in earlier generations."""
+        fathers, mothers = self._fathers[positions], self._mothers[positions]
+        both = (fathers >= 0) & (mothers >= 0)
+        if both.any():
+            distinct, column = np.unique(fathers[both], return_inverse=True)
+            size = int(max(fathers[both].max(), mothers[both].max())) + 1
+            kinship = np.concatenate(
+                [
+                    self._kinship_columns(list(chunk), size)
+                    for chunk in batched(distinct.tolist(), SOLVE_COLUMNS)
+                ],
+                axis=1,
+            )
+            self._inbreeding[positions[both]] = kinship[mothers[both], column]
+
+        # Each known parent takes (1 + F) / 4 off the variance of a founder.
+        variance = np.ones(len(positions))
+        for parents in (fathers, mothers):
+            known = parents >= 0
+            variance[known] -= 0.25 * (1 + self._inbreeding[parents[known]])
+        self._variance[positions] = variance
+
+    def _kinship_columns(
+        self, positions: list[int], size: int | None = None
+    ) -> np.ndarray:
+        """
+        Kinship of the mice at `positions` with the first `size` mice, one
+        column per mouse. Every ancestor of `positions` needs its variance set.
+        """
+        size = len(self.index) if size is None else size
+        lower, upper = self._lower, self._upper
+        if size < lower.shape[0]:
+            lower, upper = lower[:size, :size], upper[:size, :size]
+        # Columns of T', one per mouse, then T D T' for those columns.
+        columns = np.zeros((size, len(positions)))
+        columns[positions, np.arange(len(positions))] = 1
+        columns = spsolve_triangular(upper, columns, lower=False, unit_diagonal=True)
+        columns *= self._variance[:size, None]
+        return 0.5 * spsolve_triangular(lower, columns, lower=True, unit_diagonal=True)
+
+
+def project_kinship(project_id: int) -> KinshipTable | None:
+    """
+    Kinship table covering a project's mice and all of their ancestors, or
+    None while it is being built.
+
+    Tables are cached per process and built on a background thread, as a
+    large pedigree takes seconds. Each call re-reads the parent links; up to
+    `MAX_APPENDED_IN_REQUEST` mice that were only added are appended to the
+    cached table, and any other change has the table built again.
+    """
+    parents = _project_parents(project_id)
+
+    with _tables_lock:
+        table = _tables.get(project_id)
+        if table is not None and all(
+            parents.get(mouse_id) == links for mouse_id, links in table.parents.items()
+        ):
+            added = {
+                mouse_id: links
+                for mouse_id, links in parents.items()
+                if mouse_id not in table
+            }
+            if len(added) <= MAX_APPENDED_IN_REQUEST:
+                if added:
+                    table.add(added)
+                _tables.move_to_end(project_id)
+                return table
+        if project_id in _building:
+            return None
+        _building.add(project_id)
+
+    transaction.on_commit(lambda: _executor.submit(_build_in_thread, project_id))
+    return None
+
+
+def build_project_kinship(project_id: int) -> KinshipTable:
+    """Build the kinship table of a project now, and cache it."""
+    table = KinshipTable()
+    table.add(_project_parents(project_id))
+    with _tables_lock:
+        _tables[project_id] = table
+        _tables.move_to_end(project_id)
+        while len(_tables) > MAX_CACHED_PROJECTS:
+            _tables.popitem(last=False)
+    return table
+
+
+def _build_in_thread(project_id: int) -> None:
+    try:
+        build_project_kinship(project_id)
+    except Exception:
+        logger.exception("Building the kinship table of project %s failed", project_id)
+    finally:
+        with _tables_lock:
+            _building.discard(project_id)
+        close_old_connections()
+
+
+@dataclass(frozen=True)
+class BreedingPairKinship:
+    offspring_inbreeding: float
+    mouse_inbreeding: float
+    partner_inbreeding: float
+
+
+def breeding_pair_kinship(mouse: Mouse, partner: Mouse) -> BreedingPairKinship | None:
+    """
+    Inbreeding of a proposed pair's offspring, or None if not in one pedigree.
+
+    Without a cached project table, only the pair's ancestry is read.
+    """
+    table = project_kinship(mouse.project_id)
+    if table is None or mouse.id not in table or partner.id not in table:
+        table = KinshipTable()
+        table.add(_ancestry_parents([mouse.id, partner.id]))
+    offspring = table.kinship(mouse.id, partner.id)
+    if offspring is None:
+        return None
+    return BreedingPairKinship(
+        offspring_inbreeding=offspring,
+        mouse_inbreeding=table.inbreeding(mouse.id) or 0.0,
+        partner_inbreeding=table.inbreeding(partner.id) or 0.0,
+    )
+
+
+def clear_cache() -> None:
+    with _tables_lock:
+        _tables.clear()
+
+
+def _project_parents(project_id: int) -> dict[int, tuple[int | None, int | None]]:
+    # Ancestors may belong to other projects. The project's own mice are read
+    # separately in case the closure has not been rebuilt since a fixture load.
+    mouse_ids = set(
+        MousePedigreeClosure.objects.filter(
+            descendant__project_id=project_id
+        ).values_list("ancestor_id", flat=True)
+    )
+    mouse_ids.update(
+        Mouse.objects.filter(project_id=project_id).values_list("id", flat=True)
+    )
+    return _parents_of(mouse_ids)
+
+
+def _ancestry_parents(mouse_ids: list[int]) -> dict[int, tuple[int | None, int | None]]:
+    ancestor_ids = set(
+        MousePedigreeClosure.objects.filter(descendant_id__in=mouse_ids).values_list(
+            "ancestor_id", flat=True
+        )
+    )
+    return _parents_of(ancestor_ids | set(mouse_ids))
+
+
+def _parents_of(mouse_ids: set[int]) -> dict[int, tuple[int | None, int | None]]:
+    return {
+        mouse_id: (father_id, mother_id)
+        for id_batch in batched(sorted(mouse_ids), BATCH_SIZE)
+        for mouse_id, father_id, mother_id in Mouse.objects.filter(
+            id__in=id_batch
+        ).values_list("id", "father_id", "mother_id")
+    }
+
+
+def _parents_first(parents: dict[int, tuple[int | None, int | None]]) -> list[int]:
+    """Order new mice so that parents among them come before their offspring."""
+    children: dict[int, list[int]] = defaultdict(list)
+    waiting = dict.fromkeys(parents, 0)
+    for mouse_id, links in parents.items():
+        for parent_id in set(links):
+            if parent_id in parents:
+                children[parent_id].append(mouse_id)
+                waiting[mouse_id] += 1
+
+    queue = deque(sorted(mouse_id for mouse_id, count in waiting.items() if not count))
+    order: list[int] = []
+    while queue:
+        mouse_id = queue.popleft()
+        order.append(mouse_id)
+        for child_id in children[mouse_id]:
+            waiting[child_id] -= 1
+            if not waiting[child_id]:
+                queue.append(child_id)
+
+    # Mice on a parent cycle go last, with their unplaced parents unknown.
+    order.extend(sorted(mouse_id for mouse_id, count in waiting.items() if count))
+    return order
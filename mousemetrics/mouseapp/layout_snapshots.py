@@ -0,0 +1,137 @@
+from collections.abc import Iterable
+from dataclasses import dataclass
+from itertools import batched
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Mouse, PedigreeLayoutSnapshot
+from .pedigree import BATCH_SIZE, NODE_FIELDS, Pedigree, PedigreeNode, assign_ranks
+from .tree_layout import compute_layout
+
+
+@dataclass(frozen=True)
+class SnapshotPosition:
+    row: int
+    x: float
+    y: float
+
+
+def build_snapshot(
+    project_id: int,
+    strain_id: int,
+    *,
+    box_w: float,
+    box_h: float,
+    gap_x: float,
+    gap_y: float,
+) -> PedigreeLayoutSnapshot:
+    """Lay out every mouse of a strain in a project and store the result."""
+    snapshot, _ = PedigreeLayoutSnapshot.objects.get_or_create(
+        project_id=project_id, strain_id=strain_id
+    )
+    # Cleared before reading the mice, so a change made while the layout is
+    # computed marks the snapshot stale again instead of being lost.
+    PedigreeLayoutSnapshot.objects.filter(id=snapshot.id).update(stale=False)
+    snapshot.stale = False
+
+    pedigree = Pedigree(
+        {
+            row[0]: PedigreeNode(*row)
+            for row in Mouse.objects.filter(
+                project_id=project_id, strain_id=strain_id
+            ).values_list(*NODE_FIELDS)
+        }
+    )
+    layout = compute_layout(
+        pedigree,
+        assign_ranks(pedigree),
+        box_w=box_w,
+        box_h=box_h,
+        gap_x=gap_x,
+        gap_y=gap_y,
+    )
+    rows = [0] * len(layout.ids)
+    for row, layer in enumerate(layout.layers):
+        for index in layer.tolist():
+            rows[index] = row
+
+    snapshot.layout = {
+        "ids": layout.ids.tolist(),
+        "rows": rows,
+        "x": layout.x.tolist(),
+        "y": layout.y.tolist(),
+    }
+    snapshot.built_at = timezone.now()
+    snapshot.save(update_fields=["layout", "built_at"])
+    return snapshot
+
+
+def snapshots_to_build(rebuild_all: bool = False) -> list[tuple[int, int]]:
+    """(project id, strain id) groups whose snapshot is stale or missing."""
+    groups = set(
+        Mouse.objects.filter(strain__isnull=False)
+        .values_list("project_id", "strain_id")
+        .distinct()
+    )
+    if not rebuild_all:
+        groups -= set(
+            PedigreeLayoutSnapshot.objects.filter(stale=False).values_list(
+                "project_id", "strain_id"
+            )
+        )
+    return sorted(groups)
+
+
+def mark_stale(groups: Iterable[tuple[int, int | None]]) -> None:
+    query = Q()
+    for project_id, strain_id in set(groups):
+        if strain_id is not None:
+            query |= Q(project_id=project_id, strain_id=strain_id)
+    if query:
+        PedigreeLayoutSnapshot.objects.filter(query, stale=False).update(stale=True)
+
+
+def mark_stale_for_mice(mouse_ids: Iterable[int]) -> None:
+    mark_stale(
+        group
+        for id_batch in batched(sorted(set(mouse_ids)), BATCH_SIZE)
+        for group in Mouse.objects.filter(id__in=id_batch)
+        .values_list("project_id", "strain_id")
+        .distinct()
+    )
+
+
+def snapshot_positions(
+    project_id: int, strain_id: int | None, mouse_ids: Iterable[int]
+) -> dict[int, SnapshotPosition] | None:
+    """
+    Positions of `mouse_ids` in the group's fresh snapshot, translated so the
+    top-left box is in row 0 at (0, 0), or None if there is no fresh snapshot
+    or it does not hold every mouse.
+    """
+    if strain_id is None:
+        return None
+    snapshot = PedigreeLayoutSnapshot.objects.filter(
+        project_id=project_id, strain_id=strain_id, stale=False
+    ).first()
+    if snapshot is None or not snapshot.layout:
+        return None
+
+    layout = snapshot.layout
+    index = {mouse_id: i for i, mouse_id in enumerate(layout["ids"])}
+    wanted = [index.get(mouse_id) for mouse_id in mouse_ids]
+    if not wanted or None in wanted:
+        return None
+
+    top_row = min(layout["rows"][i] for i in wanted)
+    left_x = min(layout["x"][i] for i in wanted)
+    top_y = min(layout["y"][i] for i in wanted)
+    return {
+        layout["ids"][i]: SnapshotPosition(
+            row=layout["rows"][i] - top_row,
+            x=layout["x"][i] - left_x,
+            y=layout["y"][i] - top_y,
+        )
+        for i in wanted
+    }
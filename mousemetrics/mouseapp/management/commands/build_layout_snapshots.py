@@ -0,0 +1,83 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from mouseapp.layout_snapshots import build_snapshot, mark_stale, snapshots_to_build
+from mouseapp.views import GraphSVGRenderer
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the family tree layout snapshot of every project and strain whose "
+        "snapshot is stale or missing. With --interval, keep running as a worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Rebuild every snapshot, including those that are up to date.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=None,
+            help="Seconds to wait between rounds; runs once if not given.",
+        )
+
+    def handle(self, *args, **options):
+        if options["interval"] is None:
+            built, failed = self.build(options["all"])
+            self.stdout.write(self.style.SUCCESS(f"Built {built} layout snapshots."))
+            if failed:
+                raise CommandError(f"{failed} layout snapshots failed to build.")
+            return
+
+        rebuild_all = options["all"]
+        while True:
+            # A worker outlives database restarts and connection timeouts.
+            close_old_connections()
+            try:
+                built, failed = self.build(rebuild_all)
+            except Exception:
+                logger.exception("Could not look up the layout snapshots to build")
+            else:
+                if built:
+                    self.stdout.write(
+                        self.style.SUCCESS(f"Built {built} layout snapshots.")
+                    )
+                rebuild_all = False
+            time.sleep(options["interval"])
+
+    def build(self, rebuild_all: bool) -> tuple[int, int]:
+        """Build the snapshots due; returns how many were built and failed."""
+        built = failed = 0
+        for project_id, strain_id in snapshots_to_build(rebuild_all):
+            try:
+                build_snapshot(
+                    project_id,
+                    strain_id,
+                    box_w=GraphSVGRenderer.BOX_W,
+                    box_h=GraphSVGRenderer.BOX_H,
+                    gap_x=GraphSVGRenderer.GAP_X,
+                    gap_y=GraphSVGRenderer.GAP_Y,
+                )
+            except Exception:
+                logger.exception(
+                    "Building the layout snapshot of project %s, strain %s failed",
+                    project_id,
+                    strain_id,
+                )
+                failed += 1
+                # The build cleared its stale flag; set it again to retry it.
+                try:
+                    mark_stale([(project_id, strain_id)])
+                except Exception:
+                    logger.exception("Could not mark the snapshot stale again")
+            else:
+                built += 1
+        return built, failed
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from mouseapp.pedigree import rebuild_lineage_depths, rebuild_pedigree_closure
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the pedigree closure table and lineage depths from the parent "
+        "links, e.g. after loading fixtures or editing parents in raw SQL."
+    )
+
+    def handle(self, *args, **options):
+        links = rebuild_pedigree_closure()
+        rebuild_lineage_depths()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {links} pedigree links."))
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:33
+
+from collections import defaultdict, deque
+
+from django.db import migrations, models
+
+
+def fill_lineage_depths(apps, schema_editor):
+    Mouse = apps.get_model("mouseapp", "Mouse")
+    parents = {
+        mouse_id: [p for p in (father_id, mother_id) if p is not None]
+        for mouse_id, father_id, mother_id in Mouse.objects.values_list(
+            "id", "father_id", "mother_id"
+        )
+    }
+    children = defaultdict(list)
+    for mouse_id, parent_ids in parents.items():
+        for parent_id in parent_ids:
+            children[parent_id].append(mouse_id)
+
+    # Founders first; mice on a parent cycle are never reached and keep 0.
+    in_degree = {mouse_id: len(p) for mouse_id, p in parents.items()}
+    queue = deque(mouse_id for mouse_id, degree in in_degree.items() if not degree)
+    order = []
+    while queue:
+        mouse_id = queue.popleft()
+        order.append(mouse_id)
+        for child_id in children[mouse_id]:
+            in_degree[child_id] -= 1
+            if not in_degree[child_id]:
+                queue.append(child_id)
+
+    generation = dict.fromkeys(parents, 0)
+    for mouse_id in order:
+        for parent_id in parents[mouse_id]:
+            generation[mouse_id] = max(generation[mouse_id], generation[parent_id] + 1)
+
+    depth = dict.fromkeys(parents, 0)
+    for mouse_id in reversed(order):
+        for child_id in children[mouse_id]:
+            depth[mouse_id] = max(depth[mouse_id], depth[child_id] + 1)
+
+    Mouse.objects.bulk_update(
+        [
+            Mouse(
+                id=mouse_id,
+                generation=generation[mouse_id],
+                max_descendant_depth=depth[mouse_id],
+            )
+            for mouse_id in order
+        ],
+        ["generation", "max_descendant_depth"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mouseapp", "0025_alter_mouseobservation_type_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mouse",
+            name="generation",
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="mouse",
+            name="max_descendant_depth",
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(fill_lineage_depths, migrations.RunPython.noop),
+    ]
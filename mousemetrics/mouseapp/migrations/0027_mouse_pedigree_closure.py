@@ -0,0 +1,111 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:37
+
+from collections import defaultdict, deque
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_pedigree_closure(apps, schema_editor):
+    Mouse = apps.get_model("mouseapp", "Mouse")
+    MousePedigreeClosure = apps.get_model("mouseapp", "MousePedigreeClosure")
+    parents = {
+        mouse_id: [p for p in (father_id, mother_id) if p is not None]
+        for mouse_id, father_id, mother_id in Mouse.objects.values_list(
+            "id", "father_id", "mother_id"
+        )
+    }
+    children = defaultdict(list)
+    for mouse_id, parent_ids in parents.items():
+        for parent_id in parent_ids:
+            children[parent_id].append(mouse_id)
+
+    in_degree = {mouse_id: len(p) for mouse_id, p in parents.items()}
+    queue = deque(mouse_id for mouse_id, degree in in_degree.items() if not degree)
+    order = []
+    while queue:
+        mouse_id = queue.popleft()
+        order.append(mouse_id)
+        for child_id in children[mouse_id]:
+            in_degree[child_id] -= 1
+            if not in_degree[child_id]:
+                queue.append(child_id)
+    order.extend(sorted(mouse_id for mouse_id in parents if in_degree[mouse_id]))
+
+    ancestry = {}
+    rows = []
+    for mouse_id in order:
+        own = ancestry[mouse_id] = {mouse_id: 0}
+        for parent_id in parents[mouse_id]:
+            for ancestor_id, distance in ancestry.get(
+                parent_id, {parent_id: 0}
+            ).items():
+                if ancestor_id not in own or distance + 1 < own[ancestor_id]:
+                    own[ancestor_id] = distance + 1
+        rows.extend(
+            MousePedigreeClosure(
+                ancestor_id=ancestor_id, descendant_id=mouse_id, distance=distance
+            )
+            for ancestor_id, distance in own.items()
+        )
+
+    MousePedigreeClosure.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mouseapp", "0026_mouse_lineage_depths"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MousePedigreeClosure",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("distance", models.PositiveIntegerField()),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="descendant_links",
+                        to="mouseapp.mouse",
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ancestor_links",
+                        to="mouseapp.mouse",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["ancestor", "distance"],
+                        name="mouseapp_mo_ancesto_5dd3ae_idx",
+                    ),
+                    models.Index(
+                        fields=["descendant", "distance"],
+                        name="mouseapp_mo_descend_1d7da9_idx",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("ancestor", "descendant"), name="unique_pedigree_link"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_pedigree_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mouseapp", "0027_mouse_pedigree_closure"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="request",
+            name="partner",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="partner_requests",
+                to="mouseapp.mouse",
+            ),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mouseapp", "0028_request_partner"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PedigreeLayoutSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("layout", models.JSONField(default=dict, editable=False)),
+                ("stale", models.BooleanField(default=True)),
+                ("built_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="mouseapp.project",
+                    ),
+                ),
+                (
+                    "strain",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="mouseapp.strain",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("project", "strain"), name="unique_layout_snapshot"
+                    )
+                ],
+            },
+        ),
+    ]
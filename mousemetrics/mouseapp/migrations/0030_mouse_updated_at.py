@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:43
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mouseapp", "0029_pedigree_layout_snapshot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mouse",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_default=django.db.models.functions.datetime.Now()
+            ),
+        ),
+    ]
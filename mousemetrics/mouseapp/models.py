@@ -1,6 +1,7 @@
 from datetime import date
 from django.db import models
 from django.db.models import SET_NULL, Manager, query, Q
+from django.db.models.functions import Now
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
 from django.urls import reverse
@@ -216,9 +217,26 @@ class Mouse(models.Model):
 
     notes = models.TextField(blank=True)
 
+    # Lineage depths, maintained by mouseapp.pedigree.update_lineage_depths
+    # whenever parents change: generations below the founders, and the longest
+    # line of descendants.
+    generation = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    max_descendant_depth = models.PositiveIntegerField(
+        default=0, editable=False, db_index=True
+    )
+    # Bulk writes of importable fields set this themselves, as `auto_now` is
+    # only applied by `save()`, and raw loads get the database's clock. The
+    # import dry run's cache is keyed on it.
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+
     child_set_m: models.Manager
     child_set_f: models.Manager
 
+    # Set by mouseapp.signals between pre_save/pre_delete and the matching post_*.
+    _family_tree_before: dict | None
+    _family_tree_neighbours: set[int]
+    _lineage_children: set[int]
+
     class Meta:
         permissions = [
             ("edit_mice", "Can edit mouse details"),
@@ -231,10 +249,9 @@ class Mouse(models.Model):
         ]
 
     def descendant_depth(self) -> int:
-        children = list(self.child_set_m.all()) + list(self.child_set_f.all())
-        if not children:
-            return 0
-        return 1 + max(child.descendant_depth() for child in children)
+        from .pedigree import descendant_depth
+
+        return descendant_depth(self.id)
 
     def has_read_access(self, user: User) -> bool:
         return self.project.has_read_access(user) or user.has_perm("mouseapp.edit_mice")
@@ -258,6 +275,61 @@ class Mouse(models.Model):
         return reverse("mouseapp:mouse", args=[self.id])
 
 
+class MousePedigreeClosure(models.Model):
+    """
+    One row per ancestor of each mouse, including the mouse itself at distance
+    0, with the fewest generations between them. Maintained by
+    mouseapp.pedigree.update_pedigree_closure.
+    """
+
+    ancestor = models.ForeignKey(
+        Mouse, on_delete=models.CASCADE, related_name="descendant_links"
+    )
+    descendant = models.ForeignKey(
+        Mouse, on_delete=models.CASCADE, related_name="ancestor_links"
+    )
+    distance = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["ancestor", "descendant"], name="unique_pedigree_link"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["ancestor", "distance"]),
+            models.Index(fields=["descendant", "distance"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.distance})"
+
+
+class PedigreeLayoutSnapshot(models.Model):
+    """
+    Family tree layout of every mouse of one strain in a project, built in the
+    background by mouseapp.layout_snapshots and marked stale when parentage
+    in the group changes.
+    """
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    strain = models.ForeignKey(Strain, on_delete=models.CASCADE)
+    # Parallel lists: "ids", "rows", "x" and "y".
+    layout = models.JSONField(default=dict, editable=False)
+    stale = models.BooleanField(default=True)
+    built_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["project", "strain"], name="unique_layout_snapshot"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.project} / {self.strain}"
+
+
 class MouseObservation(models.Model):
     TYPE_CHOICES = {
         "PH": "Phenotype",
@@ -326,6 +398,14 @@ class Request(models.Model):
     mouse = models.ForeignKey(
         Mouse, on_delete=models.CASCADE, related_name="requests", null=True, blank=True
     )
+    # The proposed mate of `mouse` in a breeding request.
+    partner = models.ForeignKey(
+        Mouse,
+        on_delete=models.SET_NULL,
+        related_name="partner_requests",
+        null=True,
+        blank=True,
+    )
     creator = models.ForeignKey(
         User, on_delete=models.PROTECT, related_name="created_requests"
     )
@@ -0,0 +1,564 @@
+from collections import defaultdict, deque
+from collections.abc import Iterable
+from dataclasses import dataclass
+from itertools import batched, zip_longest
+
+from django.db import connection, transaction
+from django.db.models import Q, QuerySet
+
+from .models import Box, Mouse, MousePedigreeClosure, Strain
+
+# Keeps each `id__in` list comfortably below SQLite's bound-parameter limit.
+BATCH_SIZE = 500
+
+DEFAULT_MAX_DEPTH = 10
+
+NODE_FIELDS = (
+    "id",
+    "father_id",
+    "mother_id",
+    "sex",
+    "tube_number",
+    "strain__name",
+    "box__number",
+    "earmark",
+)
+
+
+@dataclass(frozen=True, slots=True)
+class PedigreeNode:
+    """The handful of `Mouse` columns the family tree needs, detached from the ORM."""
+
+    id: int
+    father_id: int | None
+    mother_id: int | None
+    sex: str
+    tube_number: int
+    strain_name: str | None
+    box_number: str | None
+    earmark: str
+
+    @property
+    def parent_ids(self) -> list[int]:
+        return [
+            parent_id
+            for parent_id in (self.father_id, self.mother_id)
+            if parent_id is not None
+        ]
+
+
+class Pedigree:
+    """An in-memory neighbourhood of the pedigree, indexed by mouse id."""
+
+    def __init__(self, nodes: dict[int, PedigreeNode]):
+        self.nodes = dict(sorted(nodes.items()))
+        self.children: dict[int, list[int]] = defaultdict(list)
+
+        for node in self.nodes.values():
+            for parent_id in node.parent_ids:
+                if parent_id in self.nodes:
+                    self.children[parent_id].append(node.id)
+
+    def __contains__(self, mouse_id: object) -> bool:
+        return mouse_id in self.nodes
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def parents_of(self, mouse_id: int) -> list[int]:
+        return [
+            parent_id
+            for parent_id in self.nodes[mouse_id].parent_ids
+            if parent_id in self.nodes
+        ]
+
+    def children_of(self, mouse_id: int) -> list[int]:
+        return self.children.get(mouse_id, [])
+
+
+def assign_ranks(pedigree: Pedigree) -> dict[int, int]:
+    """
+    Assign every mouse a generation row for drawing.
+
+    The first pass ranks each mouse one below its lowest-drawn parent (a
+    longest path from the founders). The second pass walks back up from the
+    youngest mice and pulls each parent down to sit just above its
+    highest-drawn child, so founders that joined the line late are not left
+    stranded at the top of the tree.
+    """
+    nodes = pedigree.nodes
+    in_degree = {mouse_id: len(pedigree.parents_of(mouse_id)) for mouse_id in nodes}
+
+    queue = deque(mouse_id for mouse_id, degree in in_degree.items() if degree == 0)
+    order: list[int] = []
+    ranks: dict[int, int] = {}
+
+    while queue:
+        mouse_id = queue.popleft()
+        order.append(mouse_id)
+
+        parent_ranks = [
+            ranks[parent_id]
+            for parent_id in pedigree.parents_of(mouse_id)
+            if parent_id in ranks
+        ]
+        ranks[mouse_id] = max(parent_ranks) + 1 if parent_ranks else 0
+
+        for child_id in pedigree.children_of(mouse_id):
+            in_degree[child_id] -= 1
+            if in_degree[child_id] == 0:
+                queue.append(child_id)
+
+    # Mice on (or descended from) a cycle in the parent links never reach an
+    # in-degree of zero; they start at the top and get a single pull-down.
+    unordered = [mouse_id for mouse_id in nodes if mouse_id not in ranks]
+    for mouse_id in unordered:
+        ranks[mouse_id] = 0
+
+    for mouse_id in reversed(order + unordered):
+        children = pedigree.children_of(mouse_id)
+        if children:
+            target_rank = min(ranks[child_id] for child_id in children) - 1
+            ranks[mouse_id] = max(ranks[mouse_id], target_rank)
+
+    return ranks
+
+
+def load_pedigree(start_id: int, max_depth: int = DEFAULT_MAX_DEPTH) -> Pedigree:
+    """
+    Load every mouse within `max_depth` parent/child steps of `start_id`.
+
+    PostgreSQL walks the neighbourhood in a single recursive CTE; other backends
+    walk it one generation at a time with batched `id__in` queries.
+    """
+    if connection.vendor == "postgresql":
+        nodes = _load_with_cte(start_id, max_depth)
+    else:
+        nodes = _load_batched([start_id], max_depth)
+    return Pedigree(nodes)
+
+
+def neighbourhood_ids(
+    mouse_ids: Iterable[int], max_depth: int = DEFAULT_MAX_DEPTH
+) -> set[int]:
+    """
+    Ids of every mouse within `max_depth` parent/child steps of any of `mouse_ids`.
+
+    Distance in the pedigree is symmetric, so these are also exactly the mice
+    whose own neighbourhood contains one of `mouse_ids`.
+    """
+    return set(_load_batched(mouse_ids, max_depth))
+
+
+def descendant_depth(mouse_id: int) -> int:
+    """
+    Length of the longest line of descendants below `mouse_id`, in one query.
+
+    The walk keeps one row per (mouse, depth), so descendants shared between
+    inbred lines are expanded once per depth rather than once per path. It
+    stops at the number of mice, which bounds any simple path, in case the
+    parent links contain a cycle.
+    """
+    mouse_table = connection.ops.quote_name(Mouse._meta.db_table)
+    sql = f"""
+        WITH RECURSIVE down(id, depth) AS (
+            SELECT id, 0 FROM {mouse_table} WHERE id = %s
+            UNION
+            SELECT child.id, down.depth + 1
+            FROM down JOIN {mouse_table} child
+                ON child.father_id = down.id OR child.mother_id = down.id
+            WHERE down.depth < (SELECT COUNT(*) FROM {mouse_table})
+        )
+        SELECT MAX(depth) FROM down
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [mouse_id])
+        (depth,) = cursor.fetchone()
+    return depth or 0
+
+
+def update_lineage_depths(
+    mouse_ids: Iterable[int], former_parent_ids: Iterable[int | None] = ()
+) -> dict[int, dict[str, int]]:
+    """
+    Refresh `Mouse.generation` and `Mouse.max_descendant_depth` after the
+    parents of `mouse_ids` changed; return the new values of the mice changed.
+
+    Run after `update_pedigree_closure`: generations only move for the
+    descendants it records below `mouse_ids`, and descendant depths for the
+    ancestors above `mouse_ids` and `former_parent_ids`. Each set is loaded in
+    batches and recomputed in memory, so the number of queries does not grow
+    with the depth of the pedigree. Values are written with `bulk_update`, so
+    no model signals fire.
+    """
+    mouse_ids = set(mouse_ids)
+    former_parent_ids = {
+        parent_id for parent_id in former_parent_ids if parent_id is not None
+    }
+    if not mouse_ids and not former_parent_ids:
+        return {}
+
+    below = mouse_ids | _closure_ids(mouse_ids, "ancestor_id", "descendant_id")
+    above = mouse_ids | former_parent_ids
+    above |= _closure_ids(above, "descendant_id", "ancestor_id")
+    return _refresh_lineage_depths(below, above)
+
+
+def rebuild_lineage_depths() -> int:
+    """Recompute the lineage depths of every mouse; return how many changed."""
+    mouse_ids = set(Mouse.objects.values_list("id", flat=True))
+    return len(_refresh_lineage_depths(mouse_ids, mouse_ids))
+
+
+def _refresh_lineage_depths(
+    below: set[int], above: set[int]
+) -> dict[int, dict[str, int]]:
+    changed: dict[int, dict[str, int]] = defaultdict(dict)
+    for mouse_id, generation in _refresh_generations(below).items():
+        changed[mouse_id]["generation"] = generation
+    for mouse_id, depth in _refresh_descendant_depths(above).items():
+        changed[mouse_id]["max_descendant_depth"] = depth
+    return dict(changed)
+
+
+def _closure_ids(mouse_ids: set[int], by: str, field: str) -> set[int]:
+    return {
+        related_id
+        for id_batch in batched(sorted(mouse_ids), BATCH_SIZE)
+        for related_id in MousePedigreeClosure.objects.filter(**{f"{by}__in": id_batch})
+        .values_list(field, flat=True)
+        .distinct()
+    }
+
+
+def _refresh_generations(mouse_ids: set[int]) -> dict[int, int]:
+    """
+    Set each mouse one generation below its latest parent, parents first;
+    return the mice changed. Parents outside `mouse_ids` keep their stored value.
+    """
+    parents: dict[int, list[int]] = {}
+    stored: dict[int, int] = {}
+    for id_batch in batched(sorted(mouse_ids), BATCH_SIZE):
+        rows = Mouse.objects.filter(id__in=id_batch).values_list(
+            "id",
+            "generation",
+            "father_id",
+            "father__generation",
+            "mother_id",
+            "mother__generation",
+        )
+        for mouse_id, generation, *parent_rows in rows:
+            stored[mouse_id] = generation
+            parents[mouse_id] = []
+            for parent_id, parent_generation in batched(parent_rows, 2):
+                if parent_id is not None:
+                    parents[mouse_id].append(parent_id)
+                    stored.setdefault(parent_id, parent_generation)
+
+    generations: dict[int, int] = {}
+    for mouse_id in _parents_first(parents):
+        known = [generations.get(p, stored[p]) for p in parents[mouse_id]]
+        generations[mouse_id] = max(known) + 1 if known else 0
+
+    changed = {
+        mouse_id: generation
+        for mouse_id, generation in generations.items()
+        if generation != stored[mouse_id]
+    }
+    Mouse.objects.bulk_update(
+        [Mouse(id=mouse_id, generation=g) for mouse_id, g in changed.items()],
+        ["generation"],
+        batch_size=BATCH_SIZE,
+    )
+    return changed
+
+
+def _refresh_descendant_depths(mouse_ids: set[int]) -> dict[int, int]:
+    """
+    Set each mouse one below its deepest child's depth, children first; return
+    the mice changed. Children outside `mouse_ids` keep their stored value.
+    """
+    children: dict[int, list[int]] = {mouse_id: [] for mouse_id in mouse_ids}
+    stored: dict[int, int] = {}
+    for id_batch in batched(sorted(mouse_ids), BATCH_SIZE):
+        rows = Mouse.objects.filter(
+            Q(id__in=id_batch) | Q(father_id__in=id_batch) | Q(mother_id__in=id_batch)
+        ).values_list("id", "father_id", "mother_id", "max_descendant_depth")
+        for child_id, father_id, mother_id, depth in rows:
+            stored[child_id] = depth
+            for parent_id in {father_id, mother_id} & children.keys():
+                children[parent_id].append(child_id)
+
+    depths: dict[int, int] = {}
+    for mouse_id in _parents_first(children):
+        below = [depths.get(c, stored[c]) + 1 for c in set(children[mouse_id])]
+        depths[mouse_id] = max(below, default=0)
+
+    changed = {
+        mouse_id: depth
+        for mouse_id, depth in depths.items()
+        if mouse_id in stored and depth != stored[mouse_id]
+    }
+    Mouse.objects.bulk_update(
+        [Mouse(id=mouse_id, max_descendant_depth=d) for mouse_id, d in changed.items()],
+        ["max_descendant_depth"],
+        batch_size=BATCH_SIZE,
+    )
+    return changed
+
+
+def _parents_first(parents: dict[int, list[int]]) -> list[int]:
+    """
+    Order the mice of `parents` so each comes after those of its parents in it.
+
+    Each mouse is visited once; mice on a parent cycle come last, sorted.
+    """
+    children: dict[int, list[int]] = defaultdict(list)
+    in_degree = dict.fromkeys(parents, 0)
+    for mouse_id, parent_ids in parents.items():
+        for parent_id in set(parent_ids):
+            if parent_id in parents:
+                children[parent_id].append(mouse_id)
+                in_degree[mouse_id] += 1
+
+    queue = deque(mouse_id for mouse_id, degree in in_degree.items() if not degree)
+    order: list[int] = []
+    while queue:
+        mouse_id = queue.popleft()
+        order.append(mouse_id)
+        for child_id in children[mouse_id]:
+            in_degree[child_id] -= 1
+            if not in_degree[child_id]:
+                queue.append(child_id)
+    order.extend(sorted(mouse_id for mouse_id in parents if in_degree[mouse_id]))
+    return order
+
+
+def descendants_within(mouse_id: int, generations: int) -> QuerySet[Mouse]:
+    """Mice descended from `mouse_id` by at most `generations` generations."""
+    return Mouse.objects.filter(
+        ancestor_links__ancestor_id=mouse_id,
+        ancestor_links__distance__range=(1, generations),
+    )
+
+
+def common_ancestors(mouse_id: int, other_id: int) -> QuerySet[Mouse]:
+    """Mice that are an ancestor of, or the same as, both mice."""
+    return Mouse.objects.filter(descendant_links__descendant_id=mouse_id).filter(
+        descendant_links__descendant_id=other_id
+    )
+
+
+def are_related(mouse_id: int, other_id: int) -> bool:
+    return common_ancestors(mouse_id, other_id).exists()
+
+
+def load_window(mouse_id: int, up: int, down: int) -> Pedigree:
+    """
+    Load `mouse_id`, its ancestors up to `up` generations back, its descendants
+    down to `down` generations, and the other parent of each descendant.
+    """
+    links = MousePedigreeClosure.objects.filter(
+        Q(descendant_id=mouse_id, distance__lte=up)
+        | Q(ancestor_id=mouse_id, distance__gt=0, distance__lte=down)
+    ).values_list("ancestor_id", "descendant_id")
+    ancestor_ids, descendant_ids = {mouse_id}, set()
+    for ancestor_id, descendant_id in links:
+        if descendant_id == mouse_id:
+            ancestor_ids.add(ancestor_id)
+        else:
+            descendant_ids.add(descendant_id)
+
+    nodes = _load_nodes(ancestor_ids | descendant_ids)
+    mates = {
+        parent_id
+        for descendant_id in descendant_ids & nodes.keys()
+        for parent_id in nodes[descendant_id].parent_ids
+    } - nodes.keys()
+    nodes.update(_load_nodes(mates))
+    return Pedigree(nodes)
+
+
+def generations_beyond(mouse_id: int, up: int, down: int) -> tuple[bool, bool]:
+    """Whether `mouse_id` has ancestors beyond `up` and descendants beyond `down`."""
+    links = MousePedigreeClosure.objects
+    return (
+        links.filter(descendant_id=mouse_id, distance=up + 1).exists(),
+        links.filter(ancestor_id=mouse_id, distance=down + 1).exists(),
+    )
+
+
+def _load_nodes(mouse_ids: Iterable[int]) -> dict[int, PedigreeNode]:
+    return {
+        row[0]: PedigreeNode(*row)
+        for id_batch in batched(sorted(set(mouse_ids)), BATCH_SIZE)
+        for row in Mouse.objects.filter(id__in=id_batch).values_list(*NODE_FIELDS)
+    }
+
+
+def update_pedigree_closure(mouse_ids: Iterable[int]) -> None:
+    """
+    Rewrite the `MousePedigreeClosure` rows of `mouse_ids` and their descendants
+    after the parents of `mouse_ids` changed (or the mice were created).
+
+    Every link that changed starts at one of `mouse_ids`, so the descendants
+    already recorded in the table are exactly the mice whose ancestry moved.
+    """
+    affected = set(mouse_ids)
+    for id_batch in batched(sorted(affected), BATCH_SIZE):
+        affected.update(
+            MousePedigreeClosure.objects.filter(ancestor_id__in=id_batch).values_list(
+                "descendant_id", flat=True
+            )
+        )
+
+    parents = _parents_by_id(affected)
+    ancestry: dict[int, dict[int, int]] = defaultdict(dict)
+    outside = {p for parent_ids in parents.values() for p in parent_ids} - affected
+    for id_batch in batched(sorted(outside), BATCH_SIZE):
+        rows = MousePedigreeClosure.objects.filter(
+            descendant_id__in=id_batch
+        ).values_list("descendant_id", "ancestor_id", "distance")
+        for descendant_id, ancestor_id, distance in rows:
+            ancestry[descendant_id][ancestor_id] = distance
+
+    with transaction.atomic():
+        for id_batch in batched(sorted(parents), BATCH_SIZE):
+            MousePedigreeClosure.objects.filter(descendant_id__in=id_batch).delete()
+        _write_closure(parents, ancestry)
+
+
+def rebuild_pedigree_closure() -> int:
+    """Recompute the whole `MousePedigreeClosure` table; return its new size."""
+    with transaction.atomic():
+        MousePedigreeClosure.objects.all().delete()
+        return _write_closure(_parents_by_id(None), defaultdict(dict))
+
+
+def _parents_by_id(mouse_ids: set[int] | None) -> dict[int, list[int]]:
+    """Parent ids of each existing mouse in `mouse_ids` (or every mouse)."""
+    if mouse_ids is None:
+        batches = [Mouse.objects.all()]
+    else:
+        batches = [
+            Mouse.objects.filter(id__in=id_batch)
+            for id_batch in batched(sorted(mouse_ids), BATCH_SIZE)
+        ]
+    return {
+        mouse_id: [p for p in (father_id, mother_id) if p is not None]
+        for queryset in batches
+        for mouse_id, father_id, mother_id in queryset.values_list(
+            "id", "father_id", "mother_id"
+        )
+    }
+
+
+def _write_closure(
+    parents: dict[int, list[int]], ancestry: dict[int, dict[int, int]]
+) -> int:
+    """
+    Derive and insert the ancestry of every mouse in `parents`, parents first.
+
+    `ancestry` must already hold the closure of any parent outside `parents`.
+    """
+    # Mice on a parent cycle get whatever ancestry is known when reached.
+    order = _parents_first(parents)
+
+    rows: list[MousePedigreeClosure] = []
+    written = 0
+    for mouse_id in order:
+        own = ancestry[mouse_id] = {mouse_id: 0}
+        for parent_id in parents[mouse_id]:
+            parent_ancestry = ancestry.get(parent_id) or {parent_id: 0}
+            for ancestor_id, distance in parent_ancestry.items():
+                best = own.get(ancestor_id)
+                if best is None or distance + 1 < best:
+                    own[ancestor_id] = distance + 1
+
+        rows.extend(
+            MousePedigreeClosure(
+                ancestor_id=ancestor_id, descendant_id=mouse_id, distance=distance
+            )
+            for ancestor_id, distance in own.items()
+        )
+        if len(rows) >= BATCH_SIZE:
+            MousePedigreeClosure.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+            written += len(rows)
+            rows = []
+
+    MousePedigreeClosure.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return written + len(rows)
+
+
+def _load_with_cte(start_id: int, max_depth: int) -> dict[int, PedigreeNode]:
+    mouse_table = connection.ops.quote_name(Mouse._meta.db_table)
+    strain_table = connection.ops.quote_name(Strain._meta.db_table)
+    box_table = connection.ops.quote_name(Box._meta.db_table)
+
+    # `edge` lists every parent/child link in both directions, so the walk
+    # reaches parents, children, and (transitively) everything in between.
+    sql = f"""
+        WITH RECURSIVE edge(mouse_id, relative_id) AS (
+            SELECT id, father_id FROM {mouse_table} WHERE father_id IS NOT NULL
+            UNION ALL
+            SELECT id, mother_id FROM {mouse_table} WHERE mother_id IS NOT NULL
+            UNION ALL
+            SELECT father_id, id FROM {mouse_table} WHERE father_id IS NOT NULL
+            UNION ALL
+            SELECT mother_id, id FROM {mouse_table} WHERE mother_id IS NOT NULL
+        ),
+        walk(id, depth) AS (
+            SELECT id, 0 FROM {mouse_table} WHERE id = %s
+            UNION
+            SELECT edge.relative_id, walk.depth + 1
+            FROM walk JOIN edge ON edge.mouse_id = walk.id
+            WHERE walk.depth < %s
+        )
+        SELECT m.id, m.father_id, m.mother_id, m.sex, m.tube_number,
+               s.name, b.number, m.earmark
+        FROM {mouse_table} m
+        LEFT JOIN {strain_table} s ON s.id = m.strain_id
+        LEFT JOIN {box_table} b ON b.id = m.box_id
+        WHERE m.id IN (SELECT id FROM walk)
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [start_id, max_depth])
+        return {row[0]: PedigreeNode(*row) for row in cursor.fetchall()}
+
+
+def _load_batched(start_ids: Iterable[int], max_depth: int) -> dict[int, PedigreeNode]:
+    nodes = _load_nodes(set(start_ids))
+    frontier = list(nodes)
+
+    for _ in range(max_depth):
+        if not frontier:
+            break
+
+        parent_ids = {
+            parent_id
+            for mouse_id in frontier
+            for parent_id in nodes[mouse_id].parent_ids
+            if parent_id not in nodes
+        }
+
+        found: dict[int, PedigreeNode] = {}
+        for frontier_batch, parent_batch in zip_longest(
+            batched(frontier, BATCH_SIZE),
+            batched(sorted(parent_ids), BATCH_SIZE),
+            fillvalue=(),
+        ):
+            relatives = Mouse.objects.filter(
+                Q(id__in=parent_batch)
+                | Q(father_id__in=frontier_batch)
+                | Q(mother_id__in=frontier_batch)
+            )
+            for row in relatives.values_list(*NODE_FIELDS):
+                if row[0] not in nodes:
+                    found[row[0]] = PedigreeNode(*row)
+
+        nodes.update(found)
+        frontier = list(found)
+
+    return nodes
@@ -0,0 +1,136 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.db.models import Q
+from django.dispatch import receiver
+
+from . import tree_cache
+from .layout_snapshots import mark_stale
+from .models import Box, Mouse, Strain
+from .pedigree import (
+    neighbourhood_ids,
+    update_lineage_depths,
+    update_pedigree_closure,
+)
+
+# Fields that are either drawn in the family tree or shape its layout.
+FAMILY_TREE_FIELDS = ("father_id", "mother_id", "box_id", "strain_id", "earmark")
+PARENT_FIELDS = ("father_id", "mother_id")
+# Fields that change which strain layout snapshot a mouse is in, or its place.
+SNAPSHOT_FIELDS = ("father_id", "mother_id", "strain_id", "project_id")
+# Denormalised columns owned by `update_lineage_depths`, never by the caller.
+LINEAGE_FIELDS = ("generation", "max_descendant_depth")
+
+
+@receiver(pre_save, sender=Mouse)
+def snapshot_family_tree(sender, instance: Mouse, **kwargs) -> None:
+    instance._family_tree_before = None
+    instance._family_tree_neighbours = set()
+    if instance.id is None:
+        return
+
+    before = (
+        Mouse.objects.filter(id=instance.id)
+        .values(*FAMILY_TREE_FIELDS, "project_id", *LINEAGE_FIELDS)
+        .first()
+    )
+    if before:
+        # The instance may have been loaded before its relatives changed.
+        for field in LINEAGE_FIELDS:
+            setattr(instance, field, before.pop(field))
+    instance._family_tree_before = before
+
+    # Re-parenting moves the mouse out of trees it was previously drawn in,
+    # which can only be found while the old links are still in the database.
+    if before and any(
+        before[field] != getattr(instance, field) for field in PARENT_FIELDS
+    ):
+        instance._family_tree_neighbours = neighbourhood_ids([instance.id])
+
+
+@receiver(post_save, sender=Mouse)
+def invalidate_saved_mouse(sender, instance: Mouse, created: bool, **kwargs) -> None:
+    before = getattr(instance, "_family_tree_before", None)
+    if not created and before is not None:
+        if all(before[field] == getattr(instance, field) for field in before):
+            return
+
+    tree_cache.drop_stamps(
+        getattr(instance, "_family_tree_neighbours", set())
+        | neighbourhood_ids([instance.id])
+    )
+
+
+@receiver(post_save, sender=Mouse)
+def update_saved_mouse_pedigree(
+    sender, instance: Mouse, created: bool, raw: bool, **kwargs
+) -> None:
+    # Fixtures may load children before their parents, so their closure and
+    # lineage depths are left to `rebuild_pedigree` afterwards.
+    if raw:
+        return
+
+    before = getattr(instance, "_family_tree_before", None)
+    former_parent_ids = []
+    if before is not None:
+        former_parent_ids = [before[field] for field in PARENT_FIELDS]
+        if former_parent_ids == [getattr(instance, f) for f in PARENT_FIELDS]:
+            return
+    elif not created:
+        return
+
+    update_pedigree_closure([instance.id])
+    changed = update_lineage_depths([instance.id], former_parent_ids)
+    for field, value in changed.get(instance.id, {}).items():
+        setattr(instance, field, value)
+
+
+@receiver(post_save, sender=Mouse)
+def mark_saved_mouse_layout_stale(
+    sender, instance: Mouse, created: bool, **kwargs
+) -> None:
+    before = getattr(instance, "_family_tree_before", None)
+    if not created and before is not None:
+        if all(before[field] == getattr(instance, field) for field in SNAPSHOT_FIELDS):
+            return
+    groups = [(instance.project_id, instance.strain_id)]
+    if before is not None:
+        groups.append((before["project_id"], before["strain_id"]))
+    mark_stale(groups)
+
+
+@receiver(pre_delete, sender=Mouse)
+def snapshot_deleted_mouse(sender, instance: Mouse, **kwargs) -> None:
+    instance._family_tree_neighbours = neighbourhood_ids([instance.id])
+    instance._lineage_children = set(
+        Mouse.objects.filter(
+            Q(father_id=instance.id) | Q(mother_id=instance.id)
+        ).values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Mouse)
+def invalidate_deleted_mouse(sender, instance: Mouse, **kwargs) -> None:
+    tree_cache.drop_stamps(getattr(instance, "_family_tree_neighbours", set()))
+    mark_stale([(instance.project_id, instance.strain_id)])
+    # Deleting a parent nulls its children's links without saving them.
+    children = getattr(instance, "_lineage_children", set())
+    update_pedigree_closure(children)
+    update_lineage_depths(
+        children,
+        [instance.father_id, instance.mother_id],
+    )
+
+
+@receiver(post_save, sender=Box)
+def invalidate_saved_box(sender, instance: Box, created: bool, **kwargs) -> None:
+    if not created:
+        tree_cache.invalidate_trees_containing(
+            Mouse.objects.filter(box=instance).values_list("id", flat=True)
+        )
+
+
+@receiver(post_save, sender=Strain)
+def invalidate_saved_strain(sender, instance: Strain, created: bool, **kwargs) -> None:
+    if not created:
+        tree_cache.invalidate_trees_containing(
+            Mouse.objects.filter(strain=instance).values_list("id", flat=True)
+        )
@@ -0,0 +1,38 @@
+import random
+from collections.abc import Callable
+
+import pytest
+
+from mouseapp.pedigree import Pedigree, PedigreeNode
+
+
+def _generated_pedigree(size: int, seed: int = 0) -> Pedigree:
+    rng = random.Random(seed)
+    nodes: dict[int, PedigreeNode] = {}
+
+    for mouse_id in range(1, size + 1):
+        # Parents are drawn mostly from recent mice, giving deep, inbred lines
+        # with the occasional late founder or single known parent.
+        def pick_parent() -> int | None:
+            if mouse_id <= 20 or rng.random() < 0.1:
+                return None
+            return rng.randint(max(1, mouse_id - 200), mouse_id - 1)
+
+        nodes[mouse_id] = PedigreeNode(
+            id=mouse_id,
+            father_id=pick_parent(),
+            mother_id=pick_parent(),
+            sex=rng.choice("MF"),
+            tube_number=mouse_id,
+            strain_name=None,
+            box_number=None,
+            earmark="",
+        )
+
+    return Pedigree(nodes)
+
+
+@pytest.fixture
+def generated_pedigree() -> Callable[..., Pedigree]:
+    """Build a random in-memory pedigree of the given size."""
+    return _generated_pedigree
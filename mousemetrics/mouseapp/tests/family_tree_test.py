@@ -1,8 +1,15 @@
 from datetime import date
 import pytest
 from django.urls import reverse
+from mouseapp import tree_cache
 from mouseapp.models import Mouse, Box, Project, Strain
-from mouseapp.views import get_descendant_graph
+from mouseapp.pedigree import _load_batched, _load_with_cte, load_pedigree
+from mouseapp.views import (
+    DEFAULT_MAX_DEPTH,
+    GraphSVGRenderer,
+    get_descendant_graph,
+    layout_graph,
+)
 
 
 def s(n):
@@ -72,7 +79,7 @@ def test_render_container(client, mice, django_user_model):
 
     assert response.status_code == 200
     expected_url = reverse("mouseapp:family_tree_svg", args=[ref.id])
-    assert expected_url in response.content.decode()
+    assert expected_url in response.getvalue().decode()
 
 
 @pytest.mark.django_db
@@ -90,7 +97,7 @@ def test_render_svg_image(client, mice, django_user_model):
 
     assert response.status_code == 200
     assert response["Content-Type"] == "image/svg+xml"
-    assert "<svg" in response.content.decode()
+    assert "<svg" in response.getvalue().decode()
 
 
 @pytest.mark.django_db
@@ -98,16 +105,271 @@ def test_get_descendant_graph_logic(mice):
     (grandfather, father, mother, ref, child) = mice
 
     layers_from_ref = get_descendant_graph(ref)
+    layer_ids = {
+        rank: [node.id for node in layer] for rank, layer in layers_from_ref.items()
+    }
 
-    all_mice = [m for layer in layers_from_ref.values() for m in layer]
-    assert ref in all_mice
-    assert grandfather in all_mice
+    all_mice = [mouse_id for layer in layer_ids.values() for mouse_id in layer]
+    assert ref.id in all_mice
+    assert grandfather.id in all_mice
 
-    assert grandfather in layers_from_ref[0]
+    assert grandfather.id in layer_ids[0]
 
-    assert mother in layers_from_ref[1]
-    assert father in layers_from_ref[1]
+    assert mother.id in layer_ids[1]
+    assert father.id in layer_ids[1]
 
-    assert ref in layers_from_ref[2]
+    assert ref.id in layer_ids[2]
 
-    assert child in layers_from_ref[3]
+    assert child.id in layer_ids[3]
+
+
+@pytest.mark.django_db
+def test_load_pedigree_respects_max_depth(mice):
+    (grandfather, father, mother, ref, child) = mice
+
+    pedigree = load_pedigree(child.id, max_depth=2)
+
+    assert set(pedigree.nodes) == {father.id, mother.id, ref.id, child.id}
+    assert pedigree.children_of(ref.id) == [child.id]
+    assert pedigree.parents_of(ref.id) == [father.id, mother.id]
+    assert pedigree.nodes[ref.id].strain_name == "MF"
+    assert pedigree.nodes[ref.id].box_number == "0"
+
+
+@pytest.mark.django_db
+def test_load_pedigree_query_count(mice, django_assert_max_num_queries):
+    (_, _, _, ref, _) = mice
+
+    # One query for the focus mouse, then at most one per generation walked.
+    with django_assert_max_num_queries(1 + 10):
+        pedigree = load_pedigree(ref.id)
+
+    assert len(pedigree) == len(mice)
+
+
+@pytest.mark.django_db
+def test_cte_loader_matches_batched_loader(mice):
+    for mouse in mice:
+        for depth in range(4):
+            assert _load_with_cte(mouse.id, depth) == _load_batched([mouse.id], depth)
+
+
+@pytest.fixture
+def svg_client(client, mice, django_user_model):
+    user = django_user_model.objects.create_user(
+        username="testuser_cache",
+        password="password",  # pragma: allowlist secret
+    )
+    mice[0].project.researchers.add(user)
+    client.force_login(user)
+    return client
+
+
+def get_svg(client, mouse, **headers):
+    return client.get(reverse("mouseapp:family_tree_svg", args=[mouse.id]), **headers)
+
+
+@pytest.mark.django_db
+def test_svg_is_cached(svg_client, mice, monkeypatch):
+    (_, _, _, ref, _) = mice
+
+    first = get_svg(svg_client, ref)
+    assert first.status_code == 200
+    assert first.streaming
+    assert first["ETag"]
+    assert first["Last-Modified"]
+    # The SVG is cached once the streamed response has been read to the end.
+    content = first.getvalue()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("layout should have been served from the cache")
+
+    monkeypatch.setattr("mouseapp.views.layout_graph", fail)
+    second = get_svg(svg_client, ref)
+    assert second.getvalue() == content
+    assert second["ETag"] == first["ETag"]
+
+    revalidated = get_svg(svg_client, ref, HTTP_IF_NONE_MATCH=first["ETag"])
+    assert revalidated.status_code == 304
+
+
+@pytest.mark.django_db
+def test_svg_is_cached_in_parts(
+    svg_client, mice, monkeypatch, django_assert_num_queries
+):
+    (_, _, _, ref, _) = mice
+    monkeypatch.setattr(GraphSVGRenderer, "CHUNK_SIZE", 200)
+    monkeypatch.setattr(tree_cache, "SVG_PART_CHARS", 500)
+
+    content = get_svg(svg_client, ref).getvalue()
+    key = tree_cache.current_stamp(ref.id).svg_key(DEFAULT_MAX_DEPTH, "light")
+    parts = tree_cache.cache.get(key)
+    assert parts > 1
+    assert len(tree_cache.cache.get(f"{key}:0")) < len(content)
+    assert get_svg(svg_client, ref).getvalue() == content
+    stamp = tree_cache.current_stamp(ref.id)
+    # The part count, then every part at once.
+    with django_assert_num_queries(2):
+        cached = tree_cache.get_svg(stamp, DEFAULT_MAX_DEPTH, "light")
+    assert "".join(cached).encode() == content
+
+    # A part evicted on its own has the tree drawn again.
+    tree_cache.cache.delete(f"{key}:{parts - 1}")
+    drawn = []
+    monkeypatch.setattr(
+        "mouseapp.views.layout_graph",
+        lambda *args: drawn.append(args) or layout_graph(*args),
+    )
+    assert get_svg(svg_client, ref).getvalue() == content
+    assert len(drawn) == 1 and tree_cache.cache.get(f"{key}:{parts - 1}")
+
+
+@pytest.mark.django_db
+def test_svg_etag_depends_on_theme(svg_client, mice):
+    (_, _, _, ref, _) = mice
+
+    light = get_svg(svg_client, ref)
+    dark = svg_client.get(
+        reverse("mouseapp:family_tree_svg", args=[ref.id]), {"theme": "dark"}
+    )
+    assert light["ETag"] != dark["ETag"]
+    assert light.getvalue() != dark.getvalue()
+
+
+@pytest.mark.django_db
+def test_svg_cache_invalidated_by_change_in_tree(
+    svg_client, mice, django_capture_on_commit_callbacks
+):
+    (grandfather, _, _, ref, _) = mice
+
+    before = get_svg(svg_client, ref)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        grandfather.earmark = "TRBL"
+        grandfather.save()
+        # Until the save commits, other requests still see the old tree.
+        stamp_before_commit = tree_cache.current_stamp(ref.id)
+    assert before["ETag"] == stamp_before_commit.etag(DEFAULT_MAX_DEPTH, "light")
+
+    after = get_svg(svg_client, ref, HTTP_IF_NONE_MATCH=before["ETag"])
+    assert after.status_code == 200
+    assert after["ETag"] != before["ETag"]
+    assert "Earmark: TRBL" in after.getvalue().decode()
+
+
+@pytest.mark.django_db
+def test_svg_cache_invalidated_when_mouse_leaves_tree(
+    svg_client, mice, django_capture_on_commit_callbacks
+):
+    (_, _, _, ref, child) = mice
+
+    before = get_svg(svg_client, ref)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        child.mother = None
+        child.save()
+
+    after = get_svg(svg_client, ref)
+    assert after["ETag"] != before["ETag"]
+    assert f'id="node-{child.id}"' not in after.getvalue().decode()
+
+
+@pytest.mark.django_db
+def test_svg_cache_kept_for_unrelated_changes(svg_client, mice):
+    (grandfather, _, _, ref, _) = mice
+
+    before = get_svg(svg_client, ref)
+
+    grandfather.notes = "Not drawn in the tree"
+    grandfather.save()
+    Mouse.objects.create(
+        project=ref.project,
+        box=ref.box,
+        strain=s("Unrelated"),
+        sex="M",
+        date_of_birth=date(1970, 1, 1),
+        tube_number=1,
+    )
+
+    after = get_svg(svg_client, ref, HTTP_IF_NONE_MATCH=before["ETag"])
+    assert after.status_code == 304
+
+
+@pytest.mark.django_db
+def test_svg_stream_matches_single_render(mice, monkeypatch):
+    (_, _, _, ref, _) = mice
+
+    renderer = GraphSVGRenderer()
+    layout_graph(renderer, ref)
+    monkeypatch.setattr(GraphSVGRenderer, "CHUNK_SIZE", 1)
+    chunks = list(renderer.stream_svg(dark=True))
+
+    assert len(chunks) > 1
+    document = "".join(chunks)
+    assert document == renderer.get_final_svg(dark=True)
+    assert document.count("<style>") == 1
+    assert document.count('class="node"') == len(mice)
+    assert reverse("mouseapp:mouse", args=[ref.id]) in document
+    assert reverse("mouseapp:family_tree", args=[ref.id]) in document
+
+
+@pytest.mark.django_db
+def test_svg_escapes_labels(svg_client, mice):
+    (_, _, _, ref, _) = mice
+
+    ref.earmark = "<L&R>"
+    ref.save()
+
+    content = get_svg(svg_client, ref).getvalue().decode()
+    assert "Earmark: &lt;L&amp;R&gt;" in content
+    assert "<L&R>" not in content
+
+
+@pytest.mark.django_db
+def test_json_window_around_mouse(client, mice, django_user_model):
+    (grandfather, father, mother, ref, child) = mice
+
+    user = django_user_model.objects.create_user(
+        username="testuser_json",
+        password="password",  # pragma: allowlist secret
+    )
+    ref.project.researchers.add(user)
+    client.force_login(user)
+    url = reverse("mouseapp:family_tree_json", args=[ref.id])
+
+    window = client.get(url, {"up": 1, "down": 0}).json()
+
+    assert {node["id"] for node in window["nodes"]} == {father.id, mother.id, ref.id}
+    assert sorted((e["parent"], e["child"]) for e in window["edges"]) == sorted(
+        [(father.id, ref.id), (mother.id, ref.id)]
+    )
+    rows = {node["id"]: node["row"] for node in window["nodes"]}
+    assert rows[father.id] == rows[mother.id] == rows[ref.id] - 1
+    assert window["cursors"]["up"] == f"{url}?up=3&down=0"
+    assert window["cursors"]["down"] == f"{url}?up=1&down=2"
+
+    wider = client.get(window["cursors"]["up"]).json()
+    assert grandfather.id in {node["id"] for node in wider["nodes"]}
+    assert wider["cursors"]["up"] is None
+
+    below = client.get(window["cursors"]["down"]).json()
+    assert child.id in {node["id"] for node in below["nodes"]}
+    assert below["cursors"]["down"] is None
+
+
+@pytest.mark.django_db
+def test_json_window_checks_access_and_bounds(client, mice, django_user_model):
+    ref = mice[3]
+    user = django_user_model.objects.create_user(
+        username="testuser_json_bounds",
+        password="password",  # pragma: allowlist secret
+    )
+    client.force_login(user)
+    url = reverse("mouseapp:family_tree_json", args=[ref.id])
+
+    assert client.get(url).status_code == 403
+
+    ref.project.researchers.add(user)
+    assert client.get(url, {"up": "many"}).status_code == 400
+    assert client.get(url, {"down": 99}).status_code == 400
+    assert client.get(url).json()["window"] == {"up": 2, "down": 2}
@@ -0,0 +1,254 @@
+from datetime import date
+from functools import cache
+
+import pytest
+from django.urls import reverse
+
+from mouseapp import kinship
+from mouseapp.kinship import KinshipTable, build_project_kinship, project_kinship
+from mouseapp.models import Box, Mouse, Project, Request, Strain
+
+#  1 x 2       3
+#  |   |       |
+#  4   5   x   6
+#      |   |
+#      7 x 8 (full siblings)
+#        |
+#        9
+FAMILY = {
+    1: (None, None),
+    2: (None, None),
+    3: (None, None),
+    4: (1, 2),
+    5: (1, 2),
+    6: (3, None),
+    7: (6, 5),
+    8: (6, 5),
+    9: (7, 8),
+}
+
+
+def reference_kinship(parents: dict[int, tuple[int | None, int | None]]):
+    """The recursive definition, recursing on whichever mouse is younger."""
+    order = {mouse_id: i for i, mouse_id in enumerate(kinship._parents_first(parents))}
+
+    @cache
+    def kin(a: int | None, b: int | None) -> float:
+        if a is None or b is None:
+            return 0.0
+        if a == b:
+            return 0.5 * (1 + kin(*parents[a]))
+        if order[a] < order[b]:
+            a, b = b, a
+        father, mother = parents[a]
+        return 0.5 * (kin(father, b) + kin(mother, b))
+
+    return kin
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    kinship.clear_cache()
+    yield
+    kinship.clear_cache()
+
+
+def test_textbook_coefficients():
+    table = KinshipTable()
+    table.add(FAMILY)
+
+    assert table.kinship(1, 1) == 0.5
+    assert table.kinship(1, 2) == 0
+    assert table.kinship(1, 4) == 0.25  # parent and offspring
+    assert table.kinship(4, 5) == 0.25  # full siblings
+    assert table.kinship(6, 5) == 0
+    assert table.kinship(7, 8) == 0.25
+    assert table.inbreeding(9) == 0.25
+    assert table.kinship(9, 9) == 0.625
+    assert table.inbreeding(7) == 0
+    assert table.kinship(1, 99) is None
+
+
+def test_table_matches_recursive_definition(generated_pedigree):
+    pedigree = generated_pedigree(400, seed=3)
+    parents = {
+        node.id: (node.father_id, node.mother_id) for node in pedigree.nodes.values()
+    }
+    kin = reference_kinship(parents)
+
+    table = KinshipTable()
+    table.add(parents)
+
+    ids = list(parents)
+    fathers, mothers = ids[::7], ids[3::11]
+    matrix = table.pair_kinship(fathers, mothers)
+    for i, father in enumerate(fathers):
+        for j, mother in enumerate(mothers):
+            assert matrix[i, j] == pytest.approx(kin(father, mother), abs=1e-6)
+
+
+def test_table_grows_incrementally(generated_pedigree):
+    pedigree = generated_pedigree(300, seed=5)
+    parents = {
+        node.id: (node.father_id, node.mother_id) for node in pedigree.nodes.values()
+    }
+
+    whole = KinshipTable()
+    whole.add(parents)
+    grown = KinshipTable()
+    for start in range(0, 300, 70):
+        grown.add({i: parents[i] for i in list(parents)[start : start + 70]})
+
+    ids = list(parents)
+    assert grown.pair_kinship(ids, ids) == pytest.approx(
+        whole.pair_kinship(ids, ids), abs=1e-6
+    )
+
+
+def test_full_sibling_mating_over_many_generations():
+    # Each generation is a brother and sister from the previous pair.
+    parents = {1: (None, None), 2: (None, None)}
+    for mouse_id in range(3, 203):
+        pair = mouse_id - (mouse_id + 1) % 2 - 2
+        parents[mouse_id] = (pair, pair + 1)
+    table = KinshipTable()
+    table.add(parents)
+
+    # F(t) = (1 + 2 F(t-1) + F(t-2)) / 4
+    expected = [0.0, 0.0]
+    for mouse_id in range(3, 203, 2):
+        assert table.inbreeding(mouse_id) == pytest.approx(expected[-1], abs=1e-9)
+        expected.append((1 + 2 * expected[-1] + expected[-2]) / 4)
+    assert table.inbreeding(201) > 0.999
+
+
+@pytest.fixture
+def family(db, django_user_model):
+    lead = django_user_model.objects.create_user(
+        username="lead", password="password"  # pragma: allowlist secret
+    )
+    project = Project.objects.create(
+        name="Kinship", start_date=date(2000, 1, 1), lead=lead
+    )
+    box = Box.objects.create(number="1", project=project)
+    strain = Strain.objects.create(name="K")
+
+    mice: dict[int, Mouse] = {}
+    for key, (father, mother) in FAMILY.items():
+        mice[key] = Mouse.objects.create(
+            project=project,
+            box=box,
+            strain=strain,
+            sex="F" if key in (2, 5, 8) else "M",
+            date_of_birth=date(2000, 1, 1),
+            tube_number=key,
+            father=mice.get(father),
+            mother=mice.get(mother),
+        )
+    return lead, project, mice
+
+
+def test_project_kinship_is_built_off_the_request(
+    family, monkeypatch, django_capture_on_commit_callbacks
+):
+    _, project, mice = family
+    submitted = []
+    monkeypatch.setattr(
+        kinship._executor, "submit", lambda *args: submitted.append(args)
+    )
+
+    with django_capture_on_commit_callbacks(execute=True):
+        assert project_kinship(project.id) is None
+        assert project_kinship(project.id) is None
+    assert submitted == [(kinship._build_in_thread, project.id)]
+
+    kinship._build_in_thread(project.id)
+    table = project_kinship(project.id)
+    assert table.kinship(mice[7].id, mice[8].id) == 0.25
+    assert not kinship._building
+
+
+def test_project_kinship_is_cached_and_extended(family):
+    _, project, mice = family
+
+    table = build_project_kinship(project.id)
+    assert project_kinship(project.id) is table
+    assert table.kinship(mice[7].id, mice[8].id) == 0.25
+
+    child = Mouse.objects.create(
+        project=project,
+        box=mice[9].box,
+        strain=mice[9].strain,
+        sex="F",
+        date_of_birth=date(2001, 1, 1),
+        tube_number=10,
+        father=mice[9],
+        mother=mice[8],
+    )
+    assert project_kinship(project.id) is table
+    assert table.kinship(child.id, mice[9].id) == 0.5
+
+    mice[9].mother = None
+    mice[9].save()
+    assert project_kinship(project.id) is None
+    rebuilt = build_project_kinship(project.id)
+    assert rebuilt.inbreeding(mice[9].id) == 0
+
+
+def test_breeding_form_lists_partner_kinship(client, family):
+    lead, project, mice = family
+    client.force_login(lead)
+    url = reverse("mouseapp:create_breeding_request")
+
+    # Partners are listed without kinship until the table is built.
+    content = client.get(url, {"mouse": mice[7].id}).content.decode()
+    assert "K - Tube 8 (Female)" in content
+    assert "offspring inbreeding" not in content
+
+    build_project_kinship(project.id)
+    content = client.get(url, {"mouse": mice[7].id}).content.decode()
+    assert "K - Tube 8 (Female) - offspring inbreeding 25.00%" in content
+    assert "K - Tube 9" not in content
+
+
+def test_breeding_request_detail_shows_inbreeding(client, family):
+    lead, project, mice = family
+    client.force_login(lead)
+
+    response = client.post(
+        reverse("mouseapp:create_breeding_request"),
+        {
+            "project": project.id,
+            "mouse": mice[7].id,
+            "partner": mice[8].id,
+            "kind": "B",
+            "details": "Sibling pair",
+        },
+    )
+    assert response.status_code == 302
+    request_obj = Request.objects.get(kind="B")
+    assert request_obj.partner == mice[8]
+
+    response = client.get(reverse("mouseapp:request_detail", args=[request_obj.id]))
+    content = response.content.decode()
+    assert "Offspring inbreeding coefficient:" in content
+    assert "25.00%" in content
+
+
+def test_breeding_partner_must_be_opposite_sex(client, family):
+    lead, project, mice = family
+    client.force_login(lead)
+
+    response = client.post(
+        reverse("mouseapp:create_breeding_request"),
+        {
+            "project": project.id,
+            "mouse": mice[7].id,
+            "partner": mice[6].id,
+            "kind": "B",
+            "details": "Father and son",
+        },
+    )
+
+    assert response.status_code == 200
+    assert not Request.objects.exists()
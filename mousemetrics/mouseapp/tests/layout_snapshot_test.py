@@ -0,0 +1,157 @@
+from datetime import date
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import OperationalError
+from django.urls import reverse
+
+from mouseapp import layout_snapshots
+from mouseapp.management.commands import build_layout_snapshots
+from mouseapp.models import Box, Mouse, PedigreeLayoutSnapshot, Project, Strain
+
+
+@pytest.fixture
+def colony(db, django_user_model):
+    lead = django_user_model.objects.create_user(
+        username="lead", password="password"  # pragma: allowlist secret
+    )
+    project = Project.objects.create(
+        name="Snapshots", start_date=date(2000, 1, 1), lead=lead
+    )
+    box = Box.objects.create(number="1", project=project)
+    strain = Strain.objects.create(name="S")
+
+    def mouse(tube_number, sex, father=None, mother=None):
+        return Mouse.objects.create(
+            project=project,
+            box=box,
+            strain=strain,
+            sex=sex,
+            date_of_birth=date(2000, 1, 1),
+            tube_number=tube_number,
+            father=father,
+            mother=mother,
+        )
+
+    sire, dam = mouse(1, "M"), mouse(2, "F")
+    son, daughter = mouse(3, "M", sire, dam), mouse(4, "F", sire, dam)
+    grandchild = mouse(5, "F", son, daughter)
+    return lead, project, strain, [sire, dam, son, daughter, grandchild]
+
+
+def test_command_builds_missing_and_stale_snapshots(colony):
+    _, project, strain, mice = colony
+
+    call_command("build_layout_snapshots")
+
+    snapshot = PedigreeLayoutSnapshot.objects.get(project=project, strain=strain)
+    assert not snapshot.stale
+    assert sorted(snapshot.layout["ids"]) == sorted(mouse.id for mouse in mice)
+    rows = dict(zip(snapshot.layout["ids"], snapshot.layout["rows"]))
+    assert [rows[mouse.id] for mouse in mice] == [0, 0, 1, 1, 2]
+
+    mice[4].save()
+    snapshot.refresh_from_db()
+    assert not snapshot.stale
+
+    mice[4].father = None
+    mice[4].save()
+    snapshot.refresh_from_db()
+    assert snapshot.stale
+
+    call_command("build_layout_snapshots")
+    snapshot.refresh_from_db()
+    assert not snapshot.stale
+    assert snapshot.layout["rows"][snapshot.layout["ids"].index(mice[4].id)] == 2
+
+
+def test_moving_a_mouse_to_another_project_marks_both_snapshots_stale(colony):
+    lead, project, strain, mice = colony
+    other = Project.objects.create(name="Other", start_date=date(2000, 1, 1), lead=lead)
+    Mouse.objects.create(
+        project=other,
+        box=Box.objects.create(number="1", project=other),
+        strain=strain,
+        sex="M",
+        date_of_birth=date(2000, 1, 1),
+        tube_number=1,
+    )
+    call_command("build_layout_snapshots")
+
+    mice[4].project = other
+    mice[4].save()
+
+    snapshots = PedigreeLayoutSnapshot.objects.filter(strain=strain)
+    assert {s.project_id: s.stale for s in snapshots} == {
+        project.id: True,
+        other.id: True,
+    }
+
+
+def test_json_window_is_sliced_from_snapshot(client, colony):
+    lead, project, strain, mice = colony
+    client.force_login(lead)
+    call_command("build_layout_snapshots")
+
+    # Move the stored boxes so the response shows which layout was used.
+    snapshot = PedigreeLayoutSnapshot.objects.get(project=project, strain=strain)
+    snapshot.layout["x"] = [x + 1000 * i for i, x in enumerate(snapshot.layout["x"])]
+    snapshot.save()
+    stored = dict(zip(snapshot.layout["ids"], snapshot.layout["x"]))
+
+    url = reverse("mouseapp:family_tree_json", args=[mice[2].id])
+    window = client.get(url, {"up": 1, "down": 0}).json()
+
+    nodes = {node["id"]: node for node in window["nodes"]}
+    assert set(nodes) == {mice[0].id, mice[1].id, mice[2].id}
+    left = min(stored[mouse_id] for mouse_id in nodes)
+    for mouse_id, node in nodes.items():
+        assert node["x"] == stored[mouse_id] - left
+    assert nodes[mice[2].id]["row"] == 1
+
+
+def test_worker_survives_failed_rounds(colony, monkeypatch):
+    _, project, strain, _ = colony
+    command = build_layout_snapshots.Command()
+    real_build_snapshot = build_layout_snapshots.build_snapshot
+    failures = [OperationalError("server closed the connection"), ValueError("bad")]
+    rounds, built = [], []
+
+    def snapshots_to_build(rebuild_all):
+        if len(rounds) == 0:
+            raise failures.pop(0)
+        return layout_snapshots.snapshots_to_build(rebuild_all)
+
+    def build_snapshot(*args, **kwargs):
+        built.append(real_build_snapshot(*args, **kwargs))
+        if failures:
+            raise failures.pop(0)
+        return built[-1]
+
+    def sleep(seconds):
+        rounds.append(seconds)
+        if len(rounds) == 3:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(
+        build_layout_snapshots, "snapshots_to_build", snapshots_to_build
+    )
+    monkeypatch.setattr(build_layout_snapshots, "build_snapshot", build_snapshot)
+    monkeypatch.setattr(build_layout_snapshots.time, "sleep", sleep)
+
+    # The database is away, then one build fails; the next round retries it.
+    with pytest.raises(KeyboardInterrupt):
+        command.handle(all=False, interval=5)
+
+    assert len(built) == 2
+    snapshot = PedigreeLayoutSnapshot.objects.get(project=project, strain=strain)
+    assert not snapshot.stale and snapshot.layout["ids"]
+
+
+def test_command_reports_failed_builds(colony, monkeypatch):
+    def build_snapshot(*args, **kwargs):
+        raise ValueError("bad")
+
+    monkeypatch.setattr(build_layout_snapshots, "build_snapshot", build_snapshot)
+    with pytest.raises(CommandError, match="1 layout snapshots failed"):
+        call_command("build_layout_snapshots")
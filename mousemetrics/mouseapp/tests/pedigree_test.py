@@ -0,0 +1,266 @@
+from collections import deque
+from datetime import date
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from mouseapp.models import Box, Mouse, MousePedigreeClosure, Project, Strain
+from mouseapp.pedigree import (
+    Pedigree,
+    PedigreeNode,
+    are_related,
+    assign_ranks,
+    common_ancestors,
+    descendants_within,
+    load_pedigree,
+    update_lineage_depths,
+    update_pedigree_closure,
+)
+
+
+def sweep_ranks(pedigree: Pedigree) -> dict[int, int]:
+    """The original quadratic rank assignment, kept as a reference."""
+    in_degree = {
+        mouse_id: len(pedigree.parents_of(mouse_id)) for mouse_id in pedigree.nodes
+    }
+    queue = deque(mouse_id for mouse_id, degree in in_degree.items() if degree == 0)
+    ranks: dict[int, int] = {}
+
+    while queue:
+        mouse_id = queue.popleft()
+        parent_ranks = [
+            ranks[parent_id]
+            for parent_id in pedigree.parents_of(mouse_id)
+            if parent_id in ranks
+        ]
+        ranks[mouse_id] = max(parent_ranks) + 1 if parent_ranks else 0
+        for child_id in pedigree.children_of(mouse_id):
+            in_degree[child_id] -= 1
+            if in_degree[child_id] == 0:
+                queue.append(child_id)
+
+    for mouse_id in pedigree.nodes:
+        ranks.setdefault(mouse_id, 0)
+
+    for _ in range(len(pedigree.nodes)):
+        changed = False
+        for mouse_id in pedigree.nodes:
+            children = pedigree.children_of(mouse_id)
+            if children:
+                target_rank = min(ranks[child_id] for child_id in children) - 1
+                if ranks[mouse_id] < target_rank:
+                    ranks[mouse_id] = target_rank
+                    changed = True
+        if not changed:
+            break
+
+    return ranks
+
+
+def test_ranks_match_reference_on_generated_pedigree(generated_pedigree):
+    pedigree = generated_pedigree(5000)
+
+    assert assign_ranks(pedigree) == sweep_ranks(pedigree)
+
+
+def test_ranks_pull_late_founders_down():
+    #  1   2
+    #   \ /  3
+    #    4  /
+    #     \/
+    #     5
+    nodes = [
+        PedigreeNode(1, None, None, "M", 1, None, None, ""),
+        PedigreeNode(2, None, None, "F", 2, None, None, ""),
+        PedigreeNode(3, None, None, "M", 3, None, None, ""),
+        PedigreeNode(4, 1, 2, "F", 4, None, None, ""),
+        PedigreeNode(5, 3, 4, "M", 5, None, None, ""),
+    ]
+    pedigree = Pedigree({node.id: node for node in nodes})
+
+    assert assign_ranks(pedigree) == {1: 0, 2: 0, 3: 1, 4: 1, 5: 2}
+
+
+def test_ranks_survive_parent_cycles():
+    nodes = [
+        PedigreeNode(1, 2, None, "M", 1, None, None, ""),
+        PedigreeNode(2, 1, None, "F", 2, None, None, ""),
+        PedigreeNode(3, 1, None, "F", 3, None, None, ""),
+    ]
+    pedigree = Pedigree({node.id: node for node in nodes})
+
+    assert set(assign_ranks(pedigree)) == {1, 2, 3}
+
+
+@pytest.mark.django_db
+def test_ranks_match_reference_on_fixture_data(django_user_model):
+    # The fixture's first project is led by user 1.
+    django_user_model.objects.create(id=1, username="lead")
+    call_command("loaddata", "family_tree_test_data", verbosity=0)
+
+    for mouse_id in Mouse.objects.values_list("id", flat=True):
+        pedigree = load_pedigree(mouse_id)
+        assert assign_ranks(pedigree) == sweep_ranks(pedigree), mouse_id
+
+
+def reference_lineage_depths() -> dict[int, tuple[int, int]]:
+    """(generation, max_descendant_depth) for every mouse, by plain recursion."""
+    parents = {
+        mouse_id: [p for p in (father_id, mother_id) if p is not None]
+        for mouse_id, father_id, mother_id in Mouse.objects.values_list(
+            "id", "father_id", "mother_id"
+        )
+    }
+    children: dict[int, list[int]] = {mouse_id: [] for mouse_id in parents}
+    for mouse_id, parent_ids in parents.items():
+        for parent_id in parent_ids:
+            children[parent_id].append(mouse_id)
+
+    def generation(mouse_id: int) -> int:
+        return max((generation(p) + 1 for p in parents[mouse_id]), default=0)
+
+    def depth(mouse_id: int) -> int:
+        return max((depth(c) + 1 for c in children[mouse_id]), default=0)
+
+    return {mouse_id: (generation(mouse_id), depth(mouse_id)) for mouse_id in parents}
+
+
+def reference_closure() -> set[tuple[int, int, int]]:
+    """(ancestor, descendant, fewest generations) by a walk up from every mouse."""
+    parents = {
+        mouse_id: [p for p in (father_id, mother_id) if p is not None]
+        for mouse_id, father_id, mother_id in Mouse.objects.values_list(
+            "id", "father_id", "mother_id"
+        )
+    }
+    closure = set()
+    for mouse_id in parents:
+        distances = {mouse_id: 0}
+        queue = deque([mouse_id])
+        while queue:
+            current = queue.popleft()
+            for parent_id in parents[current]:
+                if parent_id not in distances:
+                    distances[parent_id] = distances[current] + 1
+                    queue.append(parent_id)
+        closure.update((a, mouse_id, d) for a, d in distances.items())
+    return closure
+
+
+def stored_closure() -> set[tuple[int, int, int]]:
+    return set(
+        MousePedigreeClosure.objects.values_list(
+            "ancestor_id", "descendant_id", "distance"
+        )
+    )
+
+
+def stored_lineage_depths() -> dict[int, tuple[int, int]]:
+    return {
+        mouse_id: (generation, depth)
+        for mouse_id, generation, depth in Mouse.objects.values_list(
+            "id", "generation", "max_descendant_depth"
+        )
+    }
+
+
+@pytest.mark.django_db
+def test_descendant_depth_on_fixture_data(django_user_model):
+    django_user_model.objects.create(id=1, username="lead")
+    call_command("loaddata", "family_tree_test_data", verbosity=0)
+    expected = reference_lineage_depths()
+
+    call_command("rebuild_pedigree", stdout=StringIO())
+
+    assert stored_lineage_depths() == expected
+    assert stored_closure() == reference_closure()
+    for mouse in Mouse.objects.all():
+        assert mouse.descendant_depth() == expected[mouse.id][1], mouse.id
+
+
+@pytest.mark.django_db
+def test_pedigree_follows_parent_changes():
+    project = Project.objects.create(name="Lineage", start_date=date(2000, 1, 1))
+    box = Box.objects.create(number="1")
+    strain = Strain.objects.create(name="L")
+
+    def mouse(tube_number: int, **parents) -> Mouse:
+        return Mouse.objects.create(
+            project=project,
+            box=box,
+            strain=strain,
+            sex="F",
+            date_of_birth=date(2000, 1, 1),
+            tube_number=tube_number,
+            **parents,
+        )
+
+    founder = mouse(1)
+    other = mouse(2)
+    child = mouse(3, father=founder)
+    grandchild = mouse(4, mother=child)
+    assert grandchild.generation == 2
+    assert stored_lineage_depths() == reference_lineage_depths()
+    assert stored_closure() == reference_closure()
+    assert list(descendants_within(founder.id, 1)) == [child]
+    assert set(descendants_within(founder.id, 2)) == {child, grandchild}
+    assert set(common_ancestors(grandchild.id, child.id)) == {founder, child}
+    assert not are_related(founder.id, other.id)
+
+    child.father = other
+    child.save()
+    assert stored_lineage_depths() == reference_lineage_depths()
+    assert stored_closure() == reference_closure()
+    assert are_related(grandchild.id, other.id)
+    assert not are_related(grandchild.id, founder.id)
+    assert Mouse.objects.get(id=founder.id).max_descendant_depth == 0
+    assert Mouse.objects.get(id=other.id).max_descendant_depth == 2
+
+    # A stale instance must not write back old lineage values.
+    other.earmark = "TR"
+    other.save()
+    assert stored_lineage_depths() == reference_lineage_depths()
+
+    child.delete()
+    assert stored_lineage_depths() == reference_lineage_depths()
+    assert stored_closure() == reference_closure()
+    assert Mouse.objects.get(id=grandchild.id).generation == 0
+
+
+@pytest.mark.django_db
+def test_lineage_depth_queries_do_not_grow_with_depth(django_assert_max_num_queries):
+    project = Project.objects.create(name="Lineage", start_date=date(2000, 1, 1))
+    box = Box.objects.create(number="1")
+    strain = Strain.objects.create(name="L")
+    fields = dict(
+        project=project,
+        box=box,
+        strain=strain,
+        sex="F",
+        date_of_birth=date(2000, 1, 1),
+    )
+    line = [Mouse.objects.create(tube_number=1, **fields)]
+    for tube_number in range(2, 61):
+        line.append(Mouse(tube_number=tube_number, mother=line[-1], **fields))
+        line[-1].save_base(raw=True)
+    call_command("rebuild_pedigree", stdout=StringIO())
+
+    child = Mouse(tube_number=61, mother=line[-1], **fields)
+    child.save_base(raw=True)
+    update_pedigree_closure([child.id])
+    # Two closure lookups, then a read and a write per lineage field.
+    with django_assert_max_num_queries(6):
+        update_lineage_depths([child.id])
+    assert stored_lineage_depths() == reference_lineage_depths()
+
+    grandchild = Mouse.objects.create(tube_number=62, mother=child, **fields)
+    assert grandchild.generation == 61
+
+    # Closing a parent cycle ends after one pass over the affected mice.
+    founder = line[0]
+    founder.father = grandchild
+    founder.save_base(raw=True)
+    update_pedigree_closure([founder.id])
+    with django_assert_max_num_queries(6):
+        update_lineage_depths([founder.id], [None])
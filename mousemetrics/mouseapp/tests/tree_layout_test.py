@@ -0,0 +1,60 @@
+import numpy as np
+
+from mouseapp.pedigree import Pedigree, PedigreeNode, assign_ranks
+from mouseapp.tree_layout import compute_layout
+
+SIZES = {"box_w": 192, "box_h": 100, "gap_x": 40, "gap_y": 80}
+
+
+def layout_of(pedigree: Pedigree, **kwargs):
+    return compute_layout(pedigree, assign_ranks(pedigree), **SIZES, **kwargs)
+
+
+def test_layout_places_every_mouse_once(generated_pedigree):
+    pedigree = generated_pedigree(2000)
+    layout = layout_of(pedigree)
+
+    drawn = np.concatenate(layout.layers)
+    assert sorted(layout.ids[drawn].tolist()) == list(pedigree.nodes)
+
+
+def test_layout_rows_do_not_overlap(generated_pedigree):
+    layout = layout_of(generated_pedigree(2000))
+    min_gap = SIZES["box_w"] + SIZES["gap_x"]
+
+    for row, layer in enumerate(layout.layers):
+        assert np.all(np.diff(layout.x[layer]) >= min_gap)
+        assert np.all(layout.y[layer] == row * (SIZES["box_h"] + SIZES["gap_y"]))
+
+
+def test_layout_keeps_fewest_crossings(generated_pedigree):
+    pedigree = generated_pedigree(2000)
+
+    one_round = layout_of(pedigree, max_passes=1)
+    layout = layout_of(pedigree)
+
+    assert layout.crossings <= one_round.crossings
+
+
+def test_layout_untangles_swapped_families():
+    #  1  2   3  4
+    #   \/     \/
+    #   6       5
+    nodes = [
+        PedigreeNode(1, None, None, "M", 1, None, None, ""),
+        PedigreeNode(2, None, None, "F", 2, None, None, ""),
+        PedigreeNode(3, None, None, "M", 3, None, None, ""),
+        PedigreeNode(4, None, None, "F", 4, None, None, ""),
+        PedigreeNode(5, 3, 4, "M", 5, None, None, ""),
+        PedigreeNode(6, 1, 2, "F", 6, None, None, ""),
+    ]
+    pedigree = Pedigree({node.id: node for node in nodes})
+    layout = layout_of(pedigree)
+
+    assert layout.crossings == 0
+    children = layout.ids[layout.layers[1]].tolist()
+    assert children == [6, 5]
+    # Each child sits midway between its parents.
+    centers = dict(zip(layout.ids.tolist(), (layout.x + SIZES["box_w"] / 2).tolist()))
+    assert centers[6] == (centers[1] + centers[2]) / 2
+    assert centers[5] == (centers[3] + centers[4]) / 2
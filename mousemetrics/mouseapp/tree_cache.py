@@ -0,0 +1,116 @@
+import uuid
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.connection import ConnectionProxy
+
+from .pedigree import neighbourhood_ids
+
+cache = ConnectionProxy(caches, "family_tree")
+
+CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# Characters of SVG per cache entry.
+SVG_PART_CHARS = 1 << 20
+
+
+@dataclass(frozen=True)
+class TreeStamp:
+    """
+    Version of the pedigree around a focus mouse.
+
+    Every cached SVG for a focus mouse is keyed by its current stamp, so
+    dropping the stamp invalidates all depths and themes at once.
+    """
+
+    mouse_id: int
+    token: str
+    modified: datetime
+
+    def etag(self, depth: int, theme: str) -> str:
+        return f'"{self.mouse_id}-{depth}-{theme}-{self.token}"'
+
+    def svg_key(self, depth: int, theme: str) -> str:
+        return f"family_tree:svg:{self.mouse_id}:{depth}:{theme}:{self.token}"
+
+
+def _stamp_key(mouse_id: int) -> str:
+    return f"family_tree:stamp:{mouse_id}"
+
+
+def current_stamp(mouse_id: int) -> TreeStamp:
+    key = _stamp_key(mouse_id)
+    if (cached := cache.get(key)) is not None:
+        token, modified = cached
+        return TreeStamp(mouse_id, token, modified)
+
+    # HTTP dates have one-second resolution.
+    stamp = TreeStamp(mouse_id, uuid.uuid4().hex, timezone.now().replace(microsecond=0))
+    if not cache.add(key, (stamp.token, stamp.modified), CACHE_TIMEOUT):
+        # Another request created the stamp first; agree with it.
+        return current_stamp(mouse_id)
+    return stamp
+
+
+def get_svg(stamp: TreeStamp, depth: int, theme: str) -> Iterator[str] | None:
+    """The cached SVG in parts, or None unless every part is cached."""
+    key = stamp.svg_key(depth, theme)
+    if (parts := cache.get(key)) is None:
+        return None
+    part_keys = [f"{key}:{part}" for part in range(parts)]
+    # One read, so no part can be evicted between checking and sending it.
+    found = cache.get_many(part_keys)
+    if len(found) < parts:
+        return None
+    return (found[part_key] for part_key in part_keys)
+
+
+def store_svg_chunks(
+    stamp: TreeStamp, depth: int, theme: str, chunks: Iterable[str]
+) -> Iterator[str]:
+    """
+    Pass `chunks` through, caching them in parts of `SVG_PART_CHARS` as they
+    are sent, so the whole SVG is never held at once. The number of parts is
+    stored last, once every part is.
+    """
+    key = stamp.svg_key(depth, theme)
+    buffer: list[str] = []
+    buffered = parts = 0
+    for chunk in chunks:
+        yield chunk
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= SVG_PART_CHARS:
+            cache.set(f"{key}:{parts}", "".join(buffer), CACHE_TIMEOUT)
+            buffer, buffered, parts = [], 0, parts + 1
+    if buffer or not parts:
+        cache.set(f"{key}:{parts}", "".join(buffer), CACHE_TIMEOUT)
+        parts += 1
+    cache.set(key, parts, CACHE_TIMEOUT)
+
+
+def drop_stamps(mouse_ids: Iterable[int]) -> None:
+    """
+    Drop the stamps (and so every cached SVG) of the given focus mice once
+    the current transaction commits, or now outside one. Dropped earlier, a
+    tree drawn before the commit would cache the old pedigree under a fresh
+    stamp that nothing invalidates.
+    """
+    keys = [_stamp_key(mouse_id) for mouse_id in mouse_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_trees_containing(mouse_ids: Iterable[int]) -> None:
+    """
+    Invalidate every cached tree that draws one of `mouse_ids`.
+
+    Model signals already cover ordinary saves; call this after bulk writes
+    such as `QuerySet.update` that change parents, boxes, strains or earmarks.
+    """
+    mouse_ids = set(mouse_ids)
+    if mouse_ids:
+        drop_stamps(neighbourhood_ids(mouse_ids))
@@ -0,0 +1,231 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from .pedigree import Pedigree
+
+MAX_PASSES = 4
+
+# Bounds the boolean matrix built when counting crossings between two layers.
+CROSSING_CHUNK = 1024
+
+
+@dataclass(frozen=True)
+class TreeLayout:
+    """
+    Node coordinates for a family tree, indexed like `ids`.
+
+    `layers` holds the drawing order of each row as indices into `ids`, top
+    row first; `x` is the left edge and `y` the top edge of each node's box.
+    """
+
+    ids: np.ndarray
+    layers: list[np.ndarray]
+    x: np.ndarray
+    y: np.ndarray
+    crossings: int
+
+
+class _LayoutArrays:
+    """Integer-indexed view of a pedigree: node `i` is the mouse `ids[i]`."""
+
+    def __init__(self, pedigree: Pedigree, ranks: dict[int, int]):
+        nodes = pedigree.nodes
+        # Keep the incoming order of `ranks` so ties start from the same order.
+        self.ids = np.fromiter(ranks.keys(), dtype=np.int64, count=len(ranks))
+        index = {mouse_id: i for i, mouse_id in enumerate(ranks)}
+        size = len(self.ids)
+
+        # `rank` numbers the rows densely; `rank_values` keeps the assigned ranks.
+        self.rank_values = np.fromiter(ranks.values(), dtype=np.int64, count=size)
+        sorted_ranks, self.rank = np.unique(self.rank_values, return_inverse=True)
+        self.n_layers = len(sorted_ranks)
+
+        def parent_index(parent_id: int | None) -> int:
+            return index.get(parent_id, -1) if parent_id is not None else -1
+
+        self.father = np.array(
+            [parent_index(nodes[mouse_id].father_id) for mouse_id in ranks],
+            dtype=np.int64,
+        )
+        self.mother = np.array(
+            [parent_index(nodes[mouse_id].mother_id) for mouse_id in ranks],
+            dtype=np.int64,
+        )
+        self.father_key = np.array(
+            [nodes[mouse_id].father_id or 0 for mouse_id in ranks], dtype=np.int64
+        )
+        self.mother_key = np.array(
+            [nodes[mouse_id].mother_id or 0 for mouse_id in ranks], dtype=np.int64
+        )
+        self.sex = np.array(
+            [ord(nodes[mouse_id].sex[:1] or " ") for mouse_id in ranks],
+            dtype=np.int64,
+        )
+
+        both = (self.father_key > 0) & (self.mother_key > 0)
+        self.pair_low = np.where(
+            both, np.minimum(self.father_key, self.mother_key), self.father_key
+        )
+        self.pair_high = np.where(
+            both, np.maximum(self.father_key, self.mother_key), self.mother_key
+        )
+
+        # Parent -> child links between adjacent rows drive the barycenters.
+        children = np.arange(size, dtype=np.int64)
+        parents = np.concatenate([self.father, self.mother])
+        children = np.concatenate([children, children])
+        linked = parents >= 0
+        parents, children = parents[linked], children[linked]
+        adjacent = self.rank_values[parents] == self.rank_values[children] - 1
+        self.edge_parent = parents[adjacent]
+        self.edge_child = children[adjacent]
+
+        self.layer_sizes = np.bincount(self.rank, minlength=self.n_layers)
+        self.layer_starts = np.concatenate([[0], np.cumsum(self.layer_sizes)[:-1]])
+
+        # Initial position of every node within its row.
+        order = np.argsort(self.rank, kind="stable")
+        self.pos = self._positions(order)
+
+    def _positions(self, order: np.ndarray) -> np.ndarray:
+        pos = np.empty(len(order), dtype=np.int64)
+        pos[order] = np.arange(len(order)) - self.layer_starts[self.rank[order]]
+        return pos
+
+    def _barycenters(self, source: np.ndarray, target: np.ndarray) -> np.ndarray:
+        """Mean position of each node's `source` neighbours, or its own position."""
+        size = len(self.ids)
+        sums = np.bincount(target, weights=self.pos[source], minlength=size)
+        counts = np.bincount(target, minlength=size)
+        return np.divide(
+            sums, counts, out=self.pos.astype(np.float64), where=counts > 0
+        )
+
+    def forward_pass(self) -> None:
+        """Order each row by sibling group, then by the barycenter of its parents."""
+        bary = self._barycenters(self.edge_parent, self.edge_child)
+        order = np.lexsort(
+            (
+                self.ids,
+                self.sex,
+                bary,
+                self.mother_key,
+                self.father_key,
+                self.rank,
+            )
+        )
+        self.pos = self._positions(order)
+
+    def backward_pass(self) -> None:
+        """Order each row by the barycenter of its children, then by parent pair."""
+        bary = self._barycenters(self.edge_child, self.edge_parent)
+        order = np.lexsort(
+            (
+                self.ids,
+                self.pair_high,
+                self.pair_low,
+                bary,
+                self.rank,
+            )
+        )
+        self.pos = self._positions(order)
+
+    def crossings(self) -> int:
+        """Count crossing parent -> child links between adjacent rows."""
+        total = 0
+        edge_rank = self.rank[self.edge_parent]
+        for rank in range(self.n_layers - 1):
+            in_layer = edge_rank == rank
+            upper = self.pos[self.edge_parent[in_layer]]
+            lower = self.pos[self.edge_child[in_layer]]
+            # Sorted by upper endpoint, crossings are the inversions of `lower`.
+            lower = lower[np.lexsort((lower, upper))]
+            for start in range(0, len(lower), CROSSING_CHUNK):
+                block = lower[start : start + CROSSING_CHUNK]
+                later = np.arange(len(lower)) > np.arange(
+                    start, start + len(block)
+                ).reshape(-1, 1)
+                total += int(np.count_nonzero((block[:, None] > lower) & later))
+        return total
+
+    def layers(self) -> list[np.ndarray]:
+        order = np.lexsort((self.pos, self.rank))
+        return np.split(order, self.layer_starts[1:])
+
+
+def compute_layout(
+    pedigree: Pedigree,
+    ranks: dict[int, int],
+    *,
+    box_w: float,
+    box_h: float,
+    gap_x: float,
+    gap_y: float,
+    max_passes: int = MAX_PASSES,
+) -> TreeLayout:
+    """
+    Lay out a ranked pedigree as rows of boxes with few crossing links.
+
+    Rows are reordered by alternating forward and backward barycenter passes,
+    stopping as soon as a round no longer reduces the number of crossings.
+    """
+    arrays = _LayoutArrays(pedigree, ranks)
+    if not len(arrays.ids):
+        empty = np.empty(0)
+        return TreeLayout(arrays.ids, [], empty, empty, 0)
+
+    best_pos, best_crossings = None, 0
+    for _ in range(max_passes):
+        arrays.forward_pass()
+        arrays.backward_pass()
+        crossings = arrays.crossings()
+        if best_pos is not None and crossings >= best_crossings:
+            break
+        best_pos, best_crossings = arrays.pos.copy(), crossings
+    if best_pos is not None:
+        arrays.pos = best_pos
+
+    layers = arrays.layers()
+    x, y = _coordinates(arrays, layers, box_w, box_h, gap_x, gap_y)
+    return TreeLayout(arrays.ids, layers, x, y, best_crossings)
+
+
+def _coordinates(
+    arrays: _LayoutArrays,
+    layers: list[np.ndarray],
+    box_w: float,
+    box_h: float,
+    gap_x: float,
+    gap_y: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    size = len(arrays.ids)
+    centers = np.zeros(size, dtype=np.float64)
+    y = np.zeros(size, dtype=np.int64)
+    placed = np.zeros(size, dtype=bool)
+    min_gap = box_w + gap_x
+
+    for row, layer in enumerate(layers):
+        steps = np.arange(len(layer))
+        row_width = len(layer) * box_w + (len(layer) - 1) * gap_x
+        nominal = -(row_width / 2) + steps * min_gap + box_w / 2
+
+        # Children of two drawn parents sit midway between them where possible.
+        father, mother = arrays.father[layer], arrays.mother[layer]
+        has_parents = (father >= 0) & (mother >= 0)
+        has_parents[has_parents] = (
+            placed[father[has_parents]] & placed[mother[has_parents]]
+        )
+        target = np.where(
+            has_parents,
+            (centers[father] + centers[mother]) / 2,
+            nominal,
+        )
+
+        # Push boxes right until none overlaps its left neighbour.
+        spaced = np.maximum.accumulate(target - steps * min_gap) + steps * min_gap
+        centers[layer] = spaced - (spaced[0] + spaced[-1]) / 2
+        y[layer] = row * (box_h + gap_y)
+        placed[layer] = True
+
+    return centers - box_w / 2, y
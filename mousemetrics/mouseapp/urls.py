@@ -38,6 +38,9 @@ urlpatterns = [
     path("register/", views.register, name="register"),
     path("family_tree/<int:mouse>/", views.family_tree, name="family_tree"),
     path("family_tree/<int:mouse>.svg", views.family_tree_svg, name="family_tree_svg"),
+    path(
+        "family_tree/<int:mouse>.json", views.family_tree_json, name="family_tree_json"
+    ),
     path("requests/", views.requests_list, name="requests"),
     path(
         "requests/<int:request_id>/",
@@ -1,7 +1,13 @@
 from typing import cast
 from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse
-from django.http import HttpRequest, HttpResponse
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.http.response import HttpResponseBase
 from django.contrib.auth import login as auth_login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
@@ -11,11 +17,14 @@ from django.core import signing
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
 from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+from django.utils.html import escape, strip_tags
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.db.models import Q
 from django.core.paginator import Paginator
 from datetime import date
-from collections import deque, defaultdict
+from collections import defaultdict
+from collections.abc import Callable, Iterator
 from django.views.decorators.clickjacking import xframe_options_exempt
 
 from .forms import (
@@ -44,6 +53,17 @@ from .models import (
     ReplyReaction,
     StudyPlan,
 )
+from .kinship import breeding_pair_kinship
+from .layout_snapshots import SnapshotPosition, snapshot_positions
+from .pedigree import (
+    DEFAULT_MAX_DEPTH,
+    assign_ranks,
+    generations_beyond,
+    load_pedigree,
+    load_window,
+)
+from .tree_layout import compute_layout
+from . import tree_cache
 
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
@@ -504,25 +524,40 @@ def register(request: HttpRequest) -> HttpResponse:
     )
 
 
-def get_children(mouse: Mouse) -> list[Mouse]:
-    combined = list(mouse.child_set_m.all()) + list(mouse.child_set_f.all())
-    seen: set[int] = set()
-    ordered: list[Mouse] = []
-
-    for child in combined:
-        if child.id not in seen:
-            seen.add(child.id)
-            ordered.append(child)
-
-    return ordered
-
-
 class GraphSVGRenderer:
     BOX_W = 192
     BOX_H = 100
     GAP_X = 40
     GAP_Y = 80
 
+    # Fragments are joined into chunks of roughly this many characters before
+    # being handed to the response.
+    CHUNK_SIZE = 16 * 1024
+
+    EDGE_SVG = (
+        '            <line x1="{x1}" y1="{y1}"\n'
+        '                  x2="{x2}" y2="{y2}"\n'
+        '                  class="edge"\n'
+        '                  data-child-id="node-{child_id}" />\n'
+    )
+    NODE_SVG = (
+        '            <g class="node" id="node-{id}"\n'
+        '               data-father="node-{father_id}"\n'
+        '               data-mother="node-{mother_id}"\n'
+        '               transform="translate({x}, {y})">\n'
+        '                <rect width="{box_w}" height="{box_h}" rx="6" class="box" />\n'
+        '                <a href="{tree_url}" target="_top">\n'
+        '                    <text x="8" y="20" class="txt-strain">{strain}</text>\n'
+        "                </a>\n"
+        '                <text x="8" y="45" class="txt-info">{box_text}</text>\n'
+        '                <text x="8" y="65" class="txt-info">{earmark_text}</text>\n'
+        '                <a href="{detail_url}" target="_top">\n'
+        '                    <text x="{link_x}" y="{link_y}" class="txt-link">'
+        "(Details)</text>\n"
+        "                </a>\n"
+        "            </g>\n"
+    )
+
     def __init__(self):
         self.nodes = []
         self.edges = []
@@ -532,9 +567,7 @@ class GraphSVGRenderer:
         self.max_y = float("-inf")
 
     def draw_line(self, x1, y1, x2, y2, child_id=None):
-        self.edges.append(
-            {"x1": x1, "y1": y1, "x2": x2, "y2": y2, "child_id": child_id}
-        )
+        self.edges.append((x1, y1, x2, y2, child_id))
 
     def draw_mouse(self, mouse, x, y, is_focus=False):
         self.min_x = min(self.min_x, x)
@@ -542,327 +575,141 @@ class GraphSVGRenderer:
         self.min_y = min(self.min_y, y)
         self.max_y = max(self.max_y, y + self.BOX_H)
 
-        self.nodes.append(
-            {
-                "id": mouse.id,
-                "father_id": mouse.father_id,
-                "mother_id": mouse.mother_id,
-                "x": x,
-                "y": y,
-                "is_focus": is_focus,
-                "strain": f"{mouse.strain} {mouse.tube_number}",
-                "box_text": f"Box: {mouse.box.number if mouse.box else '-'}",
-                "earmark_text": f"Earmark: {mouse.earmark if mouse.earmark else '-'}",
-                "tree_url": reverse("mouseapp:family_tree", args=[mouse.id]),
-                "detail_url": reverse("mouseapp:mouse", args=[mouse.id]),
-            }
-        )
+        self.nodes.append((mouse, x, y))
 
     def get_final_svg(self, dark: bool = False) -> str:
+        return "".join(self.stream_svg(dark))
+
+    def stream_svg(self, dark: bool = False) -> Iterator[str]:
+        """Yield the SVG document in chunks of about `CHUNK_SIZE` characters."""
+        buffer = []
+        buffered = 0
+        for fragment in self._fragments(dark):
+            buffer.append(fragment)
+            buffered += len(fragment)
+            if buffered >= self.CHUNK_SIZE:
+                yield "".join(buffer)
+                buffer = []
+                buffered = 0
+        if buffer:
+            yield "".join(buffer)
+
+    def _fragments(self, dark: bool) -> Iterator[str]:
         if not self.nodes:
-            return "<svg></svg>"
+            yield "<svg></svg>"
+            return
 
         padding = 50
         width = (self.max_x - self.min_x) + (padding * 2)
         height = (self.max_y - self.min_y) + (padding * 2)
         viewbox = f"{self.min_x - padding} {self.min_y - padding} {width} {height}"
 
-        context = {
-            "nodes": self.nodes,
-            "edges": self.edges,
-            "viewbox": viewbox,
-            "width": width,
-            "height": height,
-            "box_w": self.BOX_W,
-            "box_h": self.BOX_H,
-            "dark_mode": dark,
-        }
-
-        return render_to_string("mouseapp/family_tree.svg", context, using="jinja2")
-
-
-def get_descendant_graph(start_mouse, max_depth=10):
-    all_nodes = {start_mouse}
-    queue = deque([(start_mouse, 0)])
-
-    while queue:
-        current, depth = queue.popleft()
-        if depth >= max_depth:
-            continue
-
-        relatives = get_children(current)
-        if current.father:
-            relatives.append(current.father)
-        if current.mother:
-            relatives.append(current.mother)
-
-        for relative in relatives:
-            if relative not in all_nodes:
-                all_nodes.add(relative)
-                queue.append((relative, depth + 1))
-
-    adj = defaultdict(list)
-    in_degree = {mouse: 0 for mouse in all_nodes}
-
-    for mouse in all_nodes:
-        if mouse.father and mouse.father in all_nodes:
-            adj[mouse.father].append(mouse)
-            in_degree[mouse] += 1
-
-        if mouse.mother and mouse.mother in all_nodes:
-            adj[mouse.mother].append(mouse)
-            in_degree[mouse] += 1
-
-    queue = deque([mouse for mouse, deg in in_degree.items() if deg == 0])
-    ranks = {}
-
-    while queue:
-        node = queue.popleft()
-
-        parent_ranks = []
-        if node.father and node.father in ranks:
-            parent_ranks.append(ranks[node.father])
-        if node.mother and node.mother in ranks:
-            parent_ranks.append(ranks[node.mother])
-
-        if not parent_ranks:
-            ranks[node] = 0
-        else:
-            ranks[node] = max(parent_ranks) + 1
+        yield render_to_string(
+            "mouseapp/family_tree_head.svg",
+            {"viewbox": viewbox, "dark_mode": dark},
+            using="jinja2",
+        )
 
-        for child in adj[node]:
-            in_degree[child] -= 1
-            if in_degree[child] == 0:
-                queue.append(child)
+        yield '        <g id="edges">\n'
+        for x1, y1, x2, y2, child_id in self.edges:
+            yield self.EDGE_SVG.format(x1=x1, y1=y1, x2=x2, y2=y2, child_id=child_id)
+        yield "        </g>\n\n"
+
+        tree_url = _url_for_id("mouseapp:family_tree")
+        detail_url = _url_for_id("mouseapp:mouse")
+        yield '        <g id="nodes">\n'
+        for mouse, x, y in self.nodes:
+            yield self.NODE_SVG.format(
+                id=mouse.id,
+                father_id=mouse.father_id,
+                mother_id=mouse.mother_id,
+                x=x,
+                y=y,
+                box_w=self.BOX_W,
+                box_h=self.BOX_H,
+                tree_url=tree_url(mouse.id),
+                strain=escape(f"{mouse.strain_name} {mouse.tube_number}"),
+                box_text=escape(f"Box: {mouse.box_number or '-'}"),
+                earmark_text=escape(f"Earmark: {mouse.earmark or '-'}"),
+                detail_url=detail_url(mouse.id),
+                link_x=self.BOX_W - 8,
+                link_y=self.BOX_H - 10,
+            )
 
-    for mouse in all_nodes:
-        if mouse not in ranks:
-            ranks[mouse] = 0
+        yield render_to_string(
+            "mouseapp/family_tree_tail.svg",
+            {"box_w": self.BOX_W, "box_h": self.BOX_H},
+            using="jinja2",
+        )
 
-    for _ in range(len(all_nodes)):
-        changed = False
 
-        for mouse in all_nodes:
-            children = [child for child in get_children(mouse) if child in ranks]
+def _url_for_id(viewname: str) -> Callable[[int], str]:
+    """Reverse `viewname` once and return a cheap formatter for any object id."""
+    placeholder = 2_147_483_647
+    prefix, suffix = reverse(viewname, args=[placeholder]).split(str(placeholder))
+    return lambda object_id: f"{prefix}{object_id}{suffix}"
 
-            if children:
-                target_rank = min(ranks[child] for child in children) - 1
-                if ranks[mouse] < target_rank:
-                    ranks[mouse] = target_rank
-                    changed = True
 
-        if not changed:
-            break
+def get_descendant_graph(start_mouse, max_depth=DEFAULT_MAX_DEPTH, pedigree=None):
+    if pedigree is None:
+        pedigree = load_pedigree(start_mouse.id, max_depth)
+    ranks = assign_ranks(pedigree)
 
     layers = defaultdict(list)
-    for mouse, rank in ranks.items():
-        layers[rank].append(mouse)
+    for mouse_id, rank in ranks.items():
+        layers[rank].append(pedigree.nodes[mouse_id])
 
     return layers
 
 
-def layout_graph(renderer, start_mouse):
-    layers = get_descendant_graph(start_mouse)
-    sorted_ranks = sorted(layers.keys())
-    layer_orders = {rank: list(layers[rank]) for rank in sorted_ranks}
-
-    layer_ids = {mouse.id for rank in sorted_ranks for mouse in layer_orders[rank]}
-
-    def get_parent_ids(mouse):
-        parent_ids = []
-        if mouse.father:
-            parent_ids.append(mouse.father.id)
-        if mouse.mother:
-            parent_ids.append(mouse.mother.id)
-        return parent_ids
-
-    def get_child_ids(mouse):
-        return [child.id for child in get_children(mouse) if child.id in layer_ids]
-
-    def normalize_parent_order(mouse):
-        if mouse.father_id and mouse.mother_id:
-            return (mouse.father_id, mouse.mother_id)
-        return (mouse.father_id or 0, mouse.mother_id or 0)
-
-    def parent_pair_key(mouse):
-        father_id = mouse.father_id or 0
-        mother_id = mouse.mother_id or 0
-        if father_id and mother_id:
-            return (min(father_id, mother_id), max(father_id, mother_id))
-        return (father_id, mother_id)
-
-    def sibling_group_key(mouse):
-        return normalize_parent_order(mouse)
-
-    def barycenter_from_ids(related_ids, reference_positions, fallback):
-        xs = [
-            reference_positions[related_id]
-            for related_id in related_ids
-            if related_id in reference_positions
-        ]
-        if xs:
-            return sum(xs) / len(xs)
-        return fallback
-
-    def build_rank_to_x(current_layer_orders):
-        return {
-            rank: {
-                mouse.id: index
-                for index, mouse in enumerate(current_layer_orders[rank])
-            }
-            for rank in sorted_ranks
-        }
-
-    def forward_barycenter_pass():
-        rank_to_x = build_rank_to_x(layer_orders)
-
-        for rank in sorted_ranks:
-            parent_reference = rank_to_x.get(rank - 1, {})
-            current_order = layer_orders[rank]
-            decorated = []
-
-            for index, mouse in enumerate(current_order):
-                bary = barycenter_from_ids(
-                    get_parent_ids(mouse),
-                    parent_reference,
-                    index,
-                )
-                decorated.append(
-                    (
-                        sibling_group_key(mouse),
-                        bary,
-                        mouse.sex,
-                        mouse.id,
-                        mouse,
-                    )
-                )
-
-            decorated.sort(key=lambda item: item[:-1])
-            layer_orders[rank] = [item[-1] for item in decorated]
-
-    def backward_barycenter_pass():
-        rank_to_x = build_rank_to_x(layer_orders)
-
-        for rank in reversed(sorted_ranks):
-            child_reference = rank_to_x.get(rank + 1, {})
-            current_order = layer_orders[rank]
-            decorated = []
-
-            for index, mouse in enumerate(current_order):
-                bary = barycenter_from_ids(
-                    get_child_ids(mouse),
-                    child_reference,
-                    index,
-                )
-                decorated.append(
-                    (
-                        bary,
-                        parent_pair_key(mouse),
-                        mouse.id,
-                        mouse,
-                    )
-                )
-
-            decorated.sort(key=lambda item: item[:-1])
-            layer_orders[rank] = [item[-1] for item in decorated]
-
-    for _ in range(4):
-        forward_barycenter_pass()
-        backward_barycenter_pass()
+def layout_graph(renderer, start_mouse, max_depth=DEFAULT_MAX_DEPTH):
+    pedigree = load_pedigree(start_mouse.id, max_depth)
+    layout = compute_layout(
+        pedigree,
+        assign_ranks(pedigree),
+        box_w=renderer.BOX_W,
+        box_h=renderer.BOX_H,
+        gap_x=renderer.GAP_X,
+        gap_y=renderer.GAP_Y,
+    )
 
+    ids = layout.ids.tolist()
+    xs = layout.x.tolist()
+    ys = layout.y.tolist()
     positions = {}
-    current_y = 0
-
-    for rank in sorted_ranks:
-        ordered_mice = layer_orders[rank]
-
-        row_width = (
-            len(ordered_mice) * renderer.BOX_W
-            + (len(ordered_mice) - 1) * renderer.GAP_X
-        )
-        start_x = -(row_width / 2)
-
-        nominal_centers = {}
-        current_x = start_x
-        for mouse in ordered_mice:
-            nominal_centers[mouse.id] = current_x + (renderer.BOX_W / 2)
-            current_x += renderer.BOX_W + renderer.GAP_X
-
-        adjusted_centers = {}
-        for mouse in ordered_mice:
-            target_center = nominal_centers[mouse.id]
-
-            if mouse.father and mouse.mother:
-                father_pos = positions.get(mouse.father.id)
-                mother_pos = positions.get(mouse.mother.id)
-
-                if father_pos and mother_pos:
-                    target_center = (father_pos["top_x"] + mother_pos["top_x"]) / 2
-
-            adjusted_centers[mouse.id] = target_center
-
-        min_gap = renderer.BOX_W + renderer.GAP_X
-        final_centers = {}
-        previous_center = None
-
-        for mouse in ordered_mice:
-            center = adjusted_centers[mouse.id]
-            if previous_center is not None and center < previous_center + min_gap:
-                center = previous_center + min_gap
-
-            final_centers[mouse.id] = center
-            previous_center = center
-
-        if final_centers:
-            centers = [final_centers[mouse.id] for mouse in ordered_mice]
-            current_mid = (centers[0] + centers[-1]) / 2
-            shift = -current_mid
-        else:
-            shift = 0
-
-        for mouse in ordered_mice:
-            center_x = final_centers[mouse.id] + shift
-            x = center_x - (renderer.BOX_W / 2)
 
+    for layer in layout.layers:
+        for index in layer.tolist():
+            mouse = pedigree.nodes[ids[index]]
             renderer.draw_mouse(
                 mouse,
-                x,
-                current_y,
+                xs[index],
+                ys[index],
                 is_focus=(mouse.id == start_mouse.id),
             )
-
+            center_x = xs[index] + (renderer.BOX_W / 2)
             positions[mouse.id] = {
                 "top_x": center_x,
-                "top_y": current_y,
+                "top_y": ys[index],
                 "bottom_x": center_x,
-                "bottom_y": current_y + renderer.BOX_H,
+                "bottom_y": ys[index] + renderer.BOX_H,
             }
 
-        current_y += renderer.BOX_H + renderer.GAP_Y
-
-    for rank in sorted_ranks:
-        for mouse in layer_orders[rank]:
+    for layer in layout.layers:
+        for index in layer.tolist():
+            mouse = pedigree.nodes[ids[index]]
             child_pos = positions[mouse.id]
 
-            if mouse.father and mouse.father.id in positions:
-                father_pos = positions[mouse.father.id]
-                renderer.draw_line(
-                    father_pos["bottom_x"],
-                    father_pos["bottom_y"],
-                    child_pos["top_x"],
-                    child_pos["top_y"],
-                    child_id=mouse.id,
-                )
-
-            if mouse.mother and mouse.mother.id in positions:
-                mother_pos = positions[mouse.mother.id]
-                renderer.draw_line(
-                    mother_pos["bottom_x"],
-                    mother_pos["bottom_y"],
-                    child_pos["top_x"],
-                    child_pos["top_y"],
-                    child_id=mouse.id,
-                )
+            for parent_id in (mouse.father_id, mouse.mother_id):
+                if parent_id in positions:
+                    parent_pos = positions[parent_id]
+                    renderer.draw_line(
+                        parent_pos["bottom_x"],
+                        parent_pos["bottom_y"],
+                        child_pos["top_x"],
+                        child_pos["top_y"],
+                        child_id=mouse.id,
+                    )
 
 
 @login_required
@@ -873,7 +720,55 @@ def family_tree(request: HttpRequest, mouse: int) -> HttpResponse:
 
 @login_required
 @xframe_options_exempt
-def family_tree_svg(request: HttpRequest, mouse: int) -> HttpResponse:
+def family_tree_svg(request: HttpRequest, mouse: int) -> HttpResponseBase:
+    center_mouse = get_object_or_404(Mouse, id=mouse)
+
+    user: User = request.user  # type: ignore
+
+    if not center_mouse.has_read_access(user):
+        raise PermissionDenied()
+
+    depth = DEFAULT_MAX_DEPTH
+    theme = "dark" if request.GET.get("theme") == "dark" else "light"
+    stamp = tree_cache.current_stamp(center_mouse.id)
+    etag = stamp.etag(depth, theme)
+    last_modified = int(stamp.modified.timestamp())
+
+    response: HttpResponseBase | None = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        chunks = tree_cache.get_svg(stamp, depth, theme)
+        if chunks is None:
+            renderer = GraphSVGRenderer()
+            layout_graph(renderer, center_mouse, depth)
+            chunks = tree_cache.store_svg_chunks(
+                stamp, depth, theme, renderer.stream_svg(dark=theme == "dark")
+            )
+        response = StreamingHttpResponse(chunks, content_type="image/svg+xml")
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # Browsers may keep the SVG, but must revalidate it before each use.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+# Generations fetched above and below the focus mouse when not given.
+TREE_WINDOW = 2
+
+
+@login_required
+def family_tree_json(request: HttpRequest, mouse: int) -> JsonResponse:
+    """
+    Nodes, edges and positions for a window of generations around a mouse.
+
+    `up` and `down` bound the window in generations of ancestors and
+    descendants; the `cursors` in the response are the URLs that widen the
+    window by `TREE_WINDOW` generations, or null when nothing lies beyond it.
+    Positions are sliced from the strain's layout snapshot when a fresh one
+    holds the whole window, and laid out on the fly otherwise.
+    """
     center_mouse = get_object_or_404(Mouse, id=mouse)
 
     user: User = request.user  # type: ignore
@@ -881,13 +776,106 @@ def family_tree_svg(request: HttpRequest, mouse: int) -> HttpResponse:
     if not center_mouse.has_read_access(user):
         raise PermissionDenied()
 
-    renderer = GraphSVGRenderer()
-    layout_graph(renderer, center_mouse)
+    try:
+        up = _window_param(request, "up")
+        down = _window_param(request, "down")
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    pedigree = load_window(center_mouse.id, up, down)
+    renderer = GraphSVGRenderer
+    positions = snapshot_positions(
+        center_mouse.project_id, center_mouse.strain_id, pedigree.nodes
+    )
+    if positions is None:
+        layout = compute_layout(
+            pedigree,
+            assign_ranks(pedigree),
+            box_w=renderer.BOX_W,
+            box_h=renderer.BOX_H,
+            gap_x=renderer.GAP_X,
+            gap_y=renderer.GAP_Y,
+        )
+        ids = layout.ids.tolist()
+        xs = layout.x.tolist()
+        ys = layout.y.tolist()
+        positions = {
+            ids[index]: SnapshotPosition(row, xs[index], ys[index])
+            for row, layer in enumerate(layout.layers)
+            for index in layer.tolist()
+        }
 
-    dark = request.GET.get("theme") == "dark"
-    svg_content = renderer.get_final_svg(dark=dark)
+    tree_url = _url_for_id("mouseapp:family_tree")
+    detail_url = _url_for_id("mouseapp:mouse")
+    nodes = []
+    edges = []
+    for mouse_id, position in sorted(
+        positions.items(), key=lambda item: (item[1].row, item[1].x)
+    ):
+        node = pedigree.nodes[mouse_id]
+        nodes.append(
+            {
+                "id": node.id,
+                "father_id": node.father_id,
+                "mother_id": node.mother_id,
+                "sex": node.sex,
+                "strain": node.strain_name,
+                "tube_number": node.tube_number,
+                "box": node.box_number,
+                "earmark": node.earmark,
+                "row": position.row,
+                "x": position.x,
+                "y": position.y,
+                "tree_url": tree_url(node.id),
+                "detail_url": detail_url(node.id),
+            }
+        )
+        edges.extend(
+            {"parent": parent_id, "child": node.id}
+            for parent_id in node.parent_ids
+            if parent_id in pedigree.nodes
+        )
+
+    more_up, more_down = generations_beyond(center_mouse.id, up, down)
+    window_url = reverse("mouseapp:family_tree_json", args=[center_mouse.id])
+
+    def cursor(more: bool, up: int, down: int) -> str | None:
+        return f"{window_url}?up={up}&down={down}" if more else None
 
-    return HttpResponse(svg_content, content_type="image/svg+xml")
+    return JsonResponse(
+        {
+            "focus": center_mouse.id,
+            "window": {"up": up, "down": down},
+            "box": {"width": renderer.BOX_W, "height": renderer.BOX_H},
+            "nodes": nodes,
+            "edges": edges,
+            "cursors": {
+                "up": cursor(
+                    more_up and up < DEFAULT_MAX_DEPTH,
+                    min(up + TREE_WINDOW, DEFAULT_MAX_DEPTH),
+                    down,
+                ),
+                "down": cursor(
+                    more_down and down < DEFAULT_MAX_DEPTH,
+                    up,
+                    min(down + TREE_WINDOW, DEFAULT_MAX_DEPTH),
+                ),
+            },
+        }
+    )
+
+
+def _window_param(request: HttpRequest, name: str) -> int:
+    raw = request.GET.get(name)
+    if raw is None or raw == "":
+        return TREE_WINDOW
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"'{name}' must be a whole number of generations.")
+    if not 0 <= value <= DEFAULT_MAX_DEPTH:
+        raise ValueError(f"'{name}' must be between 0 and {DEFAULT_MAX_DEPTH}.")
+    return value
 
 
 def _prepare_request_form(
@@ -1289,6 +1277,11 @@ def request_detail(request: AuthedRequest, request_id: int) -> HttpResponse:
         "user_reactions_by_reply": user_reactions_by_reply,
         "quoted_reply": quoted_reply,
         "allowed_emojis": ReplyReaction.ALLOWED_EMOJIS,
+        "breeding_kinship": (
+            breeding_pair_kinship(request_obj.mouse, request_obj.partner)
+            if request_obj.kind == "B" and request_obj.mouse and request_obj.partner
+            else None
+        ),
     }
     return render(request, "mouseapp/request_detail.html", context)
 
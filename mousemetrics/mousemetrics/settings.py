@@ -125,6 +125,41 @@ else:
     }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Database-backed so that invalidations are seen by every gunicorn worker.
+# Each store has its own table and limit: culling one, e.g. to make room for
+# family tree SVG parts, never evicts a preview in the middle of the wizard.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "mousemetrics_cache",
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+    "family_tree": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "family_tree_cache",
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+    "import_previews": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "import_preview_cache",
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
+    "import_profiles": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "import_profile_cache",
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
+    "import_reports": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "import_report_cache",
+        "OPTIONS": {"MAX_ENTRIES": 200},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -213,9 +248,29 @@ SERVER_EMAIL = DEFAULT_FROM_EMAIL
 
 MICE_PAGE_SIZE = 50
 PREVIEW_ROW_LIMIT = 50
+DRY_RUN_PAGE_SIZE = 50
 
 # Simple Railway knob:
 TRAIN_ON_SAVE = (
     os.getenv("MOUSE_IMPORT_TRAIN_ON_SAVE", "true") == "true"
 )  # bool conversion
 TRAIN_MIN_NEW = int(os.getenv("MOUSE_IMPORT_TRAIN_MIN_NEW", "10"))
+# The mapping model is trained on at most this many distinct examples of
+# each field, sampled evenly from all of them.
+TRAIN_MAX_PER_FIELD = int(os.getenv("MOUSE_IMPORT_TRAIN_MAX_PER_FIELD", "1000"))
+# When set, the model is refit on the examples from this many days back once
+# its last refit is that old, so older examples stop counting.
+TRAIN_MAX_AGE_DAYS = (
+    int(os.environ["MOUSE_IMPORT_TRAIN_MAX_AGE_DAYS"])
+    if os.getenv("MOUSE_IMPORT_TRAIN_MAX_AGE_DAYS")
+    else None
+)
+
+# Threads per web process that run import commits in the background.
+IMPORT_WORKER_THREADS = int(os.getenv("MOUSE_IMPORT_WORKER_THREADS", "2"))
+# Processes that parse the files of a batch upload side by side.
+IMPORT_PARSE_PROCESSES = int(os.getenv("MOUSE_IMPORT_PARSE_PROCESSES", "4"))
+
+# Directory for a memory-mapped copy of the trained mapping model, shared by
+# the processes on one machine. Unset: each process unpickles it in memory.
+MAPPING_MODEL_MMAP_DIR = os.getenv("MOUSE_IMPORT_MODEL_MMAP_DIR") or None
@@ -3,6 +3,7 @@ set -eux
 
 cd mousemetrics
 python manage.py migrate
+python manage.py createcachetable
 python manage.py collectstatic --clear --no-input &>/dev/null
 
 if [ -n "${MOUSEMETRICS_ROOT_PASSWORD-}" ]; then
@@ -20,4 +21,7 @@ if [ -n "${MOUSEMETRICS_LOAD_EXAMPLE_DATA-}" ]; then
   python manage.py loaddata mice
 fi
 
+# Rebuilds stale family tree layout snapshots in the background.
+python manage.py build_layout_snapshots --interval 60 &
+
 gunicorn mousemetrics.wsgi:application